@@ -0,0 +1,288 @@
+"""
+client.py
+==========
+
+排行榜服务的客户端，供GameView和自我对局工具使用。
+
+- 客户端在自己的后台线程中运行一个asyncio事件循环，submit只把成绩放进队列就立即返回，调用方（例如Qt的界面线程）不会因为网络阻塞；
+- 成绩按batch_size条或者每flush_interval秒合并为一个submit请求，自我对局每秒产生的成千上万条结果只需要很少的请求；
+- 最多保持pool_size个连接，连接在请求之间复用，每个连接同时只有一个请求在途，连接出错时重新连接并重试一次；
+- 服务不可用时丢弃成绩并计入failed，不影响游戏本身。
+
+命令行用法：python -m Leaderboard.client --top 10
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import getpass
+import json
+import threading
+import time
+from collections import deque
+
+from Leaderboard.server import DEFAULT_HOST, DEFAULT_PORT, LINE_LIMIT
+
+
+def default_player():
+    """
+    默认的玩家名，使用当前系统用户名
+    :return: str 玩家名
+    """
+    try:
+        return getpass.getuser()[:64] or "player"
+    except (KeyError, OSError):
+        return "player"
+
+
+def parse_address(address):
+    """
+    解析"主机:端口"形式的地址
+    :param address: str 地址，可以省略主机或端口
+    :return: (str, int) 主机和端口
+    """
+    host, _, port = address.rpartition(":")
+    if not _:
+        return address or DEFAULT_HOST, DEFAULT_PORT
+    return host or DEFAULT_HOST, int(port) if port else DEFAULT_PORT
+
+
+def game_record(model, player=None):
+    """
+    把Model当前的对局整理为一条成绩
+    :param model: Model 游戏模型
+    :param player: str 玩家名，默认为当前系统用户名
+    :return: dict 成绩
+    """
+    return {
+        "player": player or default_player(),
+        "score": model.score,
+        "max_tile": max(max(row) for row in model.grid),
+        "moves": model.moves,
+        "grid_size": model.grid_size,
+        "seed": model.seed,
+        "created_at": time.time(),
+    }
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, payload, timeout):
+        self.writer.write(json.dumps(payload).encode() + b"\n")
+        await self.writer.drain()
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError("排行榜服务关闭了连接")
+        return json.loads(line)
+
+    def close(self):
+        self.writer.close()
+
+
+class LeaderboardClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=2, batch_size=500, flush_interval=0.05,
+                 timeout=5.0):
+        """
+        :param host: str 服务地址
+        :param port: int 服务端口
+        :param pool_size: int 最多同时使用的连接数
+        :param batch_size: int 每个submit请求最多包含的成绩条数
+        :param flush_interval: float 成绩在队列中最多等待的秒数
+        :param timeout: float 连接和等待响应的超时时间（秒）
+        """
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.submitted = 0  # 服务端确认写入的条数
+        self.failed = 0  # 因为服务不可用而丢弃的条数
+        self._pending = deque()  # 等待发送的成绩，任何线程都可以追加
+        self._lock = threading.Lock()
+        self._flush_scheduled = False  # 事件循环中是否已经安排了发送
+        self._in_flight = set()  # 正在发送的任务
+        self._loop = asyncio.new_event_loop()
+        self._pool = None  # 空闲连接队列，None表示还没有建立的连接
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="LeaderboardClient", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._pool = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self._pool.put_nowait(None)
+        ready.set()
+        self._loop.run_forever()
+
+    # ---- 以下方法可以在任何线程中调用 ----
+
+    def submit(self, record):
+        """
+        提交一条成绩，只放进队列，立即返回
+        :param record: dict 成绩，见game_record
+        :return:
+        """
+        with self._lock:
+            self._pending.append(record)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._loop.call_soon_threadsafe(self._schedule_flush)
+
+    def top(self, limit=10, grid_size=4, since=None):
+        """
+        查询排行榜
+        :param limit: int 条数
+        :param grid_size: int 网格大小
+        :param since: float 只查询这个时间之后的成绩
+        :return: concurrent.futures.Future 结果为成绩列表
+        """
+        payload = {"op": "top", "limit": limit, "grid_size": grid_size}
+        if since is not None:
+            payload["since"] = since
+        return asyncio.run_coroutine_threadsafe(self._top(payload), self._loop)
+
+    def flush(self, timeout=None):
+        """
+        等待队列中的成绩全部发送完
+        :param timeout: float 最多等待的秒数，为None时一直等待
+        :return: bool 是否在超时之前发送完
+        """
+        future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        try:
+            future.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return False
+
+    def close(self, timeout=1.0):
+        """
+        最多等待timeout秒把剩余的成绩发送完，然后关闭连接和后台线程
+        :param timeout: float 最多等待的秒数
+        :return: bool 剩余的成绩是否都已发送
+        """
+        if not self._thread.is_alive():
+            return True
+        done = self.flush(timeout)
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout)
+        except concurrent.futures.TimeoutError:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        return done
+
+    # ---- 以下方法只在事件循环线程中运行 ----
+
+    def _schedule_flush(self):
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        else:
+            self._loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        """
+        把队列中的成绩按batch_size分批，每批一个发送任务
+        """
+        with self._lock:
+            self._flush_scheduled = False
+            batches = []
+            while self._pending:
+                count = min(self.batch_size, len(self._pending))
+                batches.append([self._pending.popleft() for _ in range(count)])
+        for batch in batches:
+            task = self._loop.create_task(self._send(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch):
+        try:
+            response = await self._request({"op": "submit", "scores": batch})
+        except (OSError, ValueError, asyncio.TimeoutError):
+            self.failed += len(batch)
+            return
+        if response.get("ok"):
+            self.submitted += response.get("count", len(batch))
+        else:
+            self.failed += len(batch)
+
+    async def _top(self, payload):
+        response = await self._request(payload)
+        if not response.get("ok"):
+            raise ValueError(response.get("error"))
+        return response["scores"]
+
+    async def _request(self, payload):
+        """
+        从连接池取一个连接发送请求，连接出错时重新连接并重试一次
+        """
+        connection = await self._pool.get()
+        try:
+            for attempt in range(2):
+                try:
+                    if connection is None:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT), self.timeout)
+                        connection = _Connection(reader, writer)
+                    return await connection.request(payload, self.timeout)
+                except (OSError, asyncio.TimeoutError):
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                    if attempt:
+                        raise
+        finally:
+            self._pool.put_nowait(connection)
+
+    async def _drain(self):
+        while self._pending or self._in_flight:
+            self._flush()
+            if self._in_flight:
+                await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+
+    async def _shutdown(self):
+        """
+        取消还没有完成的发送，关闭所有连接
+        """
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+        while not self._pool.empty():
+            connection = self._pool.get_nowait()
+            if connection is not None:
+                connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2048排行榜客户端")
+    parser.add_argument("--server", default=f"{DEFAULT_HOST}:{DEFAULT_PORT}", help="排行榜服务地址，主机:端口")
+    parser.add_argument("--top", type=int, default=10, help="显示前几名")
+    parser.add_argument("--grid-size", type=int, default=4, help="网格大小")
+    args = parser.parse_args()
+    client = LeaderboardClient(*parse_address(args.server))
+    try:
+        scores = client.top(args.top, args.grid_size).result(client.timeout * 2)
+    except (OSError, ValueError, asyncio.TimeoutError) as e:
+        print(f"无法连接排行榜服务：{e}")
+        return 1
+    finally:
+        client.close()
+    for rank, record in enumerate(scores, start=1):
+        date = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["created_at"]))
+        print(f"{rank:3d}. {record['player']:<16s} {record['score']:8d}  最大数字 {record['max_tile']:6d}  {date}")
+    return 0
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    raise SystemExit(main())
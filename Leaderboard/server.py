@@ -0,0 +1,291 @@
+"""
+server.py
+==========
+
+本地排行榜服务，基于asyncio和SQLite。
+
+- 协议：TCP上按行传输的JSON，每个请求一行，每个响应一行，同一个连接上可以连续发送多个请求；
+- submit请求一次可以提交多条成绩，所有连接提交的成绩由一个写入任务合并成批，在一个事务中写入数据库；
+- 同一个玩家、同样网格大小、同样种子的成绩视为同一局游戏，只保留最高分，重复提交不会产生重复记录；
+- 数据库访问都在单独的线程中进行，不阻塞事件循环；
+- scores表按(网格大小, 分数)和提交时间建立索引，top请求可以按网格大小和时间范围查询排名。
+
+请求格式：
+    {"op": "submit", "scores": [{"player": "...", "score": 0, "max_tile": 0, "moves": 0, "grid_size": 4, "seed": 0}]}
+    {"op": "top", "limit": 10, "grid_size": 4, "since": 时间戳（可选）}
+    {"op": "ping"}
+响应格式：{"ok": true, ...} 或 {"ok": false, "error": "..."}
+
+命令行用法：python -m Leaderboard.server --db ./2048_leaderboard.db --port 20480
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 20480
+LINE_LIMIT = 1 << 22  # 单个请求（一行）的最大字节数
+SQLITE_INT_MIN = -(1 << 63)  # SQLite INTEGER是有符号64位整数，超出范围的值无法写入
+SQLITE_INT_MAX = (1 << 63) - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    max_tile INTEGER NOT NULL,
+    moves INTEGER NOT NULL,
+    grid_size INTEGER NOT NULL,
+    seed INTEGER,
+    created_at REAL NOT NULL,
+    UNIQUE (player, grid_size, seed)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_rank ON scores (grid_size, score DESC);
+CREATE INDEX IF NOT EXISTS idx_scores_date ON scores (created_at);
+"""
+
+# 同一局游戏（玩家、网格大小、种子都相同）重复提交时只保留最高分
+UPSERT = """
+INSERT INTO scores (player, score, max_tile, moves, grid_size, seed, created_at)
+VALUES (:player, :score, :max_tile, :moves, :grid_size, :seed, :created_at)
+ON CONFLICT (player, grid_size, seed) DO UPDATE SET
+    score = excluded.score, max_tile = excluded.max_tile, moves = excluded.moves, created_at = excluded.created_at
+WHERE excluded.score > scores.score
+"""
+
+FIELDS = ("player", "score", "max_tile", "moves", "grid_size", "seed", "created_at")
+
+
+def validate_record(record, now):
+    """
+    检查并规范化一条成绩
+    :param record: dict 客户端提交的成绩
+    :param now: float 服务端收到成绩的时间，客户端没有提供created_at时使用
+    :return: dict 规范化后的成绩
+    """
+    if not isinstance(record, dict):
+        raise ValueError("成绩必须是JSON对象")
+    player = record.get("player")
+    if not isinstance(player, str) or not 0 < len(player) <= 64:
+        raise ValueError("player必须是1~64个字符的字符串")
+    result = {"player": player, "seed": record.get("seed"), "created_at": record.get("created_at", now)}
+    for field in ("score", "max_tile", "moves", "grid_size"):
+        value = record.get(field, 0)
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= SQLITE_INT_MAX:
+            raise ValueError(f"{field}必须是不超过2^63-1的非负整数")
+        result[field] = value
+    seed = result["seed"]
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)
+                             or not SQLITE_INT_MIN <= seed <= SQLITE_INT_MAX):
+        raise ValueError("seed必须是64位有符号整数或null")
+    created_at = result["created_at"]
+    if (not isinstance(created_at, (int, float)) or isinstance(created_at, bool)
+            or isinstance(created_at, int) and not SQLITE_INT_MIN <= created_at <= SQLITE_INT_MAX):
+        raise ValueError("created_at必须是时间戳")
+    return result
+
+
+class ScoreStore:
+    """
+    SQLite成绩库，所有方法都只在同一个线程中调用
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    def open(self):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def insert_many(self, records):
+        """
+        在一个事务中写入一批成绩
+        :param records: list 规范化后的成绩
+        :return: int 写入的条数
+        """
+        with self.connection:
+            self.connection.executemany(UPSERT, records)
+        return len(records)
+
+    def top(self, limit, grid_size, since=None):
+        """
+        查询分数最高的成绩
+        :param limit: int 最多返回的条数
+        :param grid_size: int 网格大小
+        :param since: float 只查询这个时间之后的成绩，为None时不限制
+        :return: list 成绩列表，按分数从高到低排列
+        """
+        sql = "SELECT player, score, max_tile, moves, grid_size, seed, created_at FROM scores WHERE grid_size = ?"
+        params = [grid_size]
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        sql += " ORDER BY score DESC LIMIT ?"
+        params.append(limit)
+        return [dict(zip(FIELDS, row)) for row in self.connection.execute(sql, params)]
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class LeaderboardServer:
+    def __init__(self, path="./2048_leaderboard.db", host=DEFAULT_HOST, port=DEFAULT_PORT, batch_size=2000):
+        """
+        :param path: str 数据库文件路径
+        :param host: str 监听地址
+        :param port: int 监听端口，为0时由系统分配，实际端口在start之后保存在port中
+        :param batch_size: int 一次事务最多写入的成绩条数
+        """
+        self.store = ScoreStore(path)
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LeaderboardDB")  # 只有一个数据库线程
+        self.server = None
+        self.write_queue = None  # (成绩列表, Future)
+        self.writer_task = None
+        self.stats = {"submitted": 0, "transactions": 0, "requests": 0}
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def start(self):
+        """
+        打开数据库并开始监听
+        :return:
+        """
+        await self._run_db(self.store.open)
+        self.write_queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._write_loop())
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=LINE_LIMIT)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """
+        停止监听，写完队列中的成绩后关闭数据库
+        :return:
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.writer_task is not None:
+            await self.write_queue.join()
+            self.writer_task.cancel()
+        await self._run_db(self.store.close)
+        self.executor.shutdown()
+
+    async def _write_loop(self):
+        """
+        写入任务：把等待中的所有提交合并为一个事务，提交越密集，每个事务包含的成绩越多
+        一批成绩写入失败（包括sqlite3.Error以外的任何异常）时只让这一批的提交失败，写入任务继续运行
+        :return:
+        """
+        while True:
+            items = [await self.write_queue.get()]
+            count = len(items[0][0])
+            while count < self.batch_size and not self.write_queue.empty():
+                item = self.write_queue.get_nowait()
+                items.append(item)
+                count += len(item[0])
+            records = [record for batch, _ in items for record in batch]
+            try:
+                await self._run_db(self.store.insert_many, records)
+                self.stats["transactions"] += 1
+                self.stats["submitted"] += len(records)
+                for batch, future in items:
+                    if not future.done():
+                        future.set_result(len(batch))
+            except Exception as e:
+                # 统一转换为sqlite3.Error，_dispatch会把它作为错误响应返回给客户端
+                error = e if isinstance(e, sqlite3.Error) else sqlite3.DatabaseError(f"写入成绩失败：{e}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in items:
+                    self.write_queue.task_done()
+
+    async def _handle_client(self, reader, writer):
+        """
+        处理一个客户端连接上的所有请求
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._dispatch(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line):
+        """
+        解析并执行一个请求
+        :param line: bytes 请求行
+        :return: dict 响应
+        """
+        self.stats["requests"] += 1
+        try:
+            request = json.loads(line)
+            op = request.get("op")
+            if op == "submit":
+                now = time.time()
+                records = [validate_record(record, now) for record in request.get("scores", [])]
+                if records:
+                    future = asyncio.get_running_loop().create_future()
+                    await self.write_queue.put((records, future))
+                    await future
+                return {"ok": True, "count": len(records)}
+            if op == "top":
+                limit = min(int(request.get("limit", 10)), 1000)
+                scores = await self._run_db(self.store.top, limit, int(request.get("grid_size", 4)),
+                                            request.get("since"))
+                return {"ok": True, "scores": scores}
+            if op == "ping":
+                return {"ok": True}
+            return {"ok": False, "error": f"未知的请求：{op}"}
+        except (ValueError, TypeError, AttributeError, sqlite3.Error) as e:
+            return {"ok": False, "error": str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2048本地排行榜服务")
+    parser.add_argument("--db", default="./2048_leaderboard.db", help="数据库文件路径")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    args = parser.parse_args()
+    server = LeaderboardServer(args.db, args.host, args.port)
+    print(f"排行榜服务监听 {args.host}:{args.port}，数据库 {args.db}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    main()
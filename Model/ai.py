@@ -0,0 +1,285 @@
+"""
+ai.py
+==========
+
+2048的期望最大（expectimax）搜索AI，基于bitboard模块的位棋盘实现。
+
+- 玩家节点在四个方向中取期望得分最大的移动；
+- 随机节点按add_random_number的分布展开：每个空格等概率，2的概率为0.9，4的概率为0.1；
+- 置换表以位棋盘为键缓存随机节点的估值，同一局面在不同路径上只计算一次；启发式估值在旋转和翻转下不变，
+  symmetric_cache=True时以symmetry模块的规范形式为键，对称的局面也共用一项（命中率略高，但每次查询多一次规范化，默认关闭）；
+- 路径概率低于阈值的分支直接使用启发式估值（概率剪枝）；
+- 搜索深度根据棋盘上不同数字的个数自动调整，局面越复杂搜索越深。
+
+启发式估值为每一行（列）的空格数、可合并数、单调性和数字大小的加权和，同样为65536种行状态预先计算。
+
+Searcher.best_move既可以传入Model（或BitboardModel）也可以直接传入位棋盘，因此GameView和无界面的脚本都可以调用，
+每次搜索后的节点数、每秒节点数和置换表命中率保存在Searcher.last_stats中。
+在其他线程中把Searcher.stopped设为True可以让正在进行的搜索尽快抛出SearchCancelled，用于取消过时的后台搜索。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import time
+
+from Model.bitboard import ROW_MASK, encode_grid, execute_move, transpose, count_empty
+from Model.model import DIRECTIONS
+from Model.symmetry import canonical_board
+
+# 启发式估值的权重
+SCORE_LOST_PENALTY = 200000.0
+SCORE_MONOTONICITY_POWER = 4.0
+SCORE_MONOTONICITY_WEIGHT = 47.0
+SCORE_SUM_POWER = 3.5
+SCORE_SUM_WEIGHT = 11.0
+SCORE_MERGES_WEIGHT = 700.0
+SCORE_EMPTY_WEIGHT = 270.0
+
+HEURISTIC_TABLE = [0.0] * 65536  # 每一种行状态的启发式估值
+
+
+def _init_heuristic_table():
+    """
+    预先计算所有行状态的启发式估值
+    :return:
+    """
+    for row in range(65536):
+        line = [(row >> 0) & 0xF, (row >> 4) & 0xF, (row >> 8) & 0xF, (row >> 12) & 0xF]
+        total = 0.0
+        empty = 0
+        merges = 0
+        prev = 0
+        counter = 0
+        for rank in line:
+            total += rank ** SCORE_SUM_POWER
+            if rank == 0:
+                empty += 1
+            else:
+                if prev == rank:
+                    counter += 1
+                elif counter > 0:
+                    merges += 1 + counter
+                    counter = 0
+                prev = rank
+        if counter > 0:
+            merges += 1 + counter
+
+        monotonicity_left = 0.0
+        monotonicity_right = 0.0
+        for i in range(1, 4):
+            if line[i - 1] > line[i]:
+                monotonicity_left += line[i - 1] ** SCORE_MONOTONICITY_POWER - line[i] ** SCORE_MONOTONICITY_POWER
+            else:
+                monotonicity_right += line[i] ** SCORE_MONOTONICITY_POWER - line[i - 1] ** SCORE_MONOTONICITY_POWER
+
+        HEURISTIC_TABLE[row] = (SCORE_LOST_PENALTY
+                                + SCORE_EMPTY_WEIGHT * empty
+                                + SCORE_MERGES_WEIGHT * merges
+                                - SCORE_MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right)
+                                - SCORE_SUM_WEIGHT * total)
+
+
+_init_heuristic_table()
+
+
+def heuristic(board):
+    """
+    位棋盘的启发式估值，为四行和四列估值之和
+    :param board: int 位棋盘
+    :return: float 估值
+    """
+    t = transpose(board)
+    table = HEURISTIC_TABLE
+    return (table[board & ROW_MASK] + table[(board >> 16) & ROW_MASK]
+            + table[(board >> 32) & ROW_MASK] + table[(board >> 48) & ROW_MASK]
+            + table[t & ROW_MASK] + table[(t >> 16) & ROW_MASK]
+            + table[(t >> 32) & ROW_MASK] + table[(t >> 48) & ROW_MASK])
+
+
+def count_distinct_tiles(board):
+    """
+    统计位棋盘上不同数字的个数
+    :param board: int 位棋盘
+    :return: int 个数
+    """
+    bitset = 0
+    while board:
+        bitset |= 1 << (board & 0xF)
+        board >>= 4
+    bitset >>= 1  # 不统计空格
+    count = 0
+    while bitset:
+        bitset &= bitset - 1
+        count += 1
+    return count
+
+
+def board_of(model):
+    """
+    获取Model当前局面的位棋盘
+    :param model: Model、BitboardModel或者位棋盘本身
+    :return: int 位棋盘
+    """
+    if isinstance(model, int):
+        return model
+    board = getattr(model, "board", None)
+    if board is not None:
+        return board
+    if model.grid_size != 4:
+        raise ValueError(f"AI只支持4x4的网格：{model.grid_size}")
+    return encode_grid(model.grid)
+
+
+class SearchCancelled(Exception):
+    """
+    搜索被Searcher.stopped取消
+    """
+
+
+class Searcher:
+    def __init__(self, prob_threshold=0.0001, min_depth=2, max_depth=3, cache_depth_limit=15, symmetric_cache=False):
+        self.prob_threshold = prob_threshold  # 路径概率低于该值时不再展开
+        self.min_depth = min_depth  # 最小搜索深度
+        self.max_depth = max_depth  # 最大搜索深度
+        self.cache_depth_limit = cache_depth_limit  # 超过该深度的节点不再查询置换表
+        self.symmetric_cache = symmetric_cache  # 为True时置换表以规范形式为键，对称的局面共用一项
+        self.transposition_table = {}  # 位棋盘 -> (深度, 估值)
+        self.depth_limit = min_depth  # 本次搜索的深度
+        self.nodes = 0  # 本次搜索展开的节点数
+        self.cache_lookups = 0  # 置换表查询次数
+        self.cache_hits = 0  # 置换表命中次数
+        self.last_stats = {}  # 上一次搜索的统计信息
+        self.stopped = False  # 为True时正在进行的搜索抛出SearchCancelled，由调用方在下一次搜索前清除
+
+    def choose_depth(self, board):
+        """
+        根据不同数字的个数选择搜索深度
+        :param board: int 位棋盘
+        :return: int 搜索深度
+        """
+        return max(self.min_depth, min(self.max_depth, count_distinct_tiles(board) - 2))
+
+    def score_moves(self, model):
+        """
+        计算四个方向的期望估值，无效移动不在结果中
+        :param model: Model、BitboardModel或者位棋盘
+        :return: dict 方向 -> 期望估值
+        """
+        board = board_of(model)
+        self.transposition_table = {}
+        self.depth_limit = self.choose_depth(board)
+        self.nodes = 0
+        self.cache_lookups = 0
+        self.cache_hits = 0
+        start = time.perf_counter()
+
+        scores = {}
+        for direction in DIRECTIONS:
+            new_board, score = execute_move(board, direction)
+            if new_board != board:
+                scores[direction] = self._score_chance_node(new_board, 1.0, 0) + score
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "depth": self.depth_limit,
+            "nodes": self.nodes,
+            "elapsed": elapsed,
+            "nodes_per_sec": self.nodes / elapsed if elapsed > 0 else 0.0,
+            "cache_lookups": self.cache_lookups,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": self.cache_hits / self.cache_lookups if self.cache_lookups else 0.0,
+        }
+        return scores
+
+    def best_move(self, model):
+        """
+        搜索当前局面的最佳移动方向
+        :param model: Model、BitboardModel或者位棋盘
+        :return: str 方向，"left"、"right"、"up"或"down"；没有可移动的方向时返回None
+        """
+        scores = self.score_moves(model)
+        if not scores:
+            return None
+        return max(scores, key=scores.get)
+
+    def _score_move_node(self, board, prob, depth):
+        """
+        玩家节点：取所有有效移动中估值最大的
+        """
+        best = 0.0
+        for direction in DIRECTIONS:
+            new_board, score = execute_move(board, direction)
+            self.nodes += 1
+            if new_board != board:
+                value = self._score_chance_node(new_board, prob, depth + 1) + score
+                if value > best:
+                    best = value
+        return best
+
+    def _score_chance_node(self, board, prob, depth):
+        """
+        随机节点：对所有空格和2/4两种数字求期望
+        """
+        if prob < self.prob_threshold or depth >= self.depth_limit:
+            return heuristic(board)
+        if depth <= 1 and self.stopped:
+            raise SearchCancelled()
+
+        key = board
+        if depth < self.cache_depth_limit:
+            if self.symmetric_cache:
+                key = canonical_board(board)
+            self.cache_lookups += 1
+            entry = self.transposition_table.get(key)
+            if entry is not None and entry[0] <= depth:
+                self.cache_hits += 1
+                return entry[1]
+
+        empty = count_empty(board)
+        prob /= empty
+        total = 0.0
+        tile = 1
+        temp = board
+        while tile < (1 << 64):
+            if not temp & 0xF:
+                total += self._score_move_node(board | tile, prob * 0.9, depth) * 0.9
+                total += self._score_move_node(board | (tile << 1), prob * 0.1, depth) * 0.1
+            temp >>= 4
+            tile <<= 4
+        total /= empty
+
+        if depth < self.cache_depth_limit:
+            self.transposition_table[key] = (depth, total)
+        return total
+
+
+_default_searcher = None
+
+
+def best_move(model):
+    """
+    使用默认参数的Searcher搜索最佳移动，方便脚本直接调用
+    :param model: Model、BitboardModel或者位棋盘
+    :return: str 方向；没有可移动的方向时返回None
+    """
+    global _default_searcher
+    if _default_searcher is None:
+        _default_searcher = Searcher()
+    return _default_searcher.best_move(model)
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    from Model.bitboard import BitboardModel
+
+    model = BitboardModel()
+    model.reset()
+    searcher = Searcher()
+    while not model.check_lost():
+        direction = searcher.best_move(model)
+        if direction is None:
+            break
+        getattr(model, "move_" + direction)()
+    print(model.grid)
+    print(model.score, searcher.last_stats)
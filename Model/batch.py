@@ -0,0 +1,215 @@
+"""
+batch.py
+==========
+
+基于NumPy的批量2048模拟，BatchModel在一个形状为(N, 4, 4)的数组中同时保存N个棋盘，
+四个方向的移动、添加随机数字、检查胜利和失败都对全部棋盘做一次向量化运算完成。
+
+棋盘数组中存放的是数字的指数（0表示空格，1表示2，2表示4……），移动时把每一行编码为16位下标，
+直接使用bitboard模块预先计算好的行移动表查表，因此合并规则与Model/BitboardModel逐位一致。
+
+- slide_boards: 对一批棋盘执行移动（不添加随机数字），返回新棋盘、得分和是否发生变化的掩码
+- BatchModel: 批量对局模型，接口命名与Model保持一致
+
+与Model的差异：移动和合并（包括得分）与Model逐位一致，但随机数字来自NumPy的Generator并且对全部棋盘一起抽取，
+因此同一个种子下BatchModel的对局与Model(种子)的对局不同，不能用来重现Model的某一局，只适合统计性质的批量模拟。
+直接运行本文件（python -m Model.batch）会在随机棋盘上检查四个方向的移动结果和得分与BitboardModel一致。
+
+依赖NumPy，只有使用本模块时才需要安装。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import numpy as np
+
+from Model.bitboard import ROW_LEFT_TABLE, SCORE_TABLE
+from Model.model import DIRECTIONS
+
+_ROWS = np.arange(65536, dtype=np.uint32)
+# 每一种行状态向左移动后的四个格子的指数，形状为(65536, 4)
+LEFT_CELLS = ((_ROWS ^ np.array(ROW_LEFT_TABLE, dtype=np.uint32))[:, None]
+              >> np.array([0, 4, 8, 12], dtype=np.uint32)) & 0xF
+LEFT_CELLS = LEFT_CELLS.astype(np.uint8)
+ROW_SCORES = np.array(SCORE_TABLE, dtype=np.int64)
+_ROW_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint32)
+
+
+def _orient(boards, direction):
+    """
+    把棋盘变换为"向左移动"的视图（只返回视图，不复制数据）
+    :param boards: np.ndarray (N, 4, 4)的指数数组
+    :param direction: str 移动方向
+    :return: np.ndarray 变换后的视图
+    """
+    if direction == "left":
+        return boards
+    if direction == "right":
+        return boards[:, :, ::-1]
+    if direction == "up":
+        return boards.transpose(0, 2, 1)
+    if direction == "down":
+        return boards.transpose(0, 2, 1)[:, :, ::-1]
+    raise ValueError(f"未知的移动方向: {direction}")
+
+
+def _restore(boards, direction):
+    """
+    _orient的逆变换
+    :param boards: np.ndarray (N, 4, 4)的指数数组
+    :param direction: str 移动方向
+    :return: np.ndarray 变换回原方向的视图
+    """
+    if direction == "left":
+        return boards
+    if direction == "right":
+        return boards[:, :, ::-1]
+    if direction == "up":
+        return boards.transpose(0, 2, 1)
+    return boards[:, :, ::-1].transpose(0, 2, 1)
+
+
+def slide_boards(boards, direction):
+    """
+    对一批棋盘执行一次移动，不添加随机数字
+    :param boards: np.ndarray (N, 4, 4)的uint8指数数组
+    :param direction: str 移动方向，"left"、"right"、"up"或"down"
+    :return: (np.ndarray, np.ndarray, np.ndarray) 新棋盘、每个棋盘的得分、每个棋盘是否发生了变化
+    """
+    view = _orient(boards, direction).astype(np.uint32)
+    rows = (view << _ROW_SHIFTS).sum(axis=2, dtype=np.uint32)  # (N, 4)，每一行的16位编码
+    moved = np.ascontiguousarray(_restore(LEFT_CELLS[rows], direction))
+    gained = ROW_SCORES[rows].sum(axis=1)
+    changed = (moved != boards).any(axis=(1, 2))
+    return moved, gained, changed
+
+
+class BatchModel:
+    def __init__(self, count, seed=None):
+        self.count = count  # 棋盘数量
+        self.grid_size = 4  # 网格的大小为4x4
+        self.rng = np.random.default_rng(seed)  # 随机数生成器，相同的种子得到相同的对局
+        self.boards = np.zeros((count, self.grid_size, self.grid_size), dtype=np.uint8)  # 所有棋盘的指数
+        self.scores = np.zeros(count, dtype=np.int64)  # 每个棋盘的当前得分
+        self.last_changed = np.zeros(count, dtype=bool)  # 上一次移动中发生了变化的棋盘，False表示无效移动
+        self.last_move_direction = None  # 上一次的移动方向
+
+    @property
+    def grids(self):
+        """
+        以数字（而不是指数）的形式返回所有棋盘
+        :return: np.ndarray (N, 4, 4)的int64数组
+        """
+        return np.where(self.boards > 0, np.left_shift(1, self.boards.astype(np.int64)), 0)
+
+    def load_grids(self, grids):
+        """
+        从Model.grid形式的二维列表（或数组）载入棋盘
+        :param grids: (N, 4, 4)的数字数组
+        :return:
+        """
+        grids = np.asarray(grids, dtype=np.int64)
+        exponents = np.zeros(grids.shape, dtype=np.uint8)
+        nonzero = grids > 0
+        exponents[nonzero] = np.log2(grids[nonzero]).astype(np.uint8)
+        self.boards = exponents
+        self.count = len(exponents)
+        self.scores = np.zeros(self.count, dtype=np.int64)
+        self.last_changed = np.zeros(self.count, dtype=bool)
+
+    def add_random_number(self, mask=None):
+        """
+        在每个棋盘的随机空格上添加一个数字（2的概率为0.9，4的概率为0.1）
+        :param mask: np.ndarray 可选的布尔掩码，只对为True的棋盘添加
+        :return:
+        """
+        flat = self.boards.reshape(self.count, -1)
+        empty = flat == 0
+        if mask is not None:
+            empty &= mask[:, None]
+        # 空格上取均匀随机数，其余为-1，取最大值的位置即在空格中等概率选择
+        keys = np.where(empty, self.rng.random(empty.shape), -1.0)
+        cells = keys.argmax(axis=1)
+        values = np.where(self.rng.random(self.count) < 0.9, 1, 2).astype(np.uint8)
+        rows = np.nonzero(empty.any(axis=1))[0]
+        flat[rows, cells[rows]] = values[rows]
+
+    def reset(self):
+        """
+        重置所有棋盘
+        :return:
+        """
+        self.boards[:] = 0
+        self.scores[:] = 0
+        self.last_changed[:] = False
+        self.last_move_direction = None
+        self.add_random_number()
+        self.add_random_number()
+
+    def move(self, direction):
+        """
+        所有棋盘向同一方向移动，只有发生变化的棋盘才会添加随机数字
+        :param direction: str 移动方向
+        :return: (np.ndarray, np.ndarray) 每个棋盘是否发生变化、每个棋盘本次的得分
+        """
+        self.boards, gained, changed = slide_boards(self.boards, direction)
+        self.scores += gained
+        self.add_random_number(changed)
+        self.last_changed = changed
+        self.last_move_direction = direction
+        return changed, gained
+
+    def move_left(self):
+        return self.move("left")
+
+    def move_right(self):
+        return self.move("right")
+
+    def move_up(self):
+        return self.move("up")
+
+    def move_down(self):
+        return self.move("down")
+
+    def check_win(self):
+        """
+        检查每个棋盘上是否已经出现2048
+        :return: np.ndarray 布尔数组
+        """
+        return (self.boards >= 11).any(axis=(1, 2))
+
+    def check_lost(self):
+        """
+        检查每个棋盘是否已经没有空格并且没有相邻的相同数字
+        :return: np.ndarray 布尔数组
+        """
+        boards = self.boards
+        has_empty = (boards == 0).any(axis=(1, 2))
+        row_pairs = (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2))
+        col_pairs = (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2))
+        return ~(has_empty | row_pairs | col_pairs)
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    from Model.bitboard import encode_grid, execute_move
+
+    # 移动和合并与位棋盘逐个比较
+    parity = BatchModel(20000, seed=1)
+    parity.boards = parity.rng.integers(0, 16, size=(parity.count, 4, 4), dtype=np.uint8)
+    parity.boards[parity.rng.random(parity.boards.shape) < 0.3] = 0
+    for direction in DIRECTIONS:
+        moved, gained, changed = slide_boards(parity.boards, direction)
+        expected_grids = np.where(moved > 0, np.left_shift(1, moved.astype(np.int64)), 0)
+        for index, grid in enumerate(parity.grids.tolist()):
+            board = encode_grid(grid)
+            new_board, score = execute_move(board, direction)
+            assert new_board == encode_grid(expected_grids[index].tolist()), (direction, grid)
+            assert score == gained[index] and (new_board != board) == changed[index], (direction, grid)
+    print(f"{parity.count}个随机棋盘的四个方向移动与BitboardModel一致")
+
+    batch = BatchModel(3, seed=2048)
+    batch.reset()
+    print(batch.grids)
+    print(batch.move_left())
+    print(batch.grids, batch.scores)
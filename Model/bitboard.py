@@ -0,0 +1,595 @@
+"""
+bitboard.py
+==========
+
+2048棋盘的位棋盘（bitboard）实现，用于大量模拟对局时替代列表版本的Model。
+
+整个4x4棋盘被压缩进一个64位整数：每个格子占4位，存放的是数字的指数（0表示空格，1表示2，2表示4……），
+格子(i, j)位于第 4 * (4 * i + j) 位开始的4位中，即每一行占16位，第0行在最低位。
+
+模块加载时为全部65536种行状态预先计算好四个方向的移动结果（以异或差值的形式存放）和对应的得分，
+一次移动只需要4次查表和异或，不再需要逐格遍历或者重建二维列表。
+
+- encode_grid / decode_board: 二维列表与位棋盘之间的互相转换
+- transpose: 位棋盘转置（行列互换）
+- execute_move: 在位棋盘上执行一次移动，返回新的棋盘和本次得分
+- BitboardModel: 基于位棋盘的Model子类，对外接口与Model完全一致，max_tile和mergeable_pairs由位棋盘直接计算
+
+每个格子只有4位，能表示的最大数字是2^15=32768，两个32768相遇时不再合并（Model中会合并为65536），
+所以只有出现两个32768之后两种Model的局面才会不同，正常对局几乎不可能到达。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+from Model.model import Model, MoveResult
+
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+MAX_EXPONENT = 15  # 4位最多表示到2^15=32768，两个32768不再合并
+
+# 预计算表，下标为一行（或一列）的16位编码
+ROW_LEFT_TABLE = [0] * 65536  # 向左移动后与原行的异或差值
+ROW_RIGHT_TABLE = [0] * 65536  # 向右移动后与原行的异或差值
+COL_UP_TABLE = [0] * 65536  # 向上移动后与原列的异或差值（已展开到列的位置）
+COL_DOWN_TABLE = [0] * 65536  # 向下移动后与原列的异或差值（已展开到列的位置）
+SCORE_TABLE = [0] * 65536  # 一行移动得到的分数，左右（上下）方向合并的数对相同，所以得分相同
+PAIR_TABLE = [0] * 65536  # 一行中数字相同的相邻非空格子对数
+
+
+def _reverse_row(row):
+    """
+    翻转一行的四个格子
+    :param row: int 16位行编码
+    :return: int 翻转后的行编码
+    """
+    return ((row >> 12) | ((row >> 4) & 0x00F0) | ((row << 4) & 0x0F00) | (row << 12)) & ROW_MASK
+
+
+def _unpack_col(row):
+    """
+    将16位的行编码展开为棋盘上的一列（每个格子间隔16位）
+    :param row: int 16位行编码
+    :return: int 64位列编码
+    """
+    return (row | (row << 12) | (row << 24) | (row << 36)) & COL_MASK
+
+
+def _slide_row_left(cells):
+    """
+    将一行指数向左滑动并合并，与Model.move_left的规则一致：每个格子一次移动中最多合并一次
+    :param cells: list 四个格子的指数
+    :return: (list, int) 移动后的指数和得分
+    """
+    tiles = [e for e in cells if e != 0]
+    result = []
+    score = 0
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1] and tiles[i] != MAX_EXPONENT:
+            result.append(tiles[i] + 1)
+            score += 1 << (tiles[i] + 1)
+            i += 2
+        else:
+            result.append(tiles[i])
+            i += 1
+    return result + [0] * (4 - len(result)), score
+
+
+def _init_tables():
+    """
+    预先计算所有行状态在四个方向上的移动结果
+    :return:
+    """
+    for row in range(65536):
+        cells = [(row >> 0) & 0xF, (row >> 4) & 0xF, (row >> 8) & 0xF, (row >> 12) & 0xF]
+        moved, score = _slide_row_left(cells)
+        result = moved[0] | (moved[1] << 4) | (moved[2] << 8) | (moved[3] << 12)
+        rev_row = _reverse_row(row)
+        rev_result = _reverse_row(result)
+
+        SCORE_TABLE[row] = score
+        PAIR_TABLE[row] = sum(1 for k in range(3) if cells[k] and cells[k] == cells[k + 1])
+        ROW_LEFT_TABLE[row] = row ^ result
+        ROW_RIGHT_TABLE[rev_row] = rev_row ^ rev_result
+        COL_UP_TABLE[row] = _unpack_col(row) ^ _unpack_col(result)
+        COL_DOWN_TABLE[rev_row] = _unpack_col(rev_row) ^ _unpack_col(rev_result)
+
+
+_init_tables()
+
+
+def encode_grid(grid):
+    """
+    将Model.grid形式的二维列表编码为位棋盘
+    :param grid: list 4x4的二维列表，元素为0或2的幂
+    :return: int 位棋盘
+    """
+    board = 0
+    shift = 0
+    for row in grid:
+        for value in row:
+            if value:
+                board |= (value.bit_length() - 1) << shift
+            shift += 4
+    return board
+
+
+def decode_board(board):
+    """
+    将位棋盘解码为Model.grid形式的二维列表
+    :param board: int 位棋盘
+    :return: list 4x4的二维列表
+    """
+    grid = []
+    for i in range(4):
+        row = (board >> (16 * i)) & ROW_MASK
+        grid.append([(1 << e) if e else 0 for e in ((row >> 0) & 0xF, (row >> 4) & 0xF,
+                                                     (row >> 8) & 0xF, (row >> 12) & 0xF)])
+    return grid
+
+
+def transpose(board):
+    """
+    位棋盘转置，格子(i, j)与格子(j, i)互换
+    :param board: int 位棋盘
+    :return: int 转置后的位棋盘
+    """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def count_empty(board):
+    """
+    统计位棋盘上空格的数量
+    :param board: int 位棋盘
+    :return: int 空格数量
+    """
+    count = 0
+    for _ in range(16):
+        if not board & 0xF:
+            count += 1
+        board >>= 4
+    return count
+
+
+def max_exponent(board):
+    """
+    获取位棋盘上最大数字的指数
+    :param board: int 位棋盘
+    :return: int 最大指数，空棋盘返回0
+    """
+    result = 0
+    while board:
+        e = board & 0xF
+        if e > result:
+            result = e
+        board >>= 4
+    return result
+
+
+def count_pairs(board):
+    """
+    统计位棋盘上数字相同的相邻非空格子对数，与Model.mergeable_pairs相同
+    :param board: int 位棋盘
+    :return: int 对数
+    """
+    t = transpose(board)
+    return (PAIR_TABLE[board & ROW_MASK] + PAIR_TABLE[(board >> 16) & ROW_MASK]
+            + PAIR_TABLE[(board >> 32) & ROW_MASK] + PAIR_TABLE[board >> 48]
+            + PAIR_TABLE[t & ROW_MASK] + PAIR_TABLE[(t >> 16) & ROW_MASK]
+            + PAIR_TABLE[(t >> 32) & ROW_MASK] + PAIR_TABLE[t >> 48])
+
+
+def changed_cells(old_board, new_board):
+    """
+    比较两个位棋盘，找出数字不同的格子
+    :param old_board: int 位棋盘
+    :param new_board: int 位棋盘
+    :return: list 格子坐标(i, j)的列表
+    """
+    diff = old_board ^ new_board
+    cells = []
+    index = 0
+    while diff:
+        if diff & 0xF:
+            cells.append(divmod(index, 4))
+        diff >>= 4
+        index += 1
+    return cells
+
+
+_ROW_TRACES = {}  # 行编码 -> 向左移动时的轨迹，按需计算并缓存
+
+# 每个方向上第a条线的第k个格子在网格上的坐标，线的方向与移动方向一致
+_LINE_POSITIONS = {
+    "left": [[(a, k) for k in range(4)] for a in range(4)],
+    "right": [[(a, 3 - k) for k in range(4)] for a in range(4)],
+    "up": [[(k, a) for k in range(4)] for a in range(4)],
+    "down": [[(3 - k, a) for k in range(4)] for a in range(4)],
+}
+
+
+def row_trace(row):
+    """
+    计算一行向左移动时每个数字的移动轨迹
+    :param row: int 16位行编码
+    :return: (tuple, tuple) 移动列表(起点下标, 终点下标, 指数)和发生合并的终点下标
+    """
+    trace = _ROW_TRACES.get(row)
+    if trace is None:
+        tiles = [(k, (row >> (4 * k)) & 0xF) for k in range(4) if (row >> (4 * k)) & 0xF]
+        moves = []
+        merges = []
+        target = 0
+        i = 0
+        while i < len(tiles):
+            source, exponent = tiles[i]
+            if i + 1 < len(tiles) and tiles[i + 1][1] == exponent and exponent != MAX_EXPONENT:
+                merges.append(target)
+                for source, _ in (tiles[i], tiles[i + 1]):
+                    if source != target:
+                        moves.append((source, target, exponent))
+                i += 2
+            else:
+                if source != target:
+                    moves.append((source, target, exponent))
+                i += 1
+            target += 1
+        trace = _ROW_TRACES[row] = (tuple(moves), tuple(merges))
+    return trace
+
+
+_LINE_TRACES = {}  # (方向, 线的下标, 线的编码) -> 换算为网格坐标后的轨迹
+
+
+def _line_trace(direction, a, line):
+    """
+    计算某个方向上第a条线的移动轨迹，并换算为网格坐标和数字，结果缓存在_LINE_TRACES中
+    :param direction: str 移动方向
+    :param a: int 线的下标（行号或列号）
+    :param line: int 线的16位编码，格子按网格中的行（列）顺序排列
+    :return: (tuple, tuple) 移动轨迹(起点坐标, 终点坐标, 数字)和发生合并的格子坐标
+    """
+    position = _LINE_POSITIONS[direction][a]
+    moves, merges = row_trace(_reverse_row(line) if direction in ("right", "down") else line)
+    trace = (tuple((position[source], position[target], 1 << exponent) for source, target, exponent in moves),
+             tuple(position[target] for target in merges))
+    _LINE_TRACES[(direction, a, line)] = trace
+    return trace
+
+
+_LINE_EMPTY_OPS = {direction: {} for direction in _LINE_POSITIONS}  # 方向 -> {线的下标 << 16 | 线的编码: 空闲列表的更新操作}
+
+
+def _line_empty_ops(direction, a, line):
+    """
+    计算某个方向上第a条线移动后空闲列表的更新操作，顺序与Model写入格子的顺序一致，结果缓存在_LINE_EMPTY_OPS中
+    :param direction: str 移动方向
+    :param a: int 线的下标（行号或列号）
+    :param line: int 线的16位编码，格子按网格中的行（列）顺序排列
+    :return: tuple (格子编号, 是否被填上)的序列
+    """
+    position = _LINE_POSITIONS[direction][a]
+    old = _reverse_row(line) if direction in ("right", "down") else line
+    new = old ^ ROW_LEFT_TABLE[old]
+    ops = []
+    for k in range(4):
+        old_exponent = (old >> (4 * k)) & 0xF
+        new_exponent = (new >> (4 * k)) & 0xF
+        if not old_exponent and new_exponent:
+            ops.append((4 * position[k][0] + position[k][1], True))
+        elif old_exponent and not new_exponent:
+            ops.append((4 * position[k][0] + position[k][1], False))
+    ops = _LINE_EMPTY_OPS[direction][a << 16 | line] = tuple(ops)
+    return ops
+
+
+def _move_left(board):
+    score = 0
+    for shift in (0, 16, 32, 48):
+        row = (board >> shift) & ROW_MASK
+        board ^= ROW_LEFT_TABLE[row] << shift
+        score += SCORE_TABLE[row]
+    return board, score
+
+
+def _move_right(board):
+    score = 0
+    for shift in (0, 16, 32, 48):
+        row = (board >> shift) & ROW_MASK
+        board ^= ROW_RIGHT_TABLE[row] << shift
+        score += SCORE_TABLE[row]
+    return board, score
+
+
+def _move_up(board):
+    t = transpose(board)
+    score = 0
+    for j in range(4):
+        col = (t >> (16 * j)) & ROW_MASK
+        board ^= COL_UP_TABLE[col] << (4 * j)
+        score += SCORE_TABLE[col]
+    return board, score
+
+
+def _move_down(board):
+    t = transpose(board)
+    score = 0
+    for j in range(4):
+        col = (t >> (16 * j)) & ROW_MASK
+        board ^= COL_DOWN_TABLE[col] << (4 * j)
+        score += SCORE_TABLE[col]
+    return board, score
+
+
+MOVES = {
+    "left": _move_left,
+    "right": _move_right,
+    "up": _move_up,
+    "down": _move_down,
+}
+
+
+def execute_move(board, direction):
+    """
+    在位棋盘上执行一次移动（不添加随机数字）
+    :param board: int 位棋盘
+    :param direction: str 移动方向，"left"、"right"、"up"或"down"
+    :return: (int, int) 移动后的位棋盘和本次得分
+    """
+    return MOVES[direction](board)
+
+
+class BitboardModel(Model):
+    """
+    基于位棋盘的Model，grid属性按需从位棋盘解码，其余接口与Model一致，GameView可以直接使用
+    """
+    __slots__ = ("board", "_grid_cache", "_grid_cache_board", "_changed_cells", "_changed_since", "last_spawn_cell")
+
+    def __init__(self, seed=None, rng=None, grid_size=4, load_score=True):
+        """
+        :param seed: int 种子序列的种子，与Model相同
+        :param rng: 添加随机数字使用的随机数生成器，与Model相同
+        :param grid_size: int 网格的大小，位棋盘只支持4
+        :param load_score: bool 是否在创建时同步读取最高得分
+        """
+        if grid_size != 4:
+            raise ValueError(f"BitboardModel只支持4x4的网格：{grid_size}")
+        self.board = 0  # 位棋盘
+        self._grid_cache = None  # 解码后的grid缓存
+        self._grid_cache_board = None  # grid缓存对应的位棋盘
+        self._changed_cells = []  # 上一次移动中变化的格子
+        self._changed_since = None  # 尚未计算变化的格子时为(移动前的位棋盘, 移动后添加数字前的位棋盘, 方向, 添加的格子)
+        self.last_spawn_cell = None  # 上一次随机添加数字的格子编号，供轨迹记录使用
+        super().__init__(seed, rng, grid_size, load_score)
+
+    @property
+    def grid(self):
+        if self._grid_cache_board != self.board:
+            self._grid_cache = decode_board(self.board)
+            self._grid_cache_board = self.board
+        return self._grid_cache
+
+    @grid.setter
+    def grid(self, grid):
+        self.board = encode_grid(grid)
+        self._rebuild_empty_cells()
+
+    @property
+    def max_tile(self):
+        """
+        网格上最大的数字，由位棋盘直接计算，与Model.max_tile相同
+        """
+        exponent = max_exponent(self.board)
+        return 1 << exponent if exponent else 0
+
+    @property
+    def mergeable_pairs(self):
+        """
+        数字相同的相邻非空格子对数，由位棋盘查表计算，与Model.mergeable_pairs相同
+        """
+        return count_pairs(self.board)
+
+    @property
+    def changed_cells(self):
+        """
+        与Model.changed_cells相同：按移动时写入格子的顺序排列，最后是添加数字的格子（可能与前面的格子重复）
+        """
+        if self._changed_since is not None:
+            old_board, moved_board, direction, spawn = self._changed_since
+            diff = old_board ^ moved_board
+            cells = [(i, j) for line in _LINE_POSITIONS[direction] for i, j in line if (diff >> (16 * i + 4 * j)) & 0xF]
+            if spawn is not None:
+                cells.append(spawn)
+            self._changed_cells = cells
+            self._changed_since = None
+        return self._changed_cells
+
+    @changed_cells.setter
+    def changed_cells(self, cells):
+        self._changed_cells = cells
+        self._changed_since = None
+
+    def _update_empty_cells(self, old_board, direction):
+        """
+        按Model写入格子的顺序更新空闲列表，使相同种子下两种Model的空闲列表和随机数字完全一致
+        :param old_board: int 移动前的位棋盘
+        :param direction: str 移动方向
+        :return:
+        """
+        lines = old_board if direction in ("left", "right") else transpose(old_board)
+        cache = _LINE_EMPTY_OPS[direction]
+        empty_cells = self._empty_cells
+        empty_index = self._empty_index
+        for a in range(4):
+            line = (lines >> (16 * a)) & ROW_MASK
+            ops = cache.get(a << 16 | line)
+            if ops is None:
+                ops = _line_empty_ops(direction, a, line)
+            # 与Model._fill_cell、Model._clear_cell相同，展开以减少方法调用
+            for cell, filled in ops:
+                if filled:
+                    index = empty_index[cell]
+                    last = empty_cells.pop()
+                    if last != cell:
+                        empty_cells[index] = last
+                        empty_index[last] = index
+                    empty_index[cell] = -1
+                else:
+                    empty_index[cell] = len(empty_cells)
+                    empty_cells.append(cell)
+
+    def add_random_number(self):
+        """
+        从空闲列表中随机选择一个空格添加数字，与Model的随机数使用方式一致
+        :return: (int, int) 添加数字的位置，没有空格时返回None
+        """
+        if self._empty_cells:
+            cell = self.rng.choice(self._empty_cells)
+            exponent = 1 if self.rng.random() < 0.9 else 2
+            self.board |= exponent << (cell << 2)
+            self._fill_cell(cell)
+            self.last_spawn_cell = cell
+            return divmod(cell, 4)
+        self.last_spawn_cell = None
+        return None
+
+    def place_number(self, i, j, value):
+        """
+        在指定的格子上放置数字
+        :param i: int 行
+        :param j: int 列
+        :param value: int 数字
+        :return:
+        """
+        cell = 4 * i + j
+        shift = 4 * cell
+        old = (self.board >> shift) & 0xF
+        exponent = value.bit_length() - 1 if value else 0
+        self.board = (self.board & ~(0xF << shift)) | (exponent << shift)
+        if not old and exponent:
+            self._fill_cell(cell)
+        elif old and not exponent:
+            self._clear_cell(cell)
+
+    def fast_move(self, direction):
+        """
+        只在位棋盘上移动和添加随机数字，不计算移动轨迹
+        :param direction: str 移动方向
+        :return: bool 是否为有效移动
+        """
+        old_board = self.board
+        new_board, score = execute_move(old_board, direction)
+        if new_board == old_board:
+            self.changed_cells = []
+            return False
+        self.board = new_board
+        self._update_empty_cells(old_board, direction)
+        self.score += score
+        spawn = self.add_random_number()
+        self._changed_since = (old_board, new_board, direction, spawn)
+        if self.score > self.highest_score:
+            self.highest_score = self.score
+        self.last_move_direction = direction
+        self.moves += 1
+        return True
+
+    def _move(self, direction, spawn=None):
+        """
+        在位棋盘上移动，移动轨迹通过缓存的行轨迹表换算为网格坐标，无效移动不添加随机数字
+        :param direction: str 移动方向
+        :param spawn: (int, int, int) 指定移动后添加的数字，为None时随机添加
+        :return: MoveResult 本次移动的结果
+        """
+        old_board = self.board
+        new_board, score = execute_move(old_board, direction)
+        if new_board == old_board:
+            self.changed_cells = []
+            return MoveResult(direction, False)
+
+        movements = []
+        merged_cells = []
+        lines = old_board if direction in ("left", "right") else transpose(old_board)
+        for a in range(4):
+            line = (lines >> (16 * a)) & ROW_MASK
+            trace = _LINE_TRACES.get((direction, a, line))
+            if trace is None:
+                trace = _line_trace(direction, a, line)
+            movements.extend(trace[0])
+            merged_cells.extend(trace[1])
+
+        self.board = new_board
+        self._update_empty_cells(old_board, direction)
+        self.score += score
+        if spawn is None:
+            position = self.add_random_number()
+            if position is not None:
+                i, j = position
+                spawn = (i, j, 1 << ((self.board >> (4 * (4 * i + j))) & 0xF))
+        else:
+            self.place_number(*spawn)
+        # 变化的格子在访问changed_cells时才计算
+        self._changed_since = (old_board, new_board, direction, None if spawn is None else (spawn[0], spawn[1]))
+        if self.score > self.highest_score:
+            self.highest_score = self.score
+        self.last_move_direction = direction
+        self.moves += 1
+        return MoveResult(direction, True, score, merged_cells, movements, spawn)
+
+    def move_left(self):
+        return self._move("left")
+
+    def move_right(self):
+        return self._move("right")
+
+    def move_up(self):
+        return self._move("up")
+
+    def move_down(self):
+        return self._move("down")
+
+    def check_win(self):
+        """
+        检查是否已经出现2048（指数不小于11，即二进制1011~1111），对所有格子同时做位运算，不需要逐格扫描
+        :return:
+        """
+        board = self.board
+        bit3 = board & 0x8888888888888888
+        bit2 = (board & 0x4444444444444444) << 1
+        bit1 = (board & 0x2222222222222222) << 2
+        bit0 = (board & 0x1111111111111111) << 3
+        return bool(bit3 & (bit2 | (bit1 & bit0)))
+
+    def check_lost(self):
+        """
+        棋盘已满并且四个方向都无法移动时即为失败
+        :return:
+        """
+        if self._empty_cells:
+            return False
+        board = self.board
+        return all(move(board)[0] == board for move in MOVES.values())
+
+    def canonical(self):
+        """
+        当前局面在8种对称变换下的规范形式，只用位运算；与同一局面的Model.canonical返回相同的键和变换编号
+        :return: (int, int) 规范形式的位棋盘和所用的变换编号
+        """
+        from Model.symmetry import canonical
+        return canonical(self.board)
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    model = BitboardModel()
+    model.reset()
+    print(model.grid)
+    model.move_left()
+    print(model.grid)
@@ -0,0 +1,138 @@
+"""
+history.py
+==========
+
+多级撤销/重做的历史记录，GameView和终端版共用。
+
+- 每个局面压缩为一个bytes对象（每个格子一个字节，保存数字的指数），4x4的局面只占16字节的数据，
+  连同得分和有效移动次数保存在固定容量的环形缓冲区中，超过容量时覆盖最旧的局面；
+- 记录、撤销和重做都只移动游标，与历史的长度无关；撤销后再走一步会丢弃可以重做的局面；
+- 恢复局面时由Model.restore重建网格、空格列表和统计量，只需要一次O(格子数)的解码，不需要复制嵌套列表。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+VALUES = (0,) + tuple(1 << exponent for exponent in range(1, 256))  # 指数 -> 数字
+
+
+def pack_grid(grid):
+    """
+    把网格压缩为每个格子一个字节的指数序列
+    :param grid: list 二维列表
+    :return: bytes 压缩后的局面
+    """
+    return bytes(value.bit_length() - 1 if value else 0 for row in grid for value in row)
+
+
+def unpack_grid(data, grid_size):
+    """
+    把压缩的局面还原为网格
+    :param data: bytes pack_grid的结果
+    :param grid_size: int 网格大小
+    :return: list 二维列表
+    """
+    return [[VALUES[e] for e in data[i:i + grid_size]] for i in range(0, grid_size * grid_size, grid_size)]
+
+
+class GameHistory:
+    __slots__ = ("capacity", "_boards", "_scores", "_moves", "_start", "_length", "_cursor")
+
+    def __init__(self, capacity=256):
+        """
+        :param capacity: int 最多保存的局面数（包括当前局面），最多可以连续撤销capacity-1步
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity必须大于0：{capacity}")
+        self.capacity = capacity
+        self._boards = [None] * capacity  # 压缩后的局面
+        self._scores = [0] * capacity  # 对应的得分
+        self._moves = [0] * capacity  # 对应的有效移动次数
+        self._start = 0  # 最旧的局面在缓冲区中的位置
+        self._length = 0  # 保存的局面数
+        self._cursor = -1  # 当前局面是第几个（从最旧的局面开始计），-1表示没有局面
+
+    def __len__(self):
+        return self._length
+
+    def clear(self):
+        """
+        清空历史，开始新的一局时调用
+        :return:
+        """
+        self._start = 0
+        self._length = 0
+        self._cursor = -1
+
+    def push(self, model):
+        """
+        记录当前局面，在新游戏开始和每次有效移动之后调用；可以重做的局面会被丢弃
+        :param model: Model 游戏模型
+        :return:
+        """
+        self._length = self._cursor + 1
+        if self._length == self.capacity:
+            self._start = (self._start + 1) % self.capacity  # 覆盖最旧的局面
+            self._length -= 1
+        index = (self._start + self._length) % self.capacity
+        self._boards[index] = pack_grid(model.grid)
+        self._scores[index] = model.score
+        self._moves[index] = model.moves
+        self._length += 1
+        self._cursor = self._length - 1
+
+    @property
+    def can_undo(self):
+        return self._cursor > 0
+
+    @property
+    def can_redo(self):
+        return self._cursor < self._length - 1
+
+    def undo(self, model):
+        """
+        撤销一步，把model恢复到上一个局面
+        :param model: Model 游戏模型
+        :return: bool 是否撤销成功，没有更早的局面时返回False
+        """
+        if not self.can_undo:
+            return False
+        self._cursor -= 1
+        self._load(model)
+        return True
+
+    def redo(self, model):
+        """
+        重做一步，把model恢复到下一个局面
+        :param model: Model 游戏模型
+        :return: bool 是否重做成功，没有可以重做的局面时返回False
+        """
+        if not self.can_redo:
+            return False
+        self._cursor += 1
+        self._load(model)
+        return True
+
+    def _load(self, model):
+        index = (self._start + self._cursor) % self.capacity
+        model.restore(unpack_grid(self._boards[index], model.grid_size), self._scores[index], self._moves[index])
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    from Model.model import Model
+
+    game = Model(0)
+    game.reset()
+    history = GameHistory(capacity=8)
+    history.push(game)
+    for direction in ("left", "up", "right", "down") * 3:
+        if game.move(direction).changed:
+            history.push(game)
+    print(len(history), game.score, game.grid)
+    while history.undo(game):
+        pass
+    print(game.score, game.grid)
+    while history.redo(game):
+        pass
+    print(game.score, game.grid)
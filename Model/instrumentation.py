@@ -0,0 +1,276 @@
+"""
+instrumentation.py
+==========
+
+可选的性能统计：分阶段计时、计数器和耗时直方图，可以导出为JSON或写入本地的统计文件。
+
+- 不启用时没有任何开销：instrument_model和instrument_view只是在实例上用计时的包装函数覆盖对应的方法，
+  类本身的方法不变，没有被包装的实例（以及自我对局、AI搜索等使用的fast_move）不会多执行任何代码；
+- Model的阶段：model.move（一次移动，包括其中的添加数字）、model.spawn、model.check_win、model.check_lost，
+  计数器：moves（有效移动）、noop_moves（无效移动）、merges（合并次数）；
+- GameView的阶段：view.key_press（方向键放进输入队列到它的移动刷新到界面，由InputQueue记录）、view.update_view、
+  view.render（刷新方块）、view.paint（棋盘的一次paintEvent）、view.apply_theme（应用主题）、view.message_box（创建并显示消息框）；
+- 每个阶段的耗时记录在按2的幂分桶（纳秒）的直方图中，导出时给出次数、总耗时、最小/最大值和近似的分位数。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import functools
+import json
+import time
+
+from Model.journal import write_atomic
+
+BUCKETS = 48  # 第k个桶记录耗时在[2**(k-1), 2**k)纳秒之间的样本，最后一个桶记录更长的耗时
+
+
+class Histogram:
+    """
+    耗时直方图，按2的幂分桶，记录一次样本只需要几次整数运算
+    """
+    __slots__ = ("count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0  # 总耗时（纳秒）
+        self.minimum = None
+        self.maximum = 0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, elapsed):
+        """
+        记录一个样本
+        :param elapsed: int 耗时（纳秒）
+        :return:
+        """
+        self.count += 1
+        self.total += elapsed
+        if self.minimum is None or elapsed < self.minimum:
+            self.minimum = elapsed
+        if elapsed > self.maximum:
+            self.maximum = elapsed
+        self.buckets[min(elapsed.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """
+        近似的分位数，返回所在桶的上界（不超过最大值）
+        :param fraction: float 0~1之间的比例
+        :return: int 耗时（纳秒）
+        """
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for k, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(1 << k, self.maximum)
+        return self.maximum
+
+    def export(self):
+        """
+        :return: dict 统计结果，耗时的单位为微秒
+        """
+        return {
+            "count": self.count,
+            "total_us": self.total / 1000,
+            "mean_us": self.total / self.count / 1000 if self.count else 0,
+            "min_us": (self.minimum or 0) / 1000,
+            "max_us": self.maximum / 1000,
+            "p50_us": self.percentile(0.5) / 1000,
+            "p90_us": self.percentile(0.9) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "buckets": {f"<{1 << k}ns": bucket for k, bucket in enumerate(self.buckets) if bucket},
+        }
+
+
+class Instrumentation:
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}  # 计数器名 -> 次数
+        self.timers = {}  # 阶段名 -> Histogram
+
+    def count(self, name, n=1):
+        """
+        :param name: str 计数器名
+        :param n: int 增加的次数
+        :return:
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, elapsed):
+        """
+        记录一个阶段的耗时
+        :param name: str 阶段名
+        :param elapsed: int 耗时（纳秒）
+        :return:
+        """
+        histogram = self.timers.get(name)
+        if histogram is None:
+            histogram = self.timers[name] = Histogram()
+        histogram.add(elapsed)
+
+    def timed(self, name, func, after=None):
+        """
+        包装一个函数，每次调用都记录耗时
+        :param name: str 阶段名
+        :param func: 被包装的函数
+        :param after: 可选的回调，参数为被包装函数的返回值，用于更新计数器，不计入耗时
+        :return: 包装后的函数
+        """
+        histogram = self.timers.get(name)
+        if histogram is None:
+            histogram = self.timers[name] = Histogram()
+        add = histogram.add
+        clock = time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            result = func(*args, **kwargs)
+            add(clock() - start)
+            if after is not None:
+                after(result)
+            return result
+
+        wrapper.__wrapped_by_instrumentation__ = True
+        return wrapper
+
+    def reset(self):
+        """
+        清空所有统计，已经包装的函数继续记录到新的直方图中
+        :return:
+        """
+        self.started = time.time()
+        self.counters = {name: 0 for name in self.counters}
+        for histogram in self.timers.values():
+            histogram.__init__()
+
+    def export(self, extra=None):
+        """
+        :param extra: dict 附加到结果中的其他统计（例如动画的帧时间）
+        :return: dict 所有统计结果
+        """
+        data = {
+            "started": self.started,
+            "duration_s": time.time() - self.started,
+            "counters": dict(self.counters),
+            "timers": {name: histogram.export() for name, histogram in sorted(self.timers.items()) if histogram.count},
+        }
+        if extra:
+            data.update(extra)
+        return data
+
+    def to_json(self, extra=None):
+        return json.dumps(self.export(extra), indent=2, ensure_ascii=False)
+
+    def save(self, filename="./2048_stats.json", extra=None):
+        """
+        把统计结果写入文件（先写临时文件再替换）
+        :param filename: str 文件路径
+        :param extra: dict 附加到结果中的其他统计
+        :return:
+        """
+        write_atomic(filename, self.to_json(extra).encode())
+
+
+MODEL_PHASES = {
+    "_move": "model.move",
+    "add_random_number": "model.spawn",
+    "check_win": "model.check_win",
+    "check_lost": "model.check_lost",
+}
+
+VIEW_PHASES = {
+    "update_view": "view.update_view",
+    "flush_cells": "view.render",
+    "apply_theme": "view.apply_theme",
+    "show_message_box": "view.message_box",
+}
+
+BOARD_PHASES = {
+    "paintEvent": "view.paint",
+}
+
+
+def _wrap(target, phases, instrumentation, after=None):
+    after = after or {}
+    for attribute, name in phases.items():
+        setattr(target, attribute, instrumentation.timed(name, getattr(target, attribute), after.get(attribute)))
+
+
+def _unwrap(target, phases):
+    for attribute in phases:
+        if getattr(target.__dict__.get(attribute), "__wrapped_by_instrumentation__", False):
+            delattr(target, attribute)
+
+
+def instrument_model(model, instrumentation):
+    """
+    为一个Model实例启用统计（move_left等方法和move都经过_move，所以都会被计时）
+    :param model: Model 游戏模型
+    :param instrumentation: Instrumentation 统计
+    :return:
+    """
+    def count_move(result):
+        if result.changed:
+            instrumentation.count("moves")
+            if result.merged:
+                instrumentation.count("merges", len(result.merged))
+        else:
+            instrumentation.count("noop_moves")
+
+    uninstrument_model(model)
+    _wrap(model, MODEL_PHASES, instrumentation, {"_move": count_move})
+
+
+def uninstrument_model(model):
+    """
+    停止统计，恢复为类本身的方法
+    :param model: Model 游戏模型
+    :return:
+    """
+    _unwrap(model, MODEL_PHASES)
+
+
+def instrument_view(view, instrumentation):
+    """
+    为GameView和它的棋盘启用统计，同时为它的Model和输入队列（view.key_press）启用统计
+    :param view: GameView 游戏窗口
+    :param instrumentation: Instrumentation 统计
+    :return:
+    """
+    uninstrument_view(view)
+    _wrap(view, VIEW_PHASES, instrumentation)
+    _wrap(view.board, BOARD_PHASES, instrumentation)
+    view.input_queue.instrumentation = instrumentation
+    instrument_model(view.model, instrumentation)
+
+
+def uninstrument_view(view):
+    """
+    停止统计
+    :param view: GameView 游戏窗口
+    :return:
+    """
+    _unwrap(view, VIEW_PHASES)
+    _unwrap(view.board, BOARD_PHASES)
+    view.input_queue.instrumentation = None
+    uninstrument_model(view.model)
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    import random
+    from Model.model import Model, DIRECTIONS
+
+    stats = Instrumentation()
+    game = Model(0, load_score=False)
+    instrument_model(game, stats)
+    game.reset()
+    rng = random.Random(0)
+    while not game.check_lost():
+        game.move(rng.choice(DIRECTIONS))
+        game.check_win()
+    print(stats.to_json())
@@ -0,0 +1,330 @@
+"""
+journal.py
+==========
+
+对局进度的持久化：只追加写入的二进制移动日志 + 定期的局面快照，程序崩溃后可以从最近的快照开始重放日志恢复对局。
+
+日志文件（默认./2048_journal.bin）格式：
+
+- 文件头：b"2048J"、版本号、网格大小、是否有种子、种子（小端8字节有符号整数，超出范围的种子按没有种子记录）
+- 之后每一次有效移动占1个字节：第6~5位为移动方向，第4位为新数字（0表示2，1表示4），第3~0位为新数字所在的格子编号；
+  网格大于4x4时每条记录占2个字节（小端）：第10~9位为移动方向，第8位为新数字，第7~0位为格子编号
+
+快照文件（默认./2048_journal.snap）记录快照时日志的长度、当前得分、有效移动次数和每个格子数字的指数，末尾带CRC32校验，
+写入时先写临时文件再通过os.replace替换，任何时刻磁盘上都是一份完整的快照。
+恢复时先载入快照，再重放日志中快照之后的移动；末尾写了一半的2字节记录会被忽略。
+撤销之后日志中仍然保留被撤销的移动，移动次数以快照为准，而不是由日志长度推算；
+重放在某一条记录上失败时，日志从这条记录开始截掉，之后的移动接在能够重放的部分后面。
+
+所有文件操作都在后台线程中完成，GameView只是把要写的数据放进队列，不会阻塞Qt的事件循环；
+每条移动记录都会立即写入操作系统（进程崩溃不会丢失），每sync_every步做一次fsync，快照每snapshot_every步写一次。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+
+from Model.model import DIRECTIONS, DIRECTION_CODES
+
+MAGIC = b"2048J"
+VERSION = 1
+HEADER = struct.Struct("<5sBBBq")  # 魔数、版本、网格大小、是否有种子、种子
+SEED_MIN, SEED_MAX = -(1 << 63), (1 << 63) - 1  # 文件头能保存的种子范围
+SNAPSHOT_MAGIC = b"2SN2"
+SNAPSHOT_HEADER = struct.Struct("<4sQQQB")  # 魔数、日志长度、得分、有效移动次数、网格大小
+
+
+def record_size(grid_size):
+    """
+    每条移动记录的字节数
+    :param grid_size: int 网格大小
+    :return: int 4x4及以下为1，更大的网格为2
+    """
+    return 1 if grid_size <= 4 else 2
+
+
+def encode_move(result, grid_size=4):
+    """
+    把一次有效移动编码为一条记录
+    :param result: MoveResult 移动的结果，必须带有新添加的数字
+    :param grid_size: int 网格大小
+    :return: bytes 编码后的记录
+    """
+    i, j, value = result.spawn
+    cell = i * grid_size + j
+    if record_size(grid_size) == 1:
+        return bytes(((DIRECTION_CODES[result.direction] << 5) | ((value == 4) << 4) | cell,))
+    code = (DIRECTION_CODES[result.direction] << 9) | ((value == 4) << 8) | cell
+    return code.to_bytes(2, "little")
+
+
+def decode_move(record, grid_size=4):
+    """
+    解码一条移动记录
+    :param record: bytes 编码后的记录
+    :param grid_size: int 网格大小
+    :return: (str, (int, int, int)) 移动方向和新添加的数字(i, j, 数字)
+    """
+    if record_size(grid_size) == 1:
+        code = record[0]
+        direction, four, cell = (code >> 5) & 0x3, code & 0x10, code & 0xF
+    else:
+        code = int.from_bytes(record, "little")
+        direction, four, cell = (code >> 9) & 0x3, code & 0x100, code & 0xFF
+    return DIRECTIONS[direction], (cell // grid_size, cell % grid_size, 4 if four else 2)
+
+
+def encode_snapshot(model, journal_length):
+    """
+    把当前局面编码为快照
+    :param model: Model 游戏模型
+    :param journal_length: int 快照时日志文件的长度
+    :return: bytes 快照数据
+    """
+    exponents = bytes(value.bit_length() - 1 if value else 0 for row in model.grid for value in row)
+    data = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, journal_length, model.score, model.moves, model.grid_size) + exponents
+    return data + struct.pack("<I", zlib.crc32(data))
+
+
+def decode_snapshot(data):
+    """
+    解码快照
+    :param data: bytes 快照数据
+    :return: (int, int, int, list) 日志长度、得分、有效移动次数和网格；数据不完整或校验失败时返回None
+    """
+    if len(data) < SNAPSHOT_HEADER.size + 4:
+        return None
+    body, checksum = data[:-4], struct.unpack("<I", data[-4:])[0]
+    if zlib.crc32(body) != checksum or body[:4] != SNAPSHOT_MAGIC:
+        return None
+    _, journal_length, score, moves, grid_size = SNAPSHOT_HEADER.unpack_from(body)
+    exponents = body[SNAPSHOT_HEADER.size:]
+    if len(exponents) != grid_size * grid_size:
+        return None
+    grid = [[(1 << e) if e else 0 for e in exponents[i * grid_size:(i + 1) * grid_size]] for i in range(grid_size)]
+    return journal_length, score, moves, grid
+
+
+def write_atomic(filename, data):
+    """
+    先写入临时文件并fsync，再替换目标文件
+    :param filename: str 目标文件
+    :param data: bytes 数据
+    :return:
+    """
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+class _JournalWriter(threading.Thread):
+    """
+    后台写入线程，按顺序执行队列中的文件操作
+    """
+
+    def __init__(self, journal_path, snapshot_path):
+        super().__init__(name="GameJournalWriter", daemon=True)
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.queue = queue.Queue()
+        self.file = None
+
+    def run(self):
+        while True:
+            op, data = self.queue.get()
+            try:
+                if op == "start":
+                    self._close_file()
+                    write_atomic(self.journal_path, data)
+                    self.file = open(self.journal_path, "ab")
+                elif op == "open":
+                    # 截掉末尾不完整的记录后继续追加
+                    self._close_file()
+                    self.file = open(self.journal_path, "ab")
+                    self.file.truncate(data)
+                elif op == "append":
+                    # 每次都写到操作系统，进程崩溃不会丢失；fsync按批进行
+                    if self.file:
+                        self.file.write(data)
+                        self.file.flush()
+                elif op == "sync":
+                    self._sync()
+                elif op == "snapshot":
+                    # 快照中记录的日志长度必须已经落盘
+                    self._sync()
+                    write_atomic(self.snapshot_path, data)
+                elif op == "discard":
+                    self._close_file()
+                    for path in (self.journal_path, self.snapshot_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+                elif op == "close":
+                    self._sync()
+                    self._close_file()
+                    return
+            except OSError:
+                pass  # 持久化失败不影响游戏本身
+            finally:
+                self.queue.task_done()
+
+    def _sync(self):
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def _close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class GameJournal:
+    def __init__(self, path="./2048_journal.bin", snapshot_path=None, snapshot_every=64, sync_every=16):
+        """
+        :param path: str 移动日志文件路径
+        :param snapshot_path: str 快照文件路径，默认为日志路径的扩展名换成.snap
+        :param snapshot_every: int 每多少步写一次快照
+        :param sync_every: int 每多少步对日志做一次fsync
+        """
+        self.path = path
+        self.snapshot_path = snapshot_path or os.path.splitext(path)[0] + ".snap"
+        self.snapshot_every = snapshot_every
+        self.sync_every = sync_every
+        self.length = 0  # 日志文件的长度（字节）
+        self.grid_size = 4  # 当前对局的网格大小，决定每条记录的字节数
+        self.moves_since_snapshot = 0
+        self.moves_since_sync = 0
+        self.writer = None
+
+    def _submit(self, op, data=None):
+        if self.writer is None:
+            self.writer = _JournalWriter(self.path, self.snapshot_path)
+            self.writer.start()
+        self.writer.queue.put((op, data))
+
+    def start(self, model):
+        """
+        开始记录一局新游戏，写入文件头（包括本局的种子）和初始局面的快照
+        :param model: Model 刚刚reset的游戏模型
+        :return:
+        """
+        seed = getattr(model, "seed", None)
+        has_seed = isinstance(seed, int) and SEED_MIN <= seed <= SEED_MAX
+        header = HEADER.pack(MAGIC, VERSION, model.grid_size, has_seed, seed if has_seed else 0)
+        self.length = len(header)
+        self.grid_size = model.grid_size
+        self.moves_since_snapshot = 0
+        self.moves_since_sync = 0
+        self._submit("start", header)
+        self._submit("snapshot", encode_snapshot(model, self.length))
+
+    def record(self, result, model):
+        """
+        记录一次有效移动
+        :param result: MoveResult 移动的结果
+        :param model: Model 移动后的游戏模型，用于定期写快照
+        :return:
+        """
+        if not result.changed or result.spawn is None:
+            return
+        record = encode_move(result, self.grid_size)
+        self._submit("append", record)
+        self.length += len(record)
+        self.moves_since_snapshot += 1
+        self.moves_since_sync += 1
+        if self.moves_since_snapshot >= self.snapshot_every:
+            self.snapshot(model)
+        elif self.moves_since_sync >= self.sync_every:
+            self.moves_since_sync = 0
+            self._submit("sync")
+
+    def snapshot(self, model):
+        """
+        写入当前局面的快照
+        :param model: Model 游戏模型
+        :return:
+        """
+        self.moves_since_snapshot = 0
+        self.moves_since_sync = 0
+        self._submit("snapshot", encode_snapshot(model, self.length))
+
+    def finish(self):
+        """
+        对局结束，删除日志和快照，之后不再有可以恢复的进度
+        :return:
+        """
+        self._submit("discard")
+
+    def close(self):
+        """
+        把所有数据写入磁盘并结束后台线程
+        :return:
+        """
+        if self.writer is not None:
+            self._submit("close")
+            self.writer.join()
+            self.writer = None
+
+    def load(self):
+        """
+        读取磁盘上的日志和快照
+        :return: dict 种子、网格大小、快照中的局面、得分和移动次数、快照时的日志长度、快照之后的移动；
+                 没有可以恢复的进度时返回None
+        """
+        try:
+            with open(self.path, "rb") as f:
+                journal = f.read()
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = decode_snapshot(f.read())
+        except OSError:
+            return None
+        if snapshot is None or len(journal) < HEADER.size:
+            return None
+        magic, version, grid_size, has_seed, seed = HEADER.unpack_from(journal)
+        journal_length, score, moves, grid = snapshot
+        if magic != MAGIC or version != VERSION or len(grid) != grid_size or journal_length > len(journal):
+            return None
+        size = record_size(grid_size)
+        end = journal_length + (len(journal) - journal_length) // size * size  # 忽略末尾不完整的记录
+        return {
+            "seed": seed if has_seed else None,
+            "grid_size": grid_size,
+            "grid": grid,
+            "score": score,
+            "snapshot_moves": moves,
+            "snapshot_length": journal_length,
+            "moves": [decode_move(journal[k:k + size], grid_size) for k in range(journal_length, end, size)],
+            "length": end,
+        }
+
+    def resume(self, model):
+        """
+        从磁盘上的进度恢复对局：载入快照后重放之后的移动
+        :param model: Model 游戏模型
+        :return: bool 是否成功恢复
+        """
+        data = self.load()
+        if data is None or data["grid_size"] != model.grid_size:
+            return False
+        model.restore(data["grid"], data["score"], data["snapshot_moves"])
+        replayed = 0
+        for direction, spawn in data["moves"]:
+            if not model.move(direction, spawn).changed:  # move会累加model.moves
+                break
+            replayed += 1
+        model.changed_cells = [(i, j) for i in range(model.grid_size) for j in range(model.grid_size)]
+        # 截掉没能重放的记录，之后的移动接在已经重放的部分后面
+        self.length = data["snapshot_length"] + replayed * record_size(data["grid_size"])
+        self.grid_size = data["grid_size"]
+        self.moves_since_snapshot = replayed
+        self.moves_since_sync = 0
+        self._submit("open", self.length)
+        return True
@@ -5,155 +5,516 @@ model.py
 这个Model类是2048游戏的核心类
 实现了2048游戏的逻辑，包括移动、得分、最高得分、存储和读取最高得分、检查胜利和失败等功能。
 
-- add_random_number方法是在随机位置添加数字
-- reset方法是重置游戏状态
-- move_left、move_right、move_up和move_down方法是移动网格并在适当的时候合并数字
-- check_win方法用于检查是否赢得游戏，check_lost方法用于检查是否输掉游戏
+- 网格大小可以在2x2到16x16之间设置，空格保存在一个增量维护的空闲列表中，add_random_number在随机位置添加数字只需要O(1)时间，
+  与网格大小无关
+- reset方法是重置游戏状态，每一局都有自己的种子，Model使用独立的随机数生成器，相同的种子和移动序列总能重现同一局游戏
+- move_left、move_right、move_up和move_down方法是移动网格并在适当的时候合并数字，发生变化的格子记录在changed_cells中，
+  返回的MoveResult包含是否发生变化、得分、合并的格子和移动轨迹，无效移动不会添加随机数字
+- check_win方法用于检查是否赢得游戏，check_lost方法用于检查是否输掉游戏，
+  最大数字、空格数和可以合并的相邻数对数量都随着移动和添加数字增量维护，两个检查都是O(1)
 
 Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
 
 Date: 2023-4-5
 """
+import os
 import random
 import json
 
 
+class MoveResult:
+    """
+    一次移动的结果，在移动过程中直接生成，调用方不需要再复制网格来判断是否发生了变化
+
+    - direction: 移动方向
+    - changed: 是否有数字移动或合并，为False时表示无效移动，没有添加随机数字
+    - score: 本次移动得到的分数
+    - merged: 发生合并的格子坐标列表
+    - movements: 数字的移动轨迹列表，每一项为(起点坐标, 终点坐标, 移动前的数字)，原地不动的数字不在其中
+    - spawn: 新添加的数字(i, j, 数字)，没有添加时为None
+    """
+    __slots__ = ("direction", "changed", "score", "merged", "movements", "spawn")
+
+    def __init__(self, direction, changed, score=0, merged=(), movements=(), spawn=None):
+        self.direction = direction
+        self.changed = changed
+        self.score = score
+        self.merged = merged
+        self.movements = movements
+        self.spawn = spawn
+
+    def __repr__(self):
+        return (f"MoveResult(direction={self.direction!r}, changed={self.changed}, score={self.score}, "
+                f"merged={self.merged}, movements={self.movements}, spawn={self.spawn})")
+
+
+MIN_GRID_SIZE = 2
+MAX_GRID_SIZE = 16
+WIN_TILE = 2048  # 出现这个数字即为胜利
+# 四个移动方向；日志、轨迹和n-tuple权重文件中保存的方向编号是它在这个元组中的下标，各模块都从这里导入，不能改变顺序
+DIRECTIONS = ("left", "right", "up", "down")
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
 class Model:
-    def __init__(self):
-        self.grid_size = 4  # 网格的大小为4x4
+    # 游戏状态都保存在槽中；__dict__只留给instrumentation和trace在实例上包装方法，没有包装时不会分配
+    __slots__ = ("seed_sequence", "rng", "seed", "grid_size", "_neighbors", "_grid", "last_move_direction", "score",
+                 "moves", "highest_score", "changed_cells", "_lines", "_empty_cells", "_empty_index", "max_tile",
+                 "mergeable_pairs", "__dict__")
+
+    def __init__(self, seed=None, rng=None, grid_size=4, load_score=True):
+        """
+        :param seed: int 种子序列的种子，相同的seed得到相同的一系列对局，为None时每次运行都不同
+        :param rng: 添加随机数字使用的随机数生成器，需要提供random.Random的choice、random和seed方法，默认为random.Random
+        :param grid_size: int 网格的大小，范围为2~16
+        :param load_score: bool 是否在创建时同步读取最高得分，为False时由调用方稍后调用load_highest_score
+        """
+        if not MIN_GRID_SIZE <= grid_size <= MAX_GRID_SIZE:
+            raise ValueError(f"grid_size必须在{MIN_GRID_SIZE}~{MAX_GRID_SIZE}之间：{grid_size}")
+        self.seed_sequence = random.Random(seed)  # 为每一局生成种子
+        self.rng = rng if rng is not None else random.Random()  # 每个Model独立的随机数生成器
+        self.seed = None  # 当前对局的种子，由reset设置，(seed, 移动序列)可以完整重现一局游戏
+        self.grid_size = grid_size  # 网格的大小，默认为4x4
+        self._neighbors = self._build_neighbors()  # 每个格子的相邻格子，相同大小的Model共用
         self.grid = [[0 for _ in range(self.grid_size)] for _ in range(self.grid_size)]  # 初始化网格
         self.last_move_direction = None  # 上一次的移动方向
         self.score = 0  # 当前得分
+        self.moves = 0  # 本局的有效移动次数
         self.highest_score = 0  # 最高得分
-        self.load_highest_score()  # 加载最高得分
+        self.changed_cells = []  # 上一次移动中数字发生变化的格子，view层只需要刷新这些格子
+        self._lines = self._build_lines()  # 每个方向上的坐标线，相同大小的Model共用
+        if load_score:
+            self.load_highest_score()  # 加载最高得分
 
-    def add_random_number(self):
+    @property
+    def grid(self):
+        return self._grid
+
+    @grid.setter
+    def grid(self, grid):
         """
-        随机在网格上添加一个数字
+        整体替换网格时重新建立空闲列表；单个格子的修改需要通过place_number，才能保持空闲列表正确
+        """
+        self._grid = grid
+        self._rebuild_empty_cells()
+        self._rebuild_stats()
+
+    _neighbor_cache = {}  # 网格大小 -> 相邻格子表
+
+    def _build_neighbors(self):
+        """
+        预先计算每个格子的相邻格子，结果按网格大小缓存在类属性中
+        :return: list 以格子编号为下标的相邻格子坐标列表
+        """
+        n = self.grid_size
+        neighbors = Model._neighbor_cache.get(n)
+        if neighbors is None:
+            neighbors = Model._neighbor_cache[n] = [
+                [(i + di, j + dj) for di, dj in ((-1, 0), (1, 0), (0, -1), (0, 1)) if 0 <= i + di < n and 0 <= j + dj < n]
+                for i in range(n) for j in range(n)]
+        return neighbors
+
+    def _rebuild_stats(self):
+        """
+        重新统计最大数字和可以合并的相邻数对数量
         :return:
         """
-        empty_cells = [(i, j) for i in range(self.grid_size) for j in range(self.grid_size) if self.grid[i][j] == 0]
-        if empty_cells:
-            i, j = random.choice(empty_cells)
-            self.grid[i][j] = random.choices([2, 4], weights=(0.9, 0.1))[0]
+        n = self.grid_size
+        grid = self._grid
+        self.max_tile = max(max(row) for row in grid)  # 网格上最大的数字
+        pairs = 0
+        for i in range(n):
+            for j in range(n):
+                value = grid[i][j]
+                if value:
+                    if j < n - 1 and grid[i][j + 1] == value:
+                        pairs += 1
+                    if i < n - 1 and grid[i + 1][j] == value:
+                        pairs += 1
+        self.mergeable_pairs = pairs  # 数字相同的相邻非空格子对数
 
-    def reset(self):
+    def _count_pairs(self, i, j, value):
+        """
+        统计格子(i, j)的相邻格子中数字为value的个数
+        :param value: int 数字，不能为0
+        :return: int 个数
+        """
+        grid = self._grid
+        count = 0
+        for x, y in self._neighbors[i * self.grid_size + j]:
+            if grid[x][y] == value:
+                count += 1
+        return count
+
+    def _rebuild_empty_cells(self):
+        """
+        按行优先的顺序重新建立空闲列表
+        _empty_cells保存所有空格的编号（i * grid_size + j），_empty_index[编号]为该空格在列表中的下标，不是空格时为-1
+        :return:
+        """
+        n = self.grid_size
+        grid = self.grid
+        self._empty_cells = [i * n + j for i in range(n) for j in range(n) if grid[i][j] == 0]
+        self._empty_index = [-1] * (n * n)
+        for index, cell in enumerate(self._empty_cells):
+            self._empty_index[cell] = index
+
+    def _fill_cell(self, cell):
+        """
+        空格被填上数字：用列表末尾的空格顶替它的位置，O(1)
+        :param cell: int 格子编号
+        :return:
+        """
+        index = self._empty_index[cell]
+        last = self._empty_cells.pop()
+        if last != cell:
+            self._empty_cells[index] = last
+            self._empty_index[last] = index
+        self._empty_index[cell] = -1
+
+    def _clear_cell(self, cell):
+        """
+        格子变为空格：追加到列表末尾，O(1)
+        :param cell: int 格子编号
+        :return:
+        """
+        self._empty_index[cell] = len(self._empty_cells)
+        self._empty_cells.append(cell)
+
+    def add_random_number(self):
+        """
+        从空闲列表中随机选择一个空格添加数字
+        :return: (int, int) 添加数字的位置，没有空格时返回None
+        """
+        if self._empty_cells:
+            cell = self.rng.choice(self._empty_cells)
+            i, j = divmod(cell, self.grid_size)
+            # 与rng.choices([2, 4], weights=(0.9, 0.1))使用的随机数完全相同，但不需要每次构造累计权重
+            value = 2 if self.rng.random() < 0.9 else 4
+            self._grid[i][j] = value
+            self._fill_cell(cell)
+            self.mergeable_pairs += self._count_pairs(i, j, value)
+            if value > self.max_tile:
+                self.max_tile = value
+            return i, j
+        return None
+
+    def reset(self, seed=None):
         """
         重置游戏状态
+        :param seed: int 本局的种子，为None时从种子序列中取下一个
         :return:
         """
+        self.seed = seed if seed is not None else self.seed_sequence.getrandbits(32)
+        self.rng.seed(self.seed)
         self.grid = [[0 for _ in range(self.grid_size)] for _ in range(self.grid_size)]
         self.score = 0
+        self.moves = 0
         self.add_random_number()
         self.add_random_number()
+        self.changed_cells = [(i, j) for i in range(self.grid_size) for j in range(self.grid_size)]
 
-    def move_left(self):
+    _lines_cache = {}  # 网格大小 -> 坐标线表
+    _all_cells_cache = {}  # 网格大小 -> 所有格子的坐标列表，fast_move之后作为changed_cells，只读
+
+    def _build_lines(self):
         """
-        向左移动
+        预先计算每个方向上需要处理的格子坐标，每条线按移动方向从前到后排列，结果按网格大小缓存在类属性中
+        :return: dict 方向 -> 坐标线元组
+        """
+        n = self.grid_size
+        lines = Model._lines_cache.get(n)
+        if lines is None:
+            lines = Model._lines_cache[n] = {
+                "left": tuple(tuple((i, j) for j in range(n)) for i in range(n)),
+                "right": tuple(tuple((i, j) for j in range(n - 1, -1, -1)) for i in range(n)),
+                "up": tuple(tuple((i, j) for i in range(n)) for j in range(n)),
+                "down": tuple(tuple((i, j) for i in range(n - 1, -1, -1)) for j in range(n)),
+            }
+        return lines
+
+    def place_number(self, i, j, value):
+        """
+        在指定的格子上放置数字，用于按记录恢复对局
+        :param i: int 行
+        :param j: int 列
+        :param value: int 数字
         :return:
         """
-        for row in self.grid:
-            last_non_zero = -1
-            for i in range(self.grid_size):
-                # 将非零数字向左移动
-                if row[i] != 0:
-                    if i != last_non_zero + 1:
-                        row[last_non_zero + 1] = row[i]
-                        row[i] = 0
-                    last_non_zero += 1
-            # 合并相邻的相同数字
-            i = 0
-            while i < last_non_zero:
-                if row[i] == row[i + 1]:
-                    row[i], row[i + 1] = row[i] * 2, 0
-                    self.score += row[i]
-                    i += 2
+        old = self._grid[i][j]
+        if old:
+            self.mergeable_pairs -= self._count_pairs(i, j, old)
+        self._grid[i][j] = value
+        if value:
+            self.mergeable_pairs += self._count_pairs(i, j, value)
+            if value > self.max_tile:
+                self.max_tile = value
+        if not old and value:
+            self._fill_cell(i * self.grid_size + j)
+        elif old and not value:
+            self._clear_cell(i * self.grid_size + j)
+
+    def restore(self, grid, score, moves=0):
+        """
+        恢复到指定的局面，所有格子都需要刷新
+        :param grid: list 二维列表
+        :param score: int 当前得分
+        :param moves: int 到这个局面为止的有效移动次数
+        :return:
+        """
+        self.grid = [list(row) for row in grid]
+        self.score = score
+        self.moves = moves
+        if self.score > self.highest_score:
+            self.highest_score = self.score
+        self.last_move_direction = None
+        self.changed_cells = [(i, j) for i in range(self.grid_size) for j in range(self.grid_size)]
+
+    def move(self, direction, spawn=None):
+        """
+        按方向移动
+        :param direction: str 移动方向，"left"、"right"、"up"或"down"
+        :param spawn: (int, int, int) 指定移动后添加的数字(i, j, 数字)，为None时随机添加
+        :return: MoveResult 本次移动的结果
+        """
+        return self._move(direction, spawn)
+
+    def fast_move(self, direction):
+        """
+        只移动不生成MoveResult的快速路径，用于重放和模拟：不记录移动轨迹、合并的格子和逐个变化的格子，
+        有效移动之后changed_cells为所有格子；网格、空闲列表、得分等状态和随机数的使用方式与move完全相同
+        :param direction: str 移动方向
+        :return: bool 是否为有效移动
+        """
+        grid = self._grid
+        n = self.grid_size
+        neighbors = self._neighbors
+        changed = False
+        gained = 0
+        top = self.max_tile
+        pairs = 0
+        for line in self._lines[direction]:
+            values = [grid[i][j] for i, j in line if grid[i][j]]
+            new_values = []
+            k = 0
+            while k < len(values):
+                value = values[k]
+                if k + 1 < len(values) and value == values[k + 1]:
+                    value *= 2
+                    gained += value
+                    if value > top:
+                        top = value
+                    k += 2
                 else:
-                    i += 1
-            # 再将非零数字向左移动
-            last_non_zero = -1
-            for i in range(self.grid_size):
-                if row[i] != 0:
-                    if i != last_non_zero + 1:
-                        row[last_non_zero + 1] = row[i]
-                        row[i] = 0
-                    last_non_zero += 1
-        # 添加一个随机数字
+                    k += 1
+                new_values.append(value)
+            new_values.extend([0] * (len(line) - len(new_values)))
+            for (i, j), new in zip(line, new_values):
+                old = grid[i][j]
+                if old != new:
+                    if old:
+                        for x, y in neighbors[i * n + j]:
+                            if grid[x][y] == old:
+                                pairs -= 1
+                    grid[i][j] = new
+                    if new:
+                        for x, y in neighbors[i * n + j]:
+                            if grid[x][y] == new:
+                                pairs += 1
+                    changed = True
+                    if not old:
+                        self._fill_cell(i * n + j)
+                    elif not new:
+                        self._clear_cell(i * n + j)
+
+        if not changed:
+            self.changed_cells = []
+            return False
+        self.score += gained
+        self.mergeable_pairs += pairs
+        self.max_tile = top
         self.add_random_number()
+        cells = Model._all_cells_cache.get(n)
+        if cells is None:
+            cells = Model._all_cells_cache[n] = [(i, j) for i in range(n) for j in range(n)]
+        self.changed_cells = cells
+        if self.score > self.highest_score:
+            self.highest_score = self.score
+        self.last_move_direction = direction
+        self.moves += 1
+        return True
+
+    def _move(self, direction, spawn=None):
+        """
+        按方向移动网格并合并数字，直接在原网格上修改，只写入发生变化的格子，
+        同时按写入的顺序更新空闲列表，并更新可以合并的相邻数对数量和最大数字
+        没有任何数字移动或合并时不添加随机数字，也不更新last_move_direction
+        :param direction: str 移动方向
+        :param spawn: (int, int, int) 指定移动后添加的数字，为None时随机添加
+        :return: MoveResult 本次移动的结果
+        """
+        grid = self._grid
+        n = self.grid_size
+        changed_cells = []
+        movements = []
+        merged_cells = []
+        gained = 0
+        top = self.max_tile
+        neighbors = self._neighbors
+        pairs = 0
+        for line in self._lines[direction]:
+            # 记录每个非零数字在线上的下标，用于计算移动轨迹
+            tiles = [(k, grid[i][j]) for k, (i, j) in enumerate(line) if grid[i][j] != 0]
+            new_values = []
+            k = 0
+            while k < len(tiles):
+                target = len(new_values)
+                if k + 1 < len(tiles) and tiles[k][1] == tiles[k + 1][1]:
+                    # 相邻的相同数字合并，每个数字一次移动中最多合并一次
+                    value = tiles[k][1]
+                    new_values.append(value * 2)
+                    gained += value * 2
+                    if value * 2 > top:
+                        top = value * 2
+                    merged_cells.append(line[target])
+                    for source, _ in (tiles[k], tiles[k + 1]):
+                        if source != target:
+                            movements.append((line[source], line[target], value))
+                    k += 2
+                else:
+                    source, value = tiles[k]
+                    new_values.append(value)
+                    if source != target:
+                        movements.append((line[source], line[target], value))
+                    k += 1
+            new_values.extend([0] * (len(line) - len(new_values)))
+            for (i, j), new in zip(line, new_values):
+                old = grid[i][j]
+                if old != new:
+                    # 先去掉旧数字组成的数对，写入后再加上新数字组成的数对（与_count_pairs相同，展开以减少方法调用）
+                    if old:
+                        for x, y in neighbors[i * n + j]:
+                            if grid[x][y] == old:
+                                pairs -= 1
+                    grid[i][j] = new
+                    if new:
+                        for x, y in neighbors[i * n + j]:
+                            if grid[x][y] == new:
+                                pairs += 1
+                    changed_cells.append((i, j))
+                    if not old:
+                        self._fill_cell(i * n + j)
+                    elif not new:
+                        self._clear_cell(i * n + j)
+
+        if not changed_cells:
+            self.changed_cells = []
+            return MoveResult(direction, False)
+
+        self.score += gained
+        self.mergeable_pairs += pairs
+        self.max_tile = top
+        # 添加一个随机数字
+        if spawn is None:
+            position = self.add_random_number()
+            if position is not None:
+                spawn = (position[0], position[1], grid[position[0]][position[1]])
+        else:
+            self.place_number(*spawn)
+        if spawn is not None:
+            changed_cells.append((spawn[0], spawn[1]))
+        self.changed_cells = changed_cells
         # 检查并更新最高得分
         if self.score > self.highest_score:
             self.highest_score = self.score
-        self.last_move_direction = "left"  # 更新上一次的移动方向，本来用于view层更新动画的
+        self.last_move_direction = direction  # 更新上一次的移动方向，用于view层更新动画
+        self.moves += 1
+        return MoveResult(direction, True, gained, merged_cells, movements, spawn)
+
+    def move_left(self):
+        """
+        向左移动
+        :return: MoveResult 本次移动的结果
+        """
+        return self._move("left")
 
     def move_right(self):
-        # 先翻转再移动再翻转回来
-        self.grid = [row[::-1] for row in self.grid]
-        self.move_left()
-        self.grid = [row[::-1] for row in self.grid]
-        self.last_move_direction = "right"
+        return self._move("right")
 
     def move_up(self):
-        # 先转置再移动再转置回来
-        self.grid = [list(x) for x in zip(*self.grid)]
-        self.move_left()
-        self.grid = [list(x) for x in zip(*self.grid)]
-        self.last_move_direction = "up"
+        return self._move("up")
 
     def move_down(self):
-        # 先转置再翻转再移动再翻转再转置回来
-        self.grid = [list(x) for x in zip(*self.grid[::-1])]
-        self.move_left()
-        self.grid = [list(x) for x in zip(*self.grid)][::-1]
-        self.last_move_direction = "down"
+        return self._move("down")
 
     def save_highest_score(self, filename="./2048_set.json"):
         """
-        将最高分进行存储
+        将最高分进行存储，先写入临时文件再替换，写入中途崩溃也不会破坏原文件
         :param filename:默认路径./2048_set.json"
         :return:
         """
         data = {'highest_score': self.highest_score}
-        with open(filename, 'w') as f:
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, 'w') as f:
             json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
 
-    def load_highest_score(self, filename="./2048_set.json"):
+    @staticmethod
+    def read_highest_score(filename="./2048_set.json"):
         """
-        从文件中读取之前最高分数
+        读取文件中保存的最高分数，不修改Model，可以在后台线程中调用
         :param filename:默认路径./2048_set.json"
-        :return:
+        :return: int 最高分数，文件不存在时返回0
         """
         try:
             with open(filename, 'r') as f:
                 data = json.load(f)
-                self.highest_score = data['highest_score']
+                return data['highest_score']
         except FileNotFoundError:
-            pass
+            return 0
+
+    def load_highest_score(self, filename="./2048_set.json"):
+        """
+        从文件中读取之前最高分数，与当前的最高分数取较大值（读取之前本局可能已经超过了文件中的分数）
+        :param filename:默认路径./2048_set.json"
+        :return:
+        """
+        self.merge_highest_score(self.read_highest_score(filename))
+
+    def merge_highest_score(self, score):
+        """
+        合并从其他地方读取到的最高分数
+        :param score: int 最高分数
+        :return:
+        """
+        if score > self.highest_score:
+            self.highest_score = score
 
     def check_win(self):
         """
-        检查是否有任何一个格子的数字等于2048
+        检查是否已经出现2048，最大数字是增量维护的，O(1)
         :return:
         """
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                if self.grid[i][j] == 2048:
-                    return True
-        return False
+        return self.max_tile >= WIN_TILE
 
     def check_lost(self):
         """
-        检查是否有任何一个格子为空或者相邻的格子有相同的数字
+        检查是否没有空格并且没有可以合并的相邻数字，空格数和数对数量都是增量维护的，O(1)
         :return:
         """
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                if self.grid[i][j] == 0:
-                    return False
-                if j < self.grid_size - 1 and self.grid[i][j] == self.grid[i][j + 1]:
-                    return False
-                if i < self.grid_size - 1 and self.grid[i][j] == self.grid[i + 1][j]:
-                    return False
-        return True
+        return not self._empty_cells and not self.mergeable_pairs
+
+    def canonical(self):
+        """
+        当前局面在8种对称变换（旋转和翻转）下的规范键，对称的局面得到相同的键，可以作为缓存和统计的键
+        4x4的局面（数字不超过32768）的键为规范形式的位棋盘（int），与BitboardModel.canonical的结果相同；
+        其他大小的网格的键为规范形式的pack_grid字节串（bytes），见Model.symmetry.canonical_key
+        :return: (int或bytes, int) 规范键和所用的变换编号，方向用Model.symmetry.to_canonical_direction转换
+        """
+        from Model.symmetry import canonical_key  # symmetry依赖bitboard，bitboard又依赖本模块
+        return canonical_key(self._grid)
 
 
 # 代码测试部分
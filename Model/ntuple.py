@@ -0,0 +1,359 @@
+"""
+ntuple.py
+==========
+
+n-tuple网络局面评估和时序差分（TD）学习，训练好的网络估值一个局面只需要几十次查表，可以直接用来走棋。
+
+- 网络由若干个格子组合（n-tuple）组成，每个组合在棋盘的8种对称变换（旋转、翻转）下共用一张查找表，
+  表的下标是这几个格子上数字的指数（每个格子4位），局面的估值是所有组合在所有对称变换下查到的权重之和；
+- 走棋时对每个有效方向计算"得分 + 移动之后、添加数字之前的局面（afterstate）的估值"，选择最大的方向，
+  不需要展开随机数字，因此每秒可以走数千步；
+- TDTrainer使用BatchModel同时进行一批对局（移动和添加数字的规则与Model一致），
+  每一步用NumPy一次计算整批局面所有方向的估值，整批的TD(0)误差按权重取平均后一次更新；
+- 权重文件由文件头、组合列表和连续的float32权重组成，load通过numpy.memmap映射权重，
+  只读映射在多个进程之间共享同一份页缓存，加载几百MB的网络也不需要读入整个文件。
+
+依赖NumPy，只有使用本模块时才需要安装。
+
+命令行用法：python -m Model.ntuple --games 100000 --batch 512 [--weights ./2048_ntuple.weights] [--patterns 6-tuple]
+训练好的网络可以用 python -m Model.selfplay --policy ntuple 评测。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from Model.batch import BatchModel, slide_boards
+from Model.bitboard import encode_grid, execute_move
+from Model.model import DIRECTIONS
+
+MAGIC = b"2048NTN\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")  # 魔数、版本、组合数、保留
+PATTERN = struct.Struct("<16B")  # 一个组合的格子编号，不足16个时用NO_CELL补齐
+NO_CELL = 255
+
+DEFAULT_WEIGHTS = "./2048_ntuple.weights"
+
+# 格子编号为i * 4 + j，与位棋盘中格子的顺序相同
+PATTERNS = {
+    # 外侧和内侧的一行，角上、边上和中间的2x2方块，共5x65536个权重，训练很快
+    "4-tuple": ((0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), (1, 2, 5, 6), (5, 6, 9, 10)),
+    # 常用的4个6格组合，共4x16777216个权重（256MB），需要更多对局才能训练充分
+    "6-tuple": ((0, 1, 2, 3, 4, 5), (4, 5, 6, 7, 8, 9), (0, 1, 2, 4, 5, 6), (4, 5, 6, 8, 9, 10)),
+}
+DEFAULT_PATTERNS = "4-tuple"
+
+
+def _symmetric_cells(cells):
+    """
+    一个组合在8种对称变换下对应的格子
+    :param cells: tuple 格子编号
+    :return: list 8个格子编号的元组
+    """
+    result = []
+    for mirror in (False, True):
+        for rotation in range(4):
+            transformed = []
+            for cell in cells:
+                i, j = divmod(cell, 4)
+                if mirror:
+                    j = 3 - j
+                for _ in range(rotation):
+                    i, j = j, 3 - i
+                transformed.append(i * 4 + j)
+            result.append(tuple(transformed))
+    return result
+
+
+class NTupleNetwork:
+    def __init__(self, patterns=PATTERNS[DEFAULT_PATTERNS], weights=None):
+        """
+        :param patterns: 格子组合的列表
+        :param weights: np.ndarray 所有组合的float32权重首尾相接，为None时全部初始化为0
+        """
+        self.patterns = tuple(tuple(cells) for cells in patterns)
+        self.offsets = []  # 每个组合的查找表在weights中的起始位置
+        self.size = 0
+        for cells in self.patterns:
+            if not 0 < len(cells) <= 8 or any(not 0 <= cell < 16 for cell in cells):
+                raise ValueError(f"无效的格子组合：{cells}")
+            self.offsets.append(self.size)
+            self.size += 16 ** len(cells)
+        if weights is None:
+            weights = np.zeros(self.size, dtype=np.float32)
+        if weights.shape != (self.size,) or weights.dtype != np.float32:
+            raise ValueError(f"权重应为{self.size}个float32，实际为{weights.shape} {weights.dtype}")
+        self.weights = weights
+
+        # 逐个局面估值时使用：每个特征为(起始位置, 倒序的格子编号)，倒序是为了从最高的4位开始拼接下标
+        self.features = []
+        # 批量估值时使用：每个组合一项(起始位置, (8, n)的格子编号, 每个格子的权值16**k)
+        self.groups = []
+        for offset, cells in zip(self.offsets, self.patterns):
+            symmetric = _symmetric_cells(cells)
+            for transformed in symmetric:
+                self.features.append((offset, transformed[::-1]))
+            self.groups.append((offset, np.array(symmetric, dtype=np.intp),
+                                16 ** np.arange(len(cells), dtype=np.int64)))
+        self.feature_count = len(self.features)
+        self._view = memoryview(self.weights)  # 按下标读取时直接得到Python的float
+
+    def value(self, board):
+        """
+        估值一个位棋盘
+        :param board: int 位棋盘
+        :return: float 估值
+        """
+        weights = self._view
+        exponents = [(board >> shift) & 0xF for shift in range(0, 64, 4)]
+        total = 0.0
+        for offset, cells in self.features:
+            index = 0
+            for cell in cells:
+                index = (index << 4) | exponents[cell]
+            total += weights[offset + index]
+        return total
+
+    def score_moves(self, model):
+        """
+        计算每个有效方向的"得分 + afterstate的估值"
+        :param model: Model（4x4）、BitboardModel或者位棋盘
+        :return: dict 方向 -> 估值，无效移动不在结果中
+        """
+        if isinstance(model, int):
+            board = model
+        else:
+            board = model.board if hasattr(model, "board") else encode_grid(model.grid)
+        scores = {}
+        for direction in DIRECTIONS:
+            new_board, score = execute_move(board, direction)
+            if new_board != board:
+                scores[direction] = score + self.value(new_board)
+        return scores
+
+    def best_move(self, model):
+        """
+        :param model: Model（4x4）、BitboardModel或者位棋盘
+        :return: str 估值最大的方向；没有可移动的方向时返回None
+        """
+        scores = self.score_moves(model)
+        if not scores:
+            return None
+        return max(scores, key=scores.get)
+
+    def feature_indices(self, boards):
+        """
+        计算一批局面的全部特征在weights中的下标
+        :param boards: np.ndarray (N, 4, 4)的指数数组
+        :return: np.ndarray (N, 特征数)的下标
+        """
+        flat = boards.reshape(len(boards), 16).astype(np.int64)
+        return np.concatenate([flat[:, cells] @ powers + offset for offset, cells, powers in self.groups], axis=1)
+
+    def evaluate(self, boards):
+        """
+        批量估值
+        :param boards: np.ndarray (N, 4, 4)的指数数组
+        :return: np.ndarray (N,)的估值
+        """
+        return self.weights[self.feature_indices(boards)].sum(axis=1, dtype=np.float64)
+
+    def save(self, path=DEFAULT_WEIGHTS):
+        """
+        把网络写入文件（先写临时文件再替换，正在被映射的旧文件不受影响）
+        :param path: str 文件路径
+        :return:
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.patterns), 0))
+            for cells in self.patterns:
+                f.write(PATTERN.pack(*cells, *[NO_CELL] * (16 - len(cells))))
+            f.write(memoryview(np.ascontiguousarray(self.weights)).cast("B"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_WEIGHTS, mode="r"):
+        """
+        通过内存映射加载网络
+        :param path: str 文件路径
+        :param mode: str numpy.memmap的模式，"r"为只读（用于走棋），"c"为写时复制（用于在已有的网络上继续训练）
+        :return: NTupleNetwork
+        """
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path}不是n-tuple网络文件")
+            magic, version, count, _ = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}不是版本{VERSION}的n-tuple网络文件")
+            patterns = [tuple(cell for cell in PATTERN.unpack(f.read(PATTERN.size)) if cell != NO_CELL)
+                        for _ in range(count)]
+        size = sum(16 ** len(cells) for cells in patterns)
+        offset = HEADER.size + PATTERN.size * count
+        if os.path.getsize(path) != offset + 4 * size:
+            raise ValueError(f"{path}的长度与组合不符")
+        weights = np.memmap(path, dtype=np.float32, mode=mode, offset=offset, shape=(size,))
+        return cls(patterns, weights)
+
+
+class TDTrainer:
+    """
+    用afterstate上的TD(0)批量训练NTupleNetwork
+
+    每一批同时进行batch_size局，结束的对局立即在原位置开始新的一局，每一步对整批局面：
+    选出估值最大的方向，用"本步得分 + 新afterstate的估值"（游戏结束时为0）作为上一个afterstate的目标值，
+    把误差乘以学习率（平均分到每个特征上）加到权重，再执行移动和添加数字。
+    """
+
+    def __init__(self, network, batch_size=256, alpha=0.1, seed=None):
+        """
+        :param network: NTupleNetwork 被训练的网络，权重必须可写
+        :param batch_size: int 同时进行的对局数
+        :param alpha: float 学习率
+        :param seed: int 随机种子
+        """
+        self.network = network
+        self.alpha = alpha
+        self.batch = BatchModel(batch_size, seed)
+        self.batch.reset()
+        self.previous = np.zeros((batch_size, network.feature_count), dtype=np.int64)  # 上一个afterstate的特征
+        self.has_previous = np.zeros(batch_size, dtype=bool)
+        self.moves = np.zeros(batch_size, dtype=np.int64)  # 每局的移动次数
+        self.games = 0  # 已经结束的对局数
+        self.total_moves = 0
+        self.results = []  # 结束的对局(得分, 最大数字, 移动次数)，由调用方取走
+
+    def step(self):
+        """
+        整批对局各走一步并更新权重
+        :return: int 本步结束的对局数
+        """
+        network = self.network
+        weights = network.weights
+        batch = self.batch
+        boards = batch.boards
+        count = len(boards)
+
+        best_value = np.full(count, -np.inf)
+        best_reward = np.zeros(count, dtype=np.int64)
+        best_boards = boards
+        best_features = self.previous
+        for direction in DIRECTIONS:
+            after, reward, changed = slide_boards(boards, direction)
+            features = network.feature_indices(after)
+            value = np.where(changed, reward + weights[features].sum(axis=1, dtype=np.float64), -np.inf)
+            better = value > best_value
+            best_value = np.where(better, value, best_value)
+            best_reward = np.where(better, reward, best_reward)
+            best_boards = np.where(better[:, None, None], after, best_boards)
+            best_features = np.where(better[:, None], features, best_features)
+        terminal = best_value == -np.inf
+
+        # 上一个afterstate的TD误差，使用当前的权重重新估值
+        rows = np.nonzero(self.has_previous)[0]
+        if len(rows):
+            previous = self.previous[rows]
+            target = np.where(terminal[rows], 0.0, best_value[rows])
+            error = target - weights[previous].sum(axis=1, dtype=np.float64)
+            # 同一个权重可能被整批中的很多局面用到（尤其是开局），取这些误差的平均值，
+            # 否则一步的更新量会随批大小成倍放大而发散
+            indices, inverse, counts = np.unique(previous.ravel(), return_inverse=True, return_counts=True)
+            totals = np.bincount(inverse, weights=np.repeat(error, previous.shape[1]), minlength=len(indices))
+            weights[indices] += (self.alpha / network.feature_count * totals / counts).astype(np.float32)
+
+        alive = ~terminal
+        batch.boards = best_boards
+        batch.scores += best_reward
+        batch.add_random_number(alive)
+        self.previous = best_features
+        self.has_previous = alive
+        self.moves += alive
+        self.total_moves += int(alive.sum())
+
+        finished = np.nonzero(terminal)[0]
+        if len(finished):
+            boards = batch.boards
+            for row in finished:
+                self.results.append((int(batch.scores[row]), 1 << int(boards[row].max()), int(self.moves[row])))
+            boards[finished] = 0
+            batch.scores[finished] = 0
+            self.moves[finished] = 0
+            batch.add_random_number(terminal)
+            batch.add_random_number(terminal)
+            self.games += len(finished)
+        return len(finished)
+
+    def train(self, games, report_every=1000, on_report=None):
+        """
+        训练到再结束games局为止
+        :param games: int 对局数
+        :param report_every: int 每结束多少局调用一次on_report
+        :param on_report: 回调函数，参数为report()的结果
+        :return:
+        """
+        target = self.games + games
+        next_report = self.games + report_every
+        while self.games < target:
+            self.step()
+            if self.games >= next_report:
+                next_report += report_every
+                if on_report is not None:
+                    on_report(self.report())
+
+    def report(self):
+        """
+        汇总上一次report之后结束的对局，并清空results
+        :return: dict 统计信息
+        """
+        results, self.results = self.results, []
+        report = {"games": self.games, "total_moves": self.total_moves, "recent_games": len(results)}
+        if results:
+            scores = [result[0] for result in results]
+            report["mean_score"] = sum(scores) / len(scores)
+            report["max_score"] = max(scores)
+            report["rate_2048"] = sum(result[1] >= 2048 for result in results) / len(results)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用TD学习训练2048的n-tuple网络")
+    parser.add_argument("--games", type=int, default=10000, help="训练的对局数")
+    parser.add_argument("--batch", type=int, default=256, help="同时进行的对局数")
+    parser.add_argument("--alpha", type=float, default=0.1, help="学习率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="权重文件，已经存在时在其基础上继续训练")
+    parser.add_argument("--patterns", choices=sorted(PATTERNS), default=DEFAULT_PATTERNS, help="新建网络时的格子组合")
+    parser.add_argument("--report-every", type=int, default=1000, help="每结束多少局输出一次统计并保存权重")
+    args = parser.parse_args()
+
+    if os.path.exists(args.weights):
+        network = NTupleNetwork.load(args.weights, mode="c")
+    else:
+        network = NTupleNetwork(PATTERNS[args.patterns])
+    trainer = TDTrainer(network, args.batch, args.alpha, args.seed)
+    start = time.perf_counter()
+
+    def on_report(report):
+        elapsed = time.perf_counter() - start
+        report["moves_per_sec"] = trainer.total_moves / elapsed if elapsed > 0 else 0.0
+        print(json.dumps(report))
+        network.save(args.weights)
+
+    trainer.train(args.games, args.report_every, on_report)
+    network.save(args.weights)
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+replay.py
+==========
+
+对局重放：Model的每一局都有自己的种子，并且使用独立的随机数生成器，因此(种子, 移动序列)就能完整重现一局游戏。
+
+- replay: 从(种子, 移动序列)直接计算出最终局面
+- Replayer: 逐步重放，每一步可以通过on_step回调刷新界面；fast_forward快进时不调用回调、不计算移动轨迹，
+  默认使用BitboardModel，每秒可以重放数万步，用于调试线上记录的对局和回归检查
+
+移动序列中的每一项可以是方向字符串（"left"、"right"、"up"、"down"），也可以是0~3的方向编号。
+
+本模块以包的形式导入Model.bitboard，需要在项目根目录下用 python -m Model.replay 运行下面的测试代码
+（直接运行 python Model/replay.py 时找不到Model包）。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+from Model.bitboard import BitboardModel
+from Model.model import DIRECTIONS
+
+
+def _direction(move):
+    return DIRECTIONS[move] if isinstance(move, int) else move
+
+
+class Replayer:
+    def __init__(self, seed, moves, model=None, on_step=None):
+        """
+        :param seed: int 对局的种子
+        :param moves: list 移动序列
+        :param model: Model 用于重放的模型，默认为新建的BitboardModel（不读取最高分文件）
+        :param on_step: 每重放一步后调用的回调函数，参数为MoveResult
+        """
+        self.seed = seed
+        self.moves = [_direction(move) for move in moves]
+        self.model = model if model is not None else BitboardModel(load_score=False)
+        self.on_step = on_step
+        self.position = 0  # 已经重放的步数
+        self.model.reset(seed)
+
+    def done(self):
+        return self.position >= len(self.moves)
+
+    def step(self):
+        """
+        重放下一步，并调用on_step回调
+        :return: MoveResult 移动的结果，已经重放完时返回None
+        """
+        if self.done():
+            return None
+        result = self.model.move(self.moves[self.position])
+        self.position += 1
+        if self.on_step is not None:
+            self.on_step(result)
+        return result
+
+    def fast_forward(self, count=None):
+        """
+        快进，不调用on_step回调也不计算移动轨迹
+        :param count: int 快进的步数，为None时快进到结尾
+        :return: int 实际快进的步数
+        """
+        end = len(self.moves) if count is None else min(len(self.moves), self.position + count)
+        fast_move = self.model.fast_move
+        moves = self.moves
+        for index in range(self.position, end):
+            fast_move(moves[index])
+        done = end - self.position
+        self.position = end
+        # 快进跳过了界面刷新，之后需要整体刷新
+        size = self.model.grid_size
+        self.model.changed_cells = [(i, j) for i in range(size) for j in range(size)]
+        return done
+
+    def seek(self, position):
+        """
+        跳转到第position步之后的局面，向后跳转时从头重新快进
+        :param position: int 目标步数
+        :return:
+        """
+        if position < self.position:
+            self.model.reset(self.seed)
+            self.position = 0
+        self.fast_forward(position - self.position)
+
+
+def replay(seed, moves, model=None):
+    """
+    从(种子, 移动序列)重现一局游戏
+    :param seed: int 对局的种子
+    :param moves: list 移动序列
+    :param model: Model 用于重放的模型，默认为新建的BitboardModel
+    :return: Model 重放后的模型
+    """
+    replayer = Replayer(seed, moves, model)
+    replayer.fast_forward()
+    return replayer.model
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    import random
+    import time
+
+    from Model.model import Model
+
+    original = Model(load_score=False)
+    original.reset()
+    history = []
+    while not original.check_lost():
+        direction = random.choice(DIRECTIONS)
+        if original.move(direction).changed:
+            history.append(direction)
+    start = time.perf_counter()
+    replayed = replay(original.seed, history)
+    elapsed = time.perf_counter() - start
+    print(replayed.grid == original.grid, replayed.score == original.score, f"{len(history) / elapsed:.0f} moves/s")
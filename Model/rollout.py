@@ -0,0 +1,382 @@
+"""
+rollout.py
+==========
+
+蒙特卡洛模拟（rollout）走法顾问，作为期望最大搜索之外的廉价选择：
+
+- 对当前局面的每个有效方向，从移动之后的局面开始用随机或贪心策略把游戏下完，取多局最终得分的平均值，
+  选择平均得分（加上这一步本身的得分）最高的方向；
+- 模拟以任务为单位（每个任务同一个方向若干局）分发到multiprocessing进程池，每个任务的种子由顾问的种子、
+  第几次决策、方向和这是该方向的第几个任务决定，同样的种子和同样的模拟次数得到同样的结果，
+  与进程数以及任务被分配到哪个进程无关；
+- 每个方向都完成了min_rollouts局之后，按平均值和标准误差逐步淘汰明显落后的方向（上界低于最好方向的下界），
+  只剩一个方向时提前结束；达到每个方向rollouts局或者用完时间预算（time_budget）时也立即结束（不使用进程池时
+  正在执行的任务无法中断，可能超出预算一个任务的时间）；
+- 时间预算从score_moves开始时计算，包括创建进程池的时间（可以用start或with语句提前创建）；
+- 决策结束时还在进程池中的任务通过共享的代数（multiprocessing.Value）得知自己已经过时，在当前这一局结束后直接返回，
+  它们的结果带着旧的代数，在之后的决策中到达时直接丢弃，不会阻塞等待；
+- last_stats记录每次决策的模拟局数、耗时、每秒模拟局数和每个方向的统计，用于按机器的核心数调整进程数。
+
+workers为0时在当前进程中模拟，不创建进程池。只支持4x4的网格。
+
+命令行用法：python -m Model.rollout --games 3 --workers 4 --policy random --budget 0.05
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+from Model.bitboard import BitboardModel, encode_grid, execute_move
+from Model.model import DIRECTIONS
+
+PLAYOUT_POLICIES = ("random", "greedy")
+
+_active_generation = None  # 进程池中每个进程持有的共享代数，与任务的代数不同时任务提前结束
+
+
+def _spawn(board, rng):
+    """
+    在位棋盘的随机空格上添加一个数字（2的概率为0.9，4的概率为0.1）
+    :param board: int 位棋盘
+    :param rng: random.Random 随机数生成器
+    :return: int 新的位棋盘，没有空格时不变
+    """
+    empty = [shift for shift in range(0, 64, 4) if not (board >> shift) & 0xF]
+    if not empty:
+        return board
+    return board | ((1 if rng.random() < 0.9 else 2) << rng.choice(empty))
+
+
+def playout(board, policy, rng, max_moves=10000):
+    """
+    从移动之后、添加数字之前的局面开始把游戏下完
+    :param board: int 位棋盘（afterstate）
+    :param policy: str "random"（在有效移动中随机选择）或"greedy"（选择得分最高的移动，得分相同时随机）
+    :param rng: random.Random 随机数生成器
+    :param max_moves: int 最多模拟的步数
+    :return: int 模拟过程中得到的分数
+    """
+    greedy = policy == "greedy"
+    score = 0
+    board = _spawn(board, rng)
+    for _ in range(max_moves):
+        best = None
+        best_key = -1.0
+        count = 0
+        for direction in DIRECTIONS:
+            new_board, gained = execute_move(board, direction)
+            if new_board == board:
+                continue
+            count += 1
+            if greedy:
+                key = gained + rng.random()  # 得分相同时随机选择
+            else:
+                key = rng.random()
+            if key > best_key:
+                best, best_key = (new_board, gained), key
+        if not count:
+            break
+        board = _spawn(best[0], rng)
+        score += best[1]
+    return score
+
+
+def _init_worker(active_generation):
+    """
+    进程池中每个进程的初始化函数
+    :param active_generation: multiprocessing.Value 顾问正在进行的决策的代数，没有正在进行的决策时为0
+    :return:
+    """
+    global _active_generation
+    _active_generation = active_generation
+
+
+def _rollout_task(task):
+    """
+    进程池中执行的任务：从同一个afterstate开始模拟若干局，所属的决策已经结束时不再开始新的一局
+    :param task: (位棋盘, 局数, 策略, 种子字符串, 最大步数, 代数)
+    :return: list 每一局得到的分数
+    """
+    board, count, policy, seed, max_moves, generation = task
+    rng = random.Random(seed)
+    scores = []
+    for _ in range(count):
+        if _active_generation is not None and _active_generation.value != generation:
+            break  # 结果会被丢弃，尽快把进程让给新的决策
+        scores.append(playout(board, policy, rng, max_moves))
+    return scores
+
+
+class _DirectionStats:
+    __slots__ = ("direction", "board", "reward", "count", "total", "total_squares", "active", "tasks")
+
+    def __init__(self, direction, board, reward):
+        self.direction = direction
+        self.board = board  # 这个方向移动之后的局面
+        self.reward = reward  # 这一步本身的得分
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.active = True  # 是否还在比较中（没有被淘汰）
+        self.tasks = 0  # 已经发出的任务数
+
+    def add(self, scores):
+        for score in scores:
+            self.count += 1
+            self.total += score
+            self.total_squares += score * score
+
+    @property
+    def mean(self):
+        return self.reward + self.total / self.count if self.count else float("-inf")
+
+    def bounds(self, z):
+        """
+        :param z: float 置信区间的宽度（标准误差的倍数）
+        :return: (float, float) 平均得分的置信下界和上界
+        """
+        mean = self.total / self.count
+        variance = max(0.0, self.total_squares / self.count - mean * mean)
+        error = z * math.sqrt(variance / self.count)
+        return self.reward + mean - error, self.reward + mean + error
+
+
+class RolloutAdvisor:
+    def __init__(self, workers=None, rollouts=64, policy="random", time_budget=0.05, batch_size=4,
+                 min_rollouts=8, z=2.0, max_moves=10000, seed=None):
+        """
+        :param workers: int 进程数，默认为CPU核心数，为0时在当前进程中模拟
+        :param rollouts: int 每个方向最多模拟的局数
+        :param policy: str 模拟时的走法策略，见PLAYOUT_POLICIES
+        :param time_budget: float 每次决策的时间预算（秒），为None时不限制
+        :param batch_size: int 每个任务模拟的局数，越小越容易在时间预算内结束
+        :param min_rollouts: int 每个方向至少模拟多少局才开始淘汰
+        :param z: float 淘汰时使用的置信区间宽度（标准误差的倍数）
+        :param max_moves: int 每一局最多模拟的步数
+        :param seed: int 随机种子，为None时每次运行都不同
+        """
+        if policy not in PLAYOUT_POLICIES:
+            raise ValueError(f"未知的模拟策略：{policy}，可选：{', '.join(PLAYOUT_POLICIES)}")
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.rollouts = rollouts
+        self.policy = policy
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.min_rollouts = min_rollouts
+        self.z = z
+        self.max_moves = max_moves
+        self.seed = random.randrange(1 << 32) if seed is None else seed
+        self.pool = None  # 第一次决策时才创建
+        self.active_generation = None  # 与进程池共享的当前决策的代数，随进程池一起创建
+        self.results = queue.Queue()  # 进程池的回调线程放入的(代数, 方向, 分数列表或异常)
+        self.outstanding = 0  # 已经发给进程池、结果还没有从results中取出的任务数（包括过时的任务）
+        self.generation = 0  # 每次决策加1，过时的结果被丢弃
+        self.last_stats = {}  # 上一次决策的统计
+        self.total_rollouts = 0
+        self.total_time = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        创建进程池（workers为0或者已经创建时不做任何事），否则第一次决策时创建，创建的时间计入那一次决策的预算
+        :return:
+        """
+        if self.workers and self.pool is None:
+            self.active_generation = multiprocessing.Value("q", 0, lock=False)
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                             initargs=(self.active_generation,))
+
+    def close(self):
+        """
+        结束进程池，正在执行的任务被丢弃
+        :return:
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.results = queue.Queue()  # 丢弃已经返回但还没有取出的结果
+            self.outstanding = 0
+
+    def _submit(self, stats):
+        """
+        为一个方向发出一个模拟任务
+        :param stats: _DirectionStats 方向的统计
+        :return:
+        """
+        stats.tasks += 1
+        seed = f"{self.seed}:{self.generation}:{stats.direction}:{stats.tasks}"
+        task = (stats.board, self.batch_size, self.policy, seed, self.max_moves, self.generation)
+        generation, direction = self.generation, stats.direction
+        if self.pool is None:
+            self.results.put((generation, direction, _rollout_task(task)))
+            return
+        self.outstanding += 1
+        self.pool.apply_async(_rollout_task, (task,),
+                              callback=lambda scores: self.results.put((generation, direction, scores)),
+                              error_callback=lambda error: self.results.put((generation, direction, error)))
+
+    def _eliminate(self, candidates):
+        """
+        淘汰上界低于最好方向下界的方向
+        :param candidates: list 所有方向的统计
+        :return:
+        """
+        active = [stats for stats in candidates if stats.active]
+        if any(stats.count < self.min_rollouts for stats in active):
+            return
+        bounds = {stats.direction: stats.bounds(self.z) for stats in active}
+        best_lower = max(lower for lower, _ in bounds.values())
+        for stats in active:
+            if bounds[stats.direction][1] < best_lower:
+                stats.active = False
+
+    def score_moves(self, model):
+        """
+        模拟每个有效方向，返回平均得分（包括这一步本身的得分）
+        :param model: Model（4x4）、BitboardModel或者位棋盘
+        :return: dict 方向 -> 平均得分，无效移动不在结果中；时间预算内没有完成任何模拟的方向为这一步的得分
+        """
+        start = time.perf_counter()
+        deadline = start + self.time_budget if self.time_budget is not None else None
+        if isinstance(model, int):
+            board = model
+        else:
+            board = model.board if hasattr(model, "board") else encode_grid(model.grid)
+        self.start()
+        self.generation += 1
+        stale_tasks = self.outstanding  # 上一次决策留在进程池中的任务，结果到达时丢弃
+        if self.active_generation is not None:
+            self.active_generation.value = self.generation
+        candidates = []
+        for direction in DIRECTIONS:
+            new_board, reward = execute_move(board, direction)
+            if new_board != board:
+                candidates.append(_DirectionStats(direction, new_board, reward))
+
+        reason = "single_move" if len(candidates) <= 1 else "completed"
+        if len(candidates) > 1:
+            in_flight = 0
+            pending = {stats.direction: 0 for stats in candidates}  # 每个方向已经发出但还没有返回的局数
+            by_direction = {stats.direction: stats for stats in candidates}
+            limit = max(1, 2 * self.workers)  # 同时等待的任务数
+            while True:
+                # 轮流为还在比较中、还没有发满的方向发出任务
+                for stats in candidates:
+                    if in_flight >= limit:
+                        break
+                    if stats.active and stats.count + pending[stats.direction] < self.rollouts:
+                        self._submit(stats)
+                        pending[stats.direction] += self.batch_size
+                        in_flight += 1
+                if not in_flight:
+                    break
+                timeout = None if deadline is None else deadline - time.perf_counter()
+                if timeout is not None and timeout <= 0:
+                    reason = "time_budget"
+                    break
+                try:
+                    generation, direction, scores = self.results.get(timeout=timeout)
+                except queue.Empty:
+                    reason = "time_budget"
+                    break
+                if self.pool is not None:
+                    self.outstanding -= 1
+                if generation != self.generation:
+                    continue  # 上一次决策剩下的结果
+                if isinstance(scores, BaseException):
+                    raise scores
+                in_flight -= 1
+                pending[direction] -= self.batch_size
+                by_direction[direction].add(scores)
+                self._eliminate(candidates)
+                if sum(stats.active for stats in candidates) == 1:
+                    reason = "early_stop"
+                    break
+
+        if self.active_generation is not None:
+            self.active_generation.value = 0  # 还在进程池中的任务在当前这一局结束后返回
+        elapsed = time.perf_counter() - start
+        rollouts = sum(stats.count for stats in candidates)
+        self.total_rollouts += rollouts
+        self.total_time += elapsed
+        self.last_stats = {
+            "rollouts": rollouts,
+            "elapsed": elapsed,
+            "rollouts_per_sec": rollouts / elapsed if elapsed > 0 else 0.0,
+            "stop_reason": reason,
+            "stale_tasks": stale_tasks,
+            "workers": self.workers,
+            "directions": {stats.direction: {"count": stats.count, "mean": stats.mean if stats.count else None,
+                                             "active": stats.active} for stats in candidates},
+        }
+        # 被淘汰的方向不参与最后的比较，没有任何模拟结果的方向按这一步的得分比较
+        if any(stats.count for stats in candidates):
+            return {stats.direction: stats.mean for stats in candidates if stats.active and stats.count}
+        return {stats.direction: float(stats.reward) for stats in candidates}
+
+    def best_move(self, model):
+        """
+        :param model: Model（4x4）、BitboardModel或者位棋盘
+        :return: str 平均得分最高的方向；没有可移动的方向时返回None
+        """
+        scores = self.score_moves(model)
+        if not scores:
+            return None
+        return max(scores, key=scores.get)
+
+    def stats(self):
+        """
+        :return: dict 所有决策累计的模拟局数、耗时和每秒模拟局数
+        """
+        return {
+            "rollouts": self.total_rollouts,
+            "elapsed": self.total_time,
+            "rollouts_per_sec": self.total_rollouts / self.total_time if self.total_time > 0 else 0.0,
+            "workers": self.workers,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用蒙特卡洛模拟顾问完成若干局2048")
+    parser.add_argument("--games", type=int, default=1, help="对局数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核心数，0表示不使用进程池")
+    parser.add_argument("--rollouts", type=int, default=64, help="每个方向最多模拟的局数")
+    parser.add_argument("--policy", choices=PLAYOUT_POLICIES, default="random", help="模拟时的走法策略")
+    parser.add_argument("--budget", type=float, default=0.05, help="每一步的时间预算（秒），0表示不限制")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    with RolloutAdvisor(args.workers, args.rollouts, args.policy, args.budget or None, seed=args.seed) as advisor:
+        for game in range(args.games):
+            model = BitboardModel(args.seed + game)
+            model.reset()
+            reasons = {}
+            while not model.check_lost():
+                direction = advisor.best_move(model)
+                if direction is None:
+                    break
+                model.fast_move(direction)
+                reason = advisor.last_stats["stop_reason"]
+                reasons[reason] = reasons.get(reason, 0) + 1
+            print(json.dumps({"game": game, "score": model.score, "max_tile": max(max(row) for row in model.grid),
+                              "moves": model.moves, "stop_reasons": reasons, **advisor.stats()}))
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    main()
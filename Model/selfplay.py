@@ -0,0 +1,322 @@
+"""
+selfplay.py
+==========
+
+无界面的多进程自我对局工具，用于批量评测不同的走法策略。
+
+每一局游戏使用独立的Model（默认为BitboardModel），本局的种子由基础种子加上对局编号得到，
+因此无论分配到哪个进程、以什么顺序完成，同样的参数总能得到同样的结果。
+对局通过multiprocessing进程池分发，每完成一局就把结果流式传回主进程汇总，
+最终统计得分分布、最大数字分布、每秒移动数和胜率（对局中check_win曾经为True）。
+指定排行榜服务时，每一局的成绩都会交给排行榜客户端批量异步提交，玩家名为"selfplay-策略名"。
+指定轨迹目录时（只支持4x4），每个进程把自己的对局轨迹写入目录中的selfplay-<进程号>.trace（格式见Model/trace.py），
+每局结束时写入一次，可以用numpy.memmap直接读取。
+
+- play_game: 在当前进程中完成一局游戏
+- run_selfplay: 使用进程池完成多局游戏并汇总统计
+- SelfPlayStats: 对局结果的汇总统计
+
+命令行用法：python -m Model.selfplay --games 1000 --workers 8 --policy greedy [--leaderboard 127.0.0.1:20480]
+                                   [--trace-dir ./traces]
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from Model.model import Model, DIRECTIONS
+from Model.bitboard import BitboardModel, execute_move, count_empty
+from Model.ai import Searcher, board_of
+from Model.trace import TraceRecorder, TraceWriter
+
+ENGINES = {
+    "model": Model,
+    "bitboard": BitboardModel,
+}
+
+_searcher = None  # 每个进程各自持有一个Searcher
+_network = None  # 每个进程各自映射n-tuple网络的权重文件，页缓存在进程之间共享
+_trace_recorders = {}  # 轨迹目录 -> 本进程的TraceRecorder，每个进程写自己的文件
+
+
+def _valid_moves(board):
+    """
+    获取位棋盘上所有有效的移动
+    :param board: int 位棋盘
+    :return: list (方向, 新棋盘, 得分)的列表
+    """
+    moves = []
+    for direction in DIRECTIONS:
+        new_board, score = execute_move(board, direction)
+        if new_board != board:
+            moves.append((direction, new_board, score))
+    return moves
+
+
+def random_policy(model, rng):
+    """
+    在有效的移动中随机选择一个
+    """
+    moves = _valid_moves(board_of(model))
+    return rng.choice(moves)[0] if moves else None
+
+
+def greedy_policy(model, rng):
+    """
+    选择得分最高的移动，得分相同时选择空格最多的
+    """
+    moves = _valid_moves(board_of(model))
+    if not moves:
+        return None
+    return max(moves, key=lambda move: (move[2], count_empty(move[1]), rng.random()))[0]
+
+
+def expectimax_policy(model, rng):
+    """
+    使用期望最大搜索选择移动
+    """
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    return _searcher.best_move(model)
+
+
+def ntuple_policy(model, rng):
+    """
+    使用训练好的n-tuple网络（Model/ntuple.py，默认的权重文件）选择afterstate估值最大的移动
+    """
+    global _network
+    if _network is None:
+        from Model.ntuple import NTupleNetwork
+        _network = NTupleNetwork.load()
+    return _network.best_move(model)
+
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "expectimax": expectimax_policy,
+    "ntuple": ntuple_policy,
+}
+
+
+def trace_recorder(trace_dir):
+    """
+    获取本进程写入trace_dir的轨迹记录器，第一次使用时打开文件
+    :param trace_dir: str 轨迹目录
+    :return: TraceRecorder
+    """
+    recorder = _trace_recorders.get(trace_dir)
+    if recorder is None:
+        os.makedirs(trace_dir, exist_ok=True)
+        writer = TraceWriter(os.path.join(trace_dir, f"selfplay-{os.getpid()}.trace"))
+        recorder = _trace_recorders[trace_dir] = TraceRecorder(writer)
+    return recorder
+
+
+def close_trace_recorders():
+    """
+    关闭本进程打开的所有轨迹文件
+    :return:
+    """
+    for recorder in _trace_recorders.values():
+        recorder.writer.close()
+    _trace_recorders.clear()
+
+
+def play_game(seed, policy="random", engine="bitboard", max_moves=100000, trace_dir=None):
+    """
+    完成一局游戏
+    :param seed: int 随机种子，决定随机数字的位置和策略中的随机选择
+    :param policy: str 走法策略，见POLICIES
+    :param engine: str 使用的Model，见ENGINES
+    :param max_moves: int 单局的最大移动次数
+    :param trace_dir: str 轨迹目录，为None时不记录轨迹
+    :return: dict 对局结果
+    """
+    rng = random.Random(seed ^ 0x5EED)  # 策略使用的随机数与添加数字的随机数分开
+    choose = POLICIES[policy]
+    model = ENGINES[engine](load_score=False)  # 自我对局不需要读取最高得分文件
+    model.reset(seed)
+    move = model.fast_move
+    recorder = None
+    if trace_dir is not None:
+        recorder = trace_recorder(trace_dir)
+        record = recorder.fast_move
+
+        def move(direction):
+            return record(model, direction)
+
+    moves = 0
+    won = False
+    start = time.perf_counter()
+    while moves < max_moves and not model.check_lost():
+        direction = choose(model, rng)
+        if direction is None:
+            break
+        move(direction)
+        moves += 1
+        if not won and model.check_win():
+            won = True
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.writer.flush()  # 每局写入一次，进程池结束时不会丢失已完成的对局
+
+    return {
+        "seed": seed,
+        "score": model.score,
+        "max_tile": max(max(row) for row in model.grid),
+        "grid_size": model.grid_size,
+        "moves": moves,
+        "won": won,
+        "elapsed": elapsed,
+        "pid": os.getpid(),
+    }
+
+
+def _play_game_task(task):
+    return play_game(*task)
+
+
+def _init_worker():
+    """
+    进程池中每个进程的初始化函数：进程正常退出时关闭本进程的轨迹文件
+    :return:
+    """
+    from multiprocessing.util import Finalize
+    Finalize(None, close_trace_recorders, exitpriority=10)
+
+
+class SelfPlayStats:
+    def __init__(self):
+        self.results = []  # 所有对局结果
+        self.wall_time = 0.0  # 总耗时（墙上时间）
+
+    def add(self, result):
+        self.results.append(result)
+
+    def summary(self):
+        """
+        汇总所有对局结果
+        :return: dict 统计信息
+        """
+        games = len(self.results)
+        if not games:
+            return {"games": 0}
+        scores = sorted(result["score"] for result in self.results)
+        total_moves = sum(result["moves"] for result in self.results)
+        game_time = sum(result["elapsed"] for result in self.results)
+        tiles = {}
+        for result in self.results:
+            tiles[result["max_tile"]] = tiles.get(result["max_tile"], 0) + 1
+
+        def percentile(p):
+            return scores[min(games - 1, int(p * games))]
+
+        return {
+            "games": games,
+            "score_mean": sum(scores) / games,
+            "score_min": scores[0],
+            "score_p10": percentile(0.1),
+            "score_median": percentile(0.5),
+            "score_p90": percentile(0.9),
+            "score_max": scores[-1],
+            "max_tile_histogram": dict(sorted(tiles.items())),
+            "win_rate": sum(1 for result in self.results if result["won"]) / games,
+            "total_moves": total_moves,
+            "moves_per_sec": total_moves / self.wall_time if self.wall_time > 0 else 0.0,
+            "moves_per_sec_per_worker": total_moves / game_time if game_time > 0 else 0.0,
+            "workers": len({result["pid"] for result in self.results}),
+            "wall_time": self.wall_time,
+        }
+
+
+def run_selfplay(games, workers=None, seed=0, policy="random", engine="bitboard", max_moves=100000,
+                 on_result=None, trace_dir=None):
+    """
+    使用进程池完成多局游戏
+    :param games: int 对局数
+    :param workers: int 进程数，默认为CPU核心数
+    :param seed: int 基础随机种子，第i局的种子为seed + i
+    :param policy: str 走法策略
+    :param engine: str 使用的Model
+    :param max_moves: int 单局的最大移动次数
+    :param on_result: 每完成一局时调用的回调函数，参数为对局结果
+    :param trace_dir: str 轨迹目录，为None时不记录轨迹
+    :return: SelfPlayStats 汇总统计
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(seed + i, policy, engine, max_moves, trace_dir) for i in range(games)]
+    chunksize = max(1, games // (workers * 8))
+    stats = SelfPlayStats()
+    start = time.perf_counter()
+    if workers == 1:
+        results = map(_play_game_task, tasks)
+        for result in results:
+            stats.add(result)
+            if on_result:
+                on_result(result)
+        close_trace_recorders()
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        try:
+            for result in pool.imap_unordered(_play_game_task, tasks, chunksize):
+                stats.add(result)
+                if on_result:
+                    on_result(result)
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()  # 让进程正常退出，_init_worker注册的关闭函数才会执行
+        finally:
+            pool.join()
+    stats.wall_time = time.perf_counter() - start
+    stats.results.sort(key=lambda result: result["seed"])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2048无界面自我对局")
+    parser.add_argument("--games", type=int, default=100, help="对局数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核心数")
+    parser.add_argument("--seed", type=int, default=0, help="基础随机种子")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random", help="走法策略")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard", help="使用的Model")
+    parser.add_argument("--max-moves", type=int, default=100000, help="单局的最大移动次数")
+    parser.add_argument("--verbose", action="store_true", help="每完成一局就输出结果")
+    parser.add_argument("--leaderboard", metavar="HOST:PORT", help="把每一局的成绩提交到排行榜服务")
+    parser.add_argument("--trace-dir", help="把对局轨迹写入该目录（每个进程一个.trace文件）")
+    args = parser.parse_args()
+
+    leaderboard = None
+    if args.leaderboard:
+        from Leaderboard.client import LeaderboardClient, parse_address
+        leaderboard = LeaderboardClient(*parse_address(args.leaderboard))
+    player = "selfplay-" + args.policy
+
+    def on_result(result):
+        if args.verbose:
+            print(json.dumps(result))
+        if leaderboard is not None:
+            leaderboard.submit({"player": player, "score": result["score"], "max_tile": result["max_tile"],
+                                "moves": result["moves"], "grid_size": result["grid_size"], "seed": result["seed"]})
+
+    stats = run_selfplay(args.games, args.workers, args.seed, args.policy, args.engine, args.max_moves,
+                         on_result, args.trace_dir)
+    summary = stats.summary()
+    if leaderboard is not None:
+        leaderboard.close(timeout=10.0)
+        summary["leaderboard_submitted"] = leaderboard.submitted
+        summary["leaderboard_failed"] = leaderboard.failed
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
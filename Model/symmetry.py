@@ -0,0 +1,238 @@
+"""
+symmetry.py
+==========
+
+棋盘的二面体对称（4种旋转 x 是否翻转，共8种变换）和规范化。
+
+同一个局面旋转或翻转之后，得分、能否移动、之后的发展都完全相同（方向相应地变换），因此以局面为键的缓存、
+统计和数据集可以只保存规范形式：8种变换结果中最小的一个。
+
+变换编号k的含义：k & 4 表示先转置（行列互换），k & 1 表示再左右翻转，k & 2 表示最后上下翻转，
+k为0时不变，8种编号正好对应8种不同的对称变换。
+
+- 位棋盘（只支持4x4）：transform、inverse_transform、canonical（返回规范形式和所用的变换）、canonical_board（只返回规范形式），
+  全部只用位运算，canonical每秒可以完成几十万次；
+- 方向：to_canonical_direction把原局面上的方向换成规范局面上对应的方向，from_canonical_direction反过来，
+  例如在规范局面上查到的最佳方向用from_canonical_direction换回原局面；
+- 二维列表（任意大小）：transform_grid、canonical_key（返回规范键和所用的变换）；
+- 规范键只有一种定义：4x4的局面（数字不超过32768）一律转换为位棋盘，键为canonical得到的规范位棋盘（int），
+  因此Model.canonical和BitboardModel.canonical对同一个局面返回相同的键和相同的变换编号，缓存和统计可以在两种Model之间共用；
+  其他大小的网格无法放进位棋盘，键为规范形式的pack_grid字节串（bytes），按字节序比较；
+- SymmetricCache：以规范局面为键的字典，8个对称的局面共用同一项。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+from Model.bitboard import transpose, encode_grid
+from Model.history import pack_grid
+from Model.model import DIRECTIONS
+
+TRANSFORMS = 8
+
+_TRANSPOSED = {"left": "up", "up": "left", "right": "down", "down": "right"}
+_FLIPPED_HORIZONTAL = {"left": "right", "right": "left", "up": "up", "down": "down"}
+_FLIPPED_VERTICAL = {"left": "left", "right": "right", "up": "down", "down": "up"}
+
+
+def flip_horizontal(board):
+    """
+    左右翻转位棋盘，每一行的四个格子倒序
+    :param board: int 位棋盘
+    :return: int 翻转后的位棋盘
+    """
+    return (((board & 0x000F000F000F000F) << 12) | ((board & 0x00F000F000F000F0) << 4)
+            | ((board >> 4) & 0x00F000F000F000F0) | ((board >> 12) & 0x000F000F000F000F))
+
+
+def flip_vertical(board):
+    """
+    上下翻转位棋盘，四行倒序
+    :param board: int 位棋盘
+    :return: int 翻转后的位棋盘
+    """
+    return (((board & 0xFFFF) << 48) | ((board & 0xFFFF0000) << 16)
+            | ((board >> 16) & 0xFFFF0000) | (board >> 48))
+
+
+def transform(board, k):
+    """
+    对位棋盘做第k种对称变换
+    :param board: int 位棋盘
+    :param k: int 变换编号，0~7
+    :return: int 变换后的位棋盘
+    """
+    if k & 4:
+        board = transpose(board)
+    if k & 1:
+        board = flip_horizontal(board)
+    if k & 2:
+        board = flip_vertical(board)
+    return board
+
+
+def inverse_transform(board, k):
+    """
+    transform的逆变换：inverse_transform(transform(board, k), k) == board
+    :param board: int 位棋盘
+    :param k: int 变换编号，0~7
+    :return: int 变换前的位棋盘
+    """
+    if k & 2:
+        board = flip_vertical(board)
+    if k & 1:
+        board = flip_horizontal(board)
+    if k & 4:
+        board = transpose(board)
+    return board
+
+
+def canonical(board):
+    """
+    位棋盘的规范形式：8种对称变换结果中最小的一个
+    :param board: int 位棋盘
+    :return: (int, int) 规范形式的位棋盘和所用的变换编号，canonical(b) == (transform(b, k), k)
+    """
+    h = flip_horizontal(board)
+    t = transpose(board)
+    th = flip_horizontal(t)
+    best, index = board, 0
+    for k, candidate in ((1, h), (2, flip_vertical(board)), (3, flip_vertical(h)),
+                         (4, t), (5, th), (6, flip_vertical(t)), (7, flip_vertical(th))):
+        if candidate < best:
+            best, index = candidate, k
+    return best, index
+
+
+def canonical_board(board):
+    """
+    只返回位棋盘的规范形式，不需要变换编号时（例如作为缓存的键）使用
+    :param board: int 位棋盘
+    :return: int 规范形式的位棋盘
+    """
+    h = flip_horizontal(board)
+    t = transpose(board)
+    th = flip_horizontal(t)
+    return min(board, h, flip_vertical(board), flip_vertical(h), t, th, flip_vertical(t), flip_vertical(th))
+
+
+def _direction_table(k):
+    table = {}
+    for direction in DIRECTIONS:
+        mapped = direction
+        if k & 4:
+            mapped = _TRANSPOSED[mapped]
+        if k & 1:
+            mapped = _FLIPPED_HORIZONTAL[mapped]
+        if k & 2:
+            mapped = _FLIPPED_VERTICAL[mapped]
+        table[direction] = mapped
+    return table
+
+
+# TO_CANONICAL[k][方向]：原局面上的方向在变换后的局面上对应的方向；FROM_CANONICAL是它的逆
+TO_CANONICAL = tuple(_direction_table(k) for k in range(TRANSFORMS))
+FROM_CANONICAL = tuple({mapped: direction for direction, mapped in table.items()} for table in TO_CANONICAL)
+
+
+def to_canonical_direction(direction, k):
+    """
+    :param direction: str 原局面上的方向
+    :param k: int 变换编号
+    :return: str 变换后的局面上效果相同的方向
+    """
+    return TO_CANONICAL[k][direction]
+
+
+def from_canonical_direction(direction, k):
+    """
+    :param direction: str 变换后的局面上的方向
+    :param k: int 变换编号
+    :return: str 原局面上效果相同的方向
+    """
+    return FROM_CANONICAL[k][direction]
+
+
+def transform_grid(grid, k):
+    """
+    对任意大小的二维列表做第k种对称变换
+    :param grid: list 二维列表
+    :param k: int 变换编号，0~7
+    :return: list 变换后的二维列表（新列表）
+    """
+    if k & 4:
+        grid = [list(column) for column in zip(*grid)]
+    if k & 1:
+        grid = [row[::-1] for row in grid]
+    else:
+        grid = [row[:] for row in grid]
+    if k & 2:
+        grid.reverse()
+    return grid
+
+
+def canonical_key(grid):
+    """
+    任意大小的二维列表的规范键，4x4的局面与位棋盘的canonical完全一致
+    :param grid: list 二维列表
+    :return: (int, int) 4x4且数字不超过32768时为规范形式的位棋盘和所用的变换编号；
+             (bytes, int) 其他情况为规范形式的pack_grid结果和所用的变换编号
+    """
+    if len(grid) == 4 and max(max(row) for row in grid) <= 32768:
+        return canonical(encode_grid(grid))
+    columns = [list(column) for column in zip(*grid)]
+    best, index = None, 0
+    for k, variant in enumerate((grid, [row[::-1] for row in grid], grid[::-1], [row[::-1] for row in grid[::-1]],
+                                 columns, [row[::-1] for row in columns], columns[::-1],
+                                 [row[::-1] for row in columns[::-1]])):
+        key = pack_grid(variant)
+        if best is None or key < best:
+            best, index = key, k
+    return best, index
+
+
+class SymmetricCache:
+    """
+    以位棋盘为键的缓存，8个对称的局面共用同一项；保存的值必须与方向无关（例如估值），
+    与方向有关的值（例如最佳方向）需要先用canonical得到变换编号再转换
+    """
+    __slots__ = ("table", "lookups", "hits")
+
+    def __init__(self):
+        self.table = {}  # 规范形式的位棋盘 -> 值
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, board):
+        return canonical_board(board) in self.table
+
+    def get(self, board, default=None):
+        self.lookups += 1
+        value = self.table.get(canonical_board(board), default)
+        if value is not default:
+            self.hits += 1
+        return value
+
+    def __setitem__(self, board, value):
+        self.table[canonical_board(board)] = value
+
+    def clear(self):
+        self.table.clear()
+        self.lookups = 0
+        self.hits = 0
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    from Model.bitboard import BitboardModel, decode_board
+
+    game = BitboardModel(0)
+    game.reset()
+    for direction in ("left", "up", "right", "down") * 3:
+        game.move(direction)
+    key, k = canonical(game.board)
+    print(game.grid)
+    print(decode_board(key), k, to_canonical_direction("left", k))
@@ -0,0 +1,318 @@
+"""
+trace.py
+==========
+
+对局轨迹的记录和导出，用于训练和分析走法策略。
+
+轨迹文件（扩展名.trace）由16字节的文件头和之后连续的定长记录组成，每条记录16字节（小端）：
+
+- board: uint64 移动前的位棋盘，每4位为一个格子数字的指数，与bitboard模块的编码相同（只支持4x4）
+- score_delta: uint32 本次移动得到的分数
+- direction: uint8 移动方向，0~3依次为left、right、up、down
+- spawn_cell: uint8 新数字所在的格子编号（i * 4 + j），没有添加数字时为255
+- spawn_exponent: uint8 新数字的指数（1表示2，2表示4）
+- flags: uint8 第0位表示这是一局的第一步，第1位表示这一步之后游戏结束
+
+记录是定长的，文件头的长度也是记录长度的整数倍，因此可以直接用numpy.memmap（见open_memmap）按需读取，
+随机抽样数十亿个局面也不需要把文件载入内存；没有安装numpy时可以用iter_records逐条读取。
+
+TraceWriter把记录打包进预先分配的缓冲区，缓冲区满了或者调用flush时才一次性写入文件；
+TraceRecorder.fast_move/move在移动的同时写入记录，自我对局中开启记录只比不记录慢几个百分点；
+TraceRecorder.attach像instrumentation模块一样只在Model实例上包装移动方法，没有附加记录器的Model不受影响。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import os
+import struct
+
+from Model.model import DIRECTIONS, DIRECTION_CODES
+
+MAGIC = b"2048TRC\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")  # 魔数、版本、记录长度、保留
+RECORD = struct.Struct("<QIBBBB")  # 棋盘、得分、方向、新数字的格子、新数字的指数、标志
+RECORD_SIZE = RECORD.size
+_pack_into = RECORD.pack_into
+NO_SPAWN = 255
+FLAG_FIRST = 1  # 一局的第一步
+FLAG_TERMINAL = 2  # 这一步之后游戏结束
+
+# numpy.memmap使用的结构化类型，字段与RECORD一一对应
+DTYPE_FIELDS = [("board", "<u8"), ("score_delta", "<u4"), ("direction", "u1"), ("spawn_cell", "u1"),
+                ("spawn_exponent", "u1"), ("flags", "u1")]
+
+
+def pack_board(grid):
+    """
+    把4x4的网格编码为位棋盘
+    :param grid: list 4x4的二维列表
+    :return: int 位棋盘
+    """
+    board = 0
+    shift = 0
+    for row in grid:
+        for value in row:
+            if value:
+                exponent = value.bit_length() - 1
+                if exponent > 15:
+                    raise ValueError(f"轨迹文件不支持大于32768的数字：{value}")
+                board |= exponent << shift
+            shift += 4
+    return board
+
+
+def unpack_board(board):
+    """
+    把位棋盘还原为4x4的网格
+    :param board: int 位棋盘
+    :return: list 4x4的二维列表
+    """
+    board = int(board)
+    return [[(1 << e) if e else 0 for e in ((board >> (16 * i + 4 * j)) & 0xF for j in range(4))] for i in range(4)]
+
+
+class TraceWriter:
+    def __init__(self, path, buffer_records=65536):
+        """
+        打开轨迹文件，已经存在的文件会在末尾继续追加（末尾不完整的记录会被截掉）
+        :param path: str 文件路径
+        :param buffer_records: int 缓冲区能容纳的记录数，满了才写入文件
+        """
+        self.path = path
+        self.file = open(path, "a+b")
+        self.file.seek(0, os.SEEK_END)
+        length = self.file.tell()
+        if length < HEADER.size:
+            self.file.truncate(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        else:
+            self.file.seek(0)
+            magic, version, record_size, _ = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                self.file.close()
+                raise ValueError(f"{path}不是版本{VERSION}的轨迹文件")
+            self.file.truncate(HEADER.size + (length - HEADER.size) // RECORD.size * RECORD.size)
+        self.file.seek(0, os.SEEK_END)
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.capacity = len(self.buffer)
+        self.offset = 0  # 缓冲区中已经使用的字节数
+        self.records = 0  # 本次打开之后写入的记录数
+
+    def append(self, board, direction, score_delta, spawn_cell, spawn_exponent, flags=0):
+        """
+        追加一条记录
+        :param board: int 移动前的位棋盘
+        :param direction: int 方向编号
+        :param score_delta: int 本次移动得到的分数
+        :param spawn_cell: int 新数字的格子编号，没有时为NO_SPAWN
+        :param spawn_exponent: int 新数字的指数
+        :param flags: int FLAG_FIRST、FLAG_TERMINAL的组合
+        :return:
+        """
+        offset = self.offset
+        _pack_into(self.buffer, offset, board, score_delta, direction, spawn_cell, spawn_exponent, flags)
+        offset += RECORD_SIZE
+        self.records += 1
+        self.offset = offset
+        if offset == self.capacity:
+            self.flush()
+
+    def flush(self):
+        """
+        把缓冲区中的记录写入文件
+        :return:
+        """
+        if self.offset:
+            self.file.write(memoryview(self.buffer)[:self.offset])
+            self.offset = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TraceRecorder:
+    """
+    记录Model的每一次有效移动，支持Model（4x4）和BitboardModel
+
+    自我对局等热点循环直接调用recorder.fast_move(model, 方向)代替model.fast_move；
+    其他场合可以用attach在实例上包装移动方法，之后的move、move_left等调用都会被记录。
+    """
+
+    def __init__(self, writer):
+        """
+        :param writer: TraceWriter 记录写入的位置
+        """
+        self.writer = writer
+        self._append = writer.append
+
+    def fast_move(self, model, direction, move=None):
+        """
+        移动并记录，与model.fast_move相同
+        :param model: Model 游戏模型
+        :param direction: str 移动方向
+        :param move: 实际执行移动的函数，默认为model.fast_move
+        :return: bool 是否为有效移动
+        """
+        if not hasattr(model, "board"):
+            return self.move(model, direction).changed
+        before = model.board
+        score = model.score
+        if not (move or model.fast_move)(direction):
+            return False
+        # BitboardModel.fast_move不返回新数字的位置，从last_spawn_cell读取
+        cell = model.last_spawn_cell
+        if cell is None:
+            cell, exponent = NO_SPAWN, 0
+        else:
+            exponent = (model.board >> (cell << 2)) & 0xF
+        flags = (FLAG_FIRST if model.moves == 1 else 0) | (FLAG_TERMINAL if model.check_lost() else 0)
+        self._append(before, DIRECTION_CODES[direction], model.score - score, cell, exponent, flags)
+        return True
+
+    def move(self, model, direction, spawn=None, move=None):
+        """
+        移动并记录，与model.move相同
+        :param model: Model 游戏模型
+        :param direction: str 移动方向
+        :param spawn: (int, int, int) 指定移动后添加的数字
+        :param move: 实际执行移动的函数，默认为model._move
+        :return: MoveResult 本次移动的结果
+        """
+        before = model.board if hasattr(model, "board") else pack_board(model.grid)
+        score = model.score
+        result = (move or model._move)(direction, spawn)
+        if result.changed:
+            if result.spawn is None:
+                cell, exponent = NO_SPAWN, 0
+            else:
+                i, j, value = result.spawn
+                cell, exponent = i * 4 + j, value.bit_length() - 1
+            flags = (FLAG_FIRST if model.moves == 1 else 0) | (FLAG_TERMINAL if model.check_lost() else 0)
+            self._append(before, DIRECTION_CODES[direction], model.score - score, cell, exponent, flags)
+        return result
+
+    def attach(self, model):
+        """
+        开始记录model的所有移动：在实例上包装_move（move、move_left等都经过_move）和不经过_move的fast_move，
+        Model的fast_move改为经过记录的_move，以便得到新数字的位置
+        :param model: Model 游戏模型
+        :return:
+        """
+        if model.grid_size != 4:
+            raise ValueError(f"轨迹文件只支持4x4的网格：{model.grid_size}")
+        self.detach(model)
+        original_move = model._move
+        model._move = lambda direction, spawn=None: self.move(model, direction, spawn, original_move)
+        if hasattr(model, "board"):
+            original_fast_move = model.fast_move
+            model.fast_move = lambda direction: self.fast_move(model, direction, original_fast_move)
+        else:
+            model.fast_move = lambda direction: self.move(model, direction, None, original_move).changed
+
+    @staticmethod
+    def detach(model):
+        """
+        停止记录，恢复为类本身的方法
+        :param model: Model 游戏模型
+        :return:
+        """
+        for attribute in ("_move", "fast_move"):
+            model.__dict__.pop(attribute, None)
+
+
+def record_count(path):
+    """
+    :param path: str 轨迹文件路径
+    :return: int 文件中完整的记录数
+    """
+    return max(0, os.path.getsize(path) - HEADER.size) // RECORD.size
+
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path}不是轨迹文件")
+    magic, version, record_size, _ = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path}不是版本{VERSION}的轨迹文件")
+
+
+def iter_records(path):
+    """
+    不依赖numpy，逐条读取轨迹文件
+    :param path: str 轨迹文件路径
+    :return: 迭代器，每一项为(board, score_delta, direction, spawn_cell, spawn_exponent, flags)
+    """
+    _check_header(path)
+    with open(path, "rb") as f:
+        f.seek(HEADER.size)
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            usable = len(chunk) // RECORD.size * RECORD.size
+            if not usable:
+                return
+            yield from RECORD.iter_unpack(chunk[:usable])
+
+
+def open_memmap(path):
+    """
+    把轨迹文件映射为numpy的结构化数组，只在访问时才从磁盘读取
+    :param path: str 轨迹文件路径
+    :return: numpy.memmap 字段见DTYPE_FIELDS
+    """
+    import numpy as np
+
+    _check_header(path)
+    count = record_count(path)
+    dtype = np.dtype(DTYPE_FIELDS)
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def sample(path, count, seed=None):
+    """
+    从轨迹文件中有放回地随机抽取若干条记录，只读取被抽到的页
+    :param path: str 轨迹文件路径
+    :param count: int 抽取的条数
+    :param seed: int 随机种子
+    :return: numpy.ndarray 抽到的记录（已复制到内存）
+    """
+    import numpy as np
+
+    records = open_memmap(path)
+    if not len(records):
+        return records[:0]
+    indices = np.sort(np.random.default_rng(seed).integers(0, len(records), size=count))
+    return records[indices]
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    from Model.bitboard import BitboardModel
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), "demo.trace")
+    game = BitboardModel(0)
+    with TraceWriter(filename) as trace_writer:
+        recorder = TraceRecorder(trace_writer)
+        for _ in range(10):
+            game.reset()
+            while not game.check_lost():
+                recorder.fast_move(game, DIRECTIONS[game.rng.randrange(4)])
+    print(filename, record_count(filename), "条记录")
+    print(next(iter_records(filename)))
@@ -19,6 +19,7 @@ after_source = [
     [0, 0, 0, 0]
 ]  # 操作后的矩阵（当前打印的矩阵）
 random_tuple = (2, 4)  # 初始添加的值、移动时添加的值
+rng = random.Random()  # 本模块独立的随机数生成器，调用rng.seed(...)后可以复现对局
 
 
 # Controller层
@@ -63,10 +64,10 @@ def random_site():
     """
     random_list_len = len(random_tuple)
     while True:
-        x = random.randint(0, 3)
-        y = random.randint(0, 3)
+        x = rng.randint(0, 3)
+        y = rng.randint(0, 3)
         if after_source[x][y] == 0:
-            after_source[x][y] = random_tuple[random.randint(0, random_list_len - 1)]
+            after_source[x][y] = random_tuple[rng.randint(0, random_list_len - 1)]
             break
 
 
@@ -174,5 +175,5 @@ def main():
             break
 
 
-main()
-
+if __name__ == '__main__':
+    main()
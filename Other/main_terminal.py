@@ -0,0 +1,251 @@
+"""
+main_terminal.py
+==========
+
+基于curses的终端版2048，直接使用Model类作为游戏引擎，适合通过SSH在没有图形界面的机器上游玩。
+
+- 不导入PyQt5，启动只需要加载Model和curses，耗时远小于100毫秒；
+- 终端处于cbreak模式，按键不需要回车，读取按键时带有超时，窗口大小变化也能及时响应；
+- 每次移动后只重绘Model.changed_cells中记录的格子和分数行，不会整屏刷新。
+
+操作方式：方向键/WASD/HJKL移动，U撤销，R重做，N重新开始，Q退出。
+
+命令行用法：python -m Other.main_terminal [--size N]
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import sys
+import unicodedata
+
+try:
+    import curses
+except ImportError:  # Windows需要额外安装windows-curses
+    curses = None
+
+from Model.model import Model, MIN_GRID_SIZE, MAX_GRID_SIZE
+from Model.history import GameHistory
+
+CELL_WIDTH = 7  # 每个格子占用的列数
+CELL_HEIGHT = 1  # 每个格子占用的行数
+TOP = 2  # 棋盘上方留给分数和提示的行数
+KEY_TIMEOUT_MS = 200  # 读取按键的超时时间，超时后检查窗口大小等状态
+
+DIRECTION_KEYS = {
+    "left": ("KEY_LEFT", "a", "A", "h"),
+    "right": ("KEY_RIGHT", "d", "D", "l"),
+    "up": ("KEY_UP", "w", "W", "k"),
+    "down": ("KEY_DOWN", "s", "S", "j"),
+}
+KEY_DIRECTIONS = {key: direction for direction, keys in DIRECTION_KEYS.items() for key in keys}
+
+# 数字的指数 -> curses颜色，超过2048的数字使用最后一种颜色
+TILE_COLORS = ["WHITE", "WHITE", "YELLOW", "YELLOW", "RED", "RED", "MAGENTA", "MAGENTA", "CYAN", "CYAN",
+               "GREEN", "GREEN", "BLUE"]
+
+
+def clip_text(text, columns):
+    """
+    按终端显示宽度截断文字，中文等全角字符占两列
+    :param text: str 文字
+    :param columns: int 最多占用的列数
+    :return: str 截断后的文字
+    """
+    width = 0
+    for index, char in enumerate(text):
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+        if width > columns:
+            return text[:index]
+    return text
+
+
+class TerminalView:
+    def __init__(self, screen, model: Model):
+        """
+        :param screen: curses窗口
+        :param model: Model 游戏模型
+        """
+        self.screen = screen
+        self.model = model
+        self.status = ""  # 分数下方的提示文字
+        self.win_announced = False  # 本局是否已经提示过胜利
+        self.too_small = False  # 终端窗口是否放不下棋盘
+        self.history = GameHistory()  # 撤销/重做的历史记录
+        self.tile_attributes = self.init_colors()
+
+    @staticmethod
+    def init_colors():
+        """
+        为每一种指数准备好绘制属性，只在启动时计算一次
+        :return: list 以指数为下标的curses属性
+        """
+        if not curses.has_colors():
+            return [curses.A_DIM] + [curses.A_BOLD] * (len(TILE_COLORS) - 1)
+        curses.start_color()
+        curses.use_default_colors()
+        attributes = [curses.A_DIM]
+        for exponent, name in enumerate(TILE_COLORS[1:], start=1):
+            curses.init_pair(exponent, curses.COLOR_BLACK, getattr(curses, "COLOR_" + name))
+            attributes.append(curses.color_pair(exponent) | (curses.A_BOLD if exponent >= 7 else 0))
+        return attributes
+
+    def cell_text(self, value):
+        """
+        格子中显示的文字，居中并补齐到格子宽度
+        :param value: int 数字
+        :return: str 文字
+        """
+        return (str(value) if value else ".").center(CELL_WIDTH)
+
+    def draw_cell(self, i, j):
+        """
+        重绘一个格子
+        :param i: int 行
+        :param j: int 列
+        :return:
+        """
+        value = self.model.grid[i][j]
+        exponent = min(value.bit_length() - 1, len(self.tile_attributes) - 1) if value else 0
+        self.screen.addstr(TOP + i * CELL_HEIGHT, j * CELL_WIDTH, self.cell_text(value), self.tile_attributes[exponent])
+
+    def draw_status(self):
+        """
+        重绘分数行和提示行，超出窗口宽度的部分截掉，不会折行覆盖棋盘
+        :return:
+        """
+        columns = self.screen.getmaxyx()[1] - 1
+        self.screen.move(0, 0)
+        self.screen.clrtoeol()
+        self.screen.addstr(0, 0, clip_text(f"当前分数: {self.model.score}    最高分数: {self.model.highest_score}", columns))
+        self.screen.move(1, 0)
+        self.screen.clrtoeol()
+        self.screen.addstr(1, 0, clip_text(self.status or "方向键/WASD/HJKL移动  U撤销  R重做  N重新开始  Q退出", columns))
+
+    def redraw(self):
+        """
+        整屏重绘，用于新游戏和窗口大小变化
+        :return:
+        """
+        self.screen.erase()
+        height, width = self.screen.getmaxyx()
+        size = self.model.grid_size
+        # 最后一行的最后一列不能写入，所以需要多留一行
+        self.too_small = height <= TOP + size * CELL_HEIGHT or width < size * CELL_WIDTH
+        if self.too_small:
+            self.screen.addstr(0, 0, clip_text("终端窗口太小，请调大窗口", max(0, width - 1)))
+        else:
+            self.draw_status()
+            for i in range(size):
+                for j in range(size):
+                    self.draw_cell(i, j)
+        self.screen.refresh()
+
+    def update(self):
+        """
+        移动后只重绘发生变化的格子和分数行
+        :return:
+        """
+        if self.too_small:
+            return
+        for i, j in self.model.changed_cells:
+            self.draw_cell(i, j)
+        self.draw_status()
+        self.screen.refresh()
+
+    def new_game(self):
+        self.model.reset()
+        self.history.clear()
+        self.history.push(self.model)
+        self.status = ""
+        self.win_announced = False
+        self.redraw()
+
+    def handle_key(self, key):
+        """
+        处理一次按键
+        :param key: str curses.get_wch返回的按键名
+        :return: bool 是否继续游戏
+        """
+        if key in ("q", "Q"):
+            return False
+        if key in ("n", "N"):
+            self.new_game()
+            return True
+        if key == "KEY_RESIZE":
+            self.redraw()
+            return True
+        if key in ("u", "U", "r", "R"):
+            step = self.history.undo if key in ("u", "U") else self.history.redo
+            if step(self.model):
+                self.status = ""
+                self.update()  # restore把所有格子记为变化
+            return True
+        direction = KEY_DIRECTIONS.get(key)
+        if direction is None or self.model.check_lost():
+            return True
+        result = self.model.move(direction)
+        if not result.changed:
+            return True  # 无效移动不需要重绘
+        self.history.push(self.model)
+        if not self.win_announced and self.model.check_win():
+            self.win_announced = True
+            self.status = "你赢了！可以继续游戏，N重新开始"
+        elif self.model.check_lost():
+            self.status = "你输啦！N重新开始，Q退出"
+        else:
+            self.status = ""
+        self.update()
+        return True
+
+    def run(self):
+        """
+        主循环：读取按键，超时时什么也不做
+        :return:
+        """
+        curses.curs_set(0)
+        self.screen.keypad(True)
+        self.screen.timeout(KEY_TIMEOUT_MS)
+        self.new_game()
+        while True:
+            key = self.read_key()
+            if key is not None and not self.handle_key(key):
+                break
+
+    def read_key(self):
+        """
+        读取一个按键，超时返回None
+        :return: str 按键名，普通字符为字符本身，功能键为curses的键名（如KEY_LEFT）
+        """
+        try:
+            key = self.screen.get_wch()
+        except curses.error:
+            return None
+        if isinstance(key, int):
+            return curses.keyname(key).decode()
+        return key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="终端版2048")
+    parser.add_argument("--size", type=int, default=4, choices=range(MIN_GRID_SIZE, MAX_GRID_SIZE + 1),
+                        metavar="N", help=f"网格大小（{MIN_GRID_SIZE}~{MAX_GRID_SIZE}），默认为4")
+    args = parser.parse_args()
+    if curses is None:
+        print("当前Python没有curses模块，Windows上请先安装windows-curses")
+        return 1
+    model = Model(grid_size=args.size)
+    try:
+        curses.wrapper(lambda screen: TerminalView(screen, model).run())
+    except KeyboardInterrupt:
+        pass
+    # 退出时保存最高分数
+    model.save_highest_score()
+    print(f"最终得分：{model.score}  最高分数：{model.highest_score}")
+    return 0
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    sys.exit(main())
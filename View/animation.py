@@ -0,0 +1,110 @@
+"""
+animation.py
+==========
+
+TileAnimator类是2048游戏的方块滑动动画层，替代原来每个方块各自的滑动动画，主要特点有：
+
+- 每次移动只使用一个QVariantAnimation，进度经过缓动曲线后交给BoardWidget，由棋盘在同一次paintEvent中
+  按MoveResult.movements把每个移动的数字画在起点和终点之间，不需要为每个数字创建精灵控件和属性动画；
+- 上一次的动画还没播放完时又有新的移动，则直接停止动画并显示最新的局面，不会排队积压动画；
+- 动画的每一帧同时记录帧间隔，stats方法返回帧数、平均/最大帧间隔和帧率，用于确认是否达到60帧。
+
+动画过程中，移动的数字在原位置上显示为空格，由棋盘从起点画到终点；动画结束后再由GameView刷新发生变化的格子，
+合并后的数字和新添加的数字在这时出现。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+from collections import deque
+
+from PyQt5.QtCore import QObject, QVariantAnimation, QElapsedTimer, QEasingCurve, QAbstractAnimation
+
+
+class TileAnimator(QObject):
+    FRAME_BUDGET_MS = 1000 / 60  # 60帧时每一帧的时间预算
+
+    def __init__(self, view, duration=100, max_frames=600):
+        """
+        :param view: GameView 动画所在的游戏窗口，需要提供board、dirty_cells和flush_cells
+        :param duration: int 每次滑动动画的时长（毫秒）
+        :param max_frames: int 最多保存的帧间隔数量
+        """
+        super().__init__(view)
+        self.view = view
+        self.board = view.board
+        self.duration = duration
+        self.animation = QVariantAnimation(self)
+        self.animation.setStartValue(0.0)
+        self.animation.setEndValue(1.0)
+        self.animation.setEasingCurve(QEasingCurve.OutQuad)
+        self.animation.valueChanged.connect(self._on_frame)
+        self.animation.finished.connect(self._on_finished)
+        self.frame_timer = QElapsedTimer()
+        self.last_frame_ns = None
+        self.frame_times = deque(maxlen=max_frames)  # 每一帧的间隔（毫秒）
+        self.animations_played = 0  # 完整播放的动画次数
+        self.coalesced = 0  # 因为新的移动而提前结束的动画次数
+
+    def is_running(self):
+        return self.animation.state() == QAbstractAnimation.Running
+
+    def animate(self, result):
+        """
+        根据移动结果播放滑动动画
+        :param result: MoveResult 移动的结果
+        :return: bool 是否开始了动画，返回False时调用方应直接刷新到最新局面
+        """
+        if self.is_running():
+            # 上一次的动画还没有结束，合并为直接显示最新局面
+            self.coalesced += 1
+            self.stop()
+            return False
+        if not result.movements:
+            return False
+
+        # 起点在动画过程中显示为空格，动画结束后由view刷新
+        self.board.start_slide(result.movements)
+        self.view.dirty_cells.update(source for source, _, _ in result.movements)
+        self.animation.setDuration(self.duration)
+        self.last_frame_ns = None
+        self.frame_timer.start()
+        self.animation.start()
+        return True
+
+    def stop(self):
+        """
+        立即停止正在播放的动画，不再绘制滑动的数字，不刷新格子
+        :return:
+        """
+        self.animation.stop()
+        self.board.end_slide()
+
+    def _on_finished(self):
+        self.animations_played += 1
+        self.board.end_slide()
+        self.view.flush_cells()
+
+    def _on_frame(self, progress):
+        now = self.frame_timer.nsecsElapsed()
+        if self.last_frame_ns is not None:
+            self.frame_times.append((now - self.last_frame_ns) / 1e6)
+        self.last_frame_ns = now
+        self.board.set_slide_progress(progress)
+
+    def stats(self):
+        """
+        动画的帧时间统计
+        :return: dict 帧数、平均帧间隔、最大帧间隔、帧率、超出预算的帧数、播放和合并的动画次数
+        """
+        frames = len(self.frame_times)
+        mean = sum(self.frame_times) / frames if frames else 0.0
+        return {
+            "frames": frames,
+            "mean_frame_ms": mean,
+            "max_frame_ms": max(self.frame_times) if frames else 0.0,
+            "fps": 1000 / mean if mean else 0.0,
+            "over_budget_frames": sum(1 for t in self.frame_times if t > self.FRAME_BUDGET_MS * 1.5),
+            "animations_played": self.animations_played,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,240 @@
+"""
+autoplay.py
+==========
+
+AutoPlayer类在后台线程中运行AI搜索，用于提示和AI自动游戏，Qt的事件循环不会因为搜索而卡住。
+
+- 搜索在只有一个线程的QThreadPool中运行，AI模块（需要预先计算查找表）也在后台线程中第一次搜索时才导入；
+- 搜索结果通过信号（排队连接）回到界面线程，局面已经变化或者已经被取消的结果直接丢弃；
+- 自动游戏走出一步之后，Model已经是新的局面，此时立即开始搜索下一步，与滑动动画同时进行（预先搜索），
+  到了下一步的时间通常已经有结果，不需要再等待；
+- 玩家按下方向键、撤销或者重新开始时取消自动游戏：正在进行的搜索通过Searcher.stopped尽快结束；
+- 每一步之间的最小间隔可以调节，间隔为0时每次搜索一完成就走下一步，即AI能达到的最快速度。
+
+AI只支持4x4的网格。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import time
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from Model.history import pack_grid
+
+SPEEDS = (800, 400, 200, 100, 50, 0)  # 可选的每步最小间隔（毫秒），从慢到快
+
+
+class _SearchTask(QRunnable):
+    """
+    在线程池中搜索一个局面的最佳方向
+    """
+
+    def __init__(self, player, generation, key, grid):
+        super().__init__()
+        self.player = player
+        self.generation = generation
+        self.key = key
+        self.grid = grid
+
+    def run(self):
+        player = self.player
+        if self.generation != player.generation:
+            return  # 还没开始就已经过时
+        searcher = player.get_searcher()
+        searcher.stopped = False
+        if self.generation != player.generation:
+            return  # 清除stopped的同时可能又被取消了
+        from Model.ai import SearchCancelled
+        from Model.bitboard import encode_grid
+        try:
+            direction = searcher.best_move(encode_grid(self.grid))
+        except SearchCancelled:
+            return
+        player.search_finished.emit(self.generation, self.key, direction, dict(searcher.last_stats))
+
+
+class AutoPlayer(QObject):
+    search_finished = pyqtSignal(int, object, object, object)  # 代数、局面、方向、搜索统计，由后台线程发出
+    hint_ready = pyqtSignal(object)  # 提示的方向，没有可移动的方向时为None
+    running_changed = pyqtSignal(bool)  # 自动游戏开始或停止
+
+    def __init__(self, view, interval=200):
+        """
+        :param view: GameView 游戏窗口，需要提供model和play_move
+        :param interval: int 自动游戏每一步之间的最小间隔（毫秒）
+        """
+        super().__init__(view)
+        self.view = view
+        self.interval = interval
+        self.running = False  # 是否正在自动游戏
+        self.hint_requested = False  # 是否在等待提示的结果
+        self.generation = 0  # 每次取消或者开始新的搜索时加1，旧的搜索结果会被丢弃
+        self.searching = None  # 正在搜索的局面
+        self.result = None  # 最近一次完成的搜索(局面, 方向)
+        self.last_move_time = 0.0  # 上一次自动走棋的时间
+        self.searcher = None  # 只在线程池的线程中使用
+        self.stats = {"searches": 0, "cancelled": 0, "moves": 0, "last_search": {}}
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # 一个搜索线程，Searcher不需要加锁
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.step)
+        self.search_finished.connect(self.on_search_finished)
+
+    def get_searcher(self):
+        """
+        在搜索线程中第一次使用时导入AI模块并创建Searcher
+        :return: Searcher
+        """
+        if self.searcher is None:
+            from Model.ai import Searcher
+            self.searcher = Searcher()
+        return self.searcher
+
+    def current_key(self):
+        return pack_grid(self.view.model.grid)
+
+    def request_search(self):
+        """
+        搜索当前局面，已经有结果或者正在搜索这个局面时不重复搜索
+        :return:
+        """
+        key = self.current_key()
+        if self.searching == key or (self.result is not None and self.result[0] == key):
+            return
+        self.cancel_search()
+        self.searching = key
+        self.pool.start(_SearchTask(self, self.generation, key, [row[:] for row in self.view.model.grid]))
+
+    def cancel_search(self):
+        """
+        取消正在进行和排队中的搜索
+        :return:
+        """
+        self.generation += 1
+        if self.searching is not None:
+            self.stats["cancelled"] += 1
+            self.searching = None
+        if self.searcher is not None:
+            self.searcher.stopped = True
+
+    def on_search_finished(self, generation, key, direction, search_stats):
+        """
+        在界面线程中接收搜索结果
+        """
+        if generation != self.generation:
+            return
+        self.searching = None
+        self.result = (key, direction)
+        self.stats["searches"] += 1
+        self.stats["last_search"] = search_stats
+        if key != self.current_key():
+            return
+        if self.hint_requested:
+            self.hint_requested = False
+            self.hint_ready.emit(direction)
+        if self.running:
+            self.schedule()
+
+    def hint(self):
+        """
+        异步搜索当前局面的提示，结果通过hint_ready发出
+        :return:
+        """
+        key = self.current_key()
+        if self.result is not None and self.result[0] == key:
+            self.hint_ready.emit(self.result[1])
+            return
+        self.hint_requested = True
+        self.request_search()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.running_changed.emit(True)
+        self.schedule()
+
+    def stop(self):
+        """
+        停止自动游戏并取消搜索，玩家接管时调用
+        :return:
+        """
+        self.timer.stop()
+        self.hint_requested = False
+        self.cancel_search()
+        if self.running:
+            self.running = False
+            self.running_changed.emit(False)
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def set_interval(self, interval):
+        """
+        :param interval: int 每一步之间的最小间隔（毫秒），0表示搜索完成就走下一步
+        :return:
+        """
+        self.interval = max(0, interval)
+        if self.running and self.timer.isActive():
+            self.schedule()
+
+    def faster(self):
+        """
+        换到SPEEDS中下一档更短的间隔
+        """
+        shorter = [speed for speed in SPEEDS if speed < self.interval]
+        self.set_interval(shorter[0] if shorter else SPEEDS[-1])
+
+    def slower(self):
+        """
+        换到SPEEDS中上一档更长的间隔
+        """
+        longer = [speed for speed in SPEEDS if speed > self.interval]
+        self.set_interval(longer[-1] if longer else SPEEDS[0])
+
+    def schedule(self):
+        """
+        当前局面已经有搜索结果时，等到距离上一步满interval毫秒再走；还没有结果时开始搜索，结果到达后再调用
+        :return:
+        """
+        if self.result is None or self.result[0] != self.current_key():
+            self.request_search()
+            return
+        wait = self.last_move_time + self.interval / 1000 - time.perf_counter()
+        self.timer.start(max(0, int(wait * 1000)))
+
+    def step(self):
+        """
+        自动走一步，然后立即开始搜索下一个局面
+        :return:
+        """
+        if not self.running:
+            return
+        key = self.current_key()
+        if self.result is None or self.result[0] != key:
+            self.request_search()
+            return
+        direction = self.result[1]
+        if direction is None or not self.view.play_move(direction):
+            self.stop()  # 无路可走
+            return
+        self.last_move_time = time.perf_counter()
+        self.stats["moves"] += 1
+        if self.running:  # play_move可能因为输掉而停止了自动游戏
+            self.request_search()
+
+    def shutdown(self, timeout=1000):
+        """
+        停止自动游戏，等待搜索线程结束
+        :param timeout: int 最多等待的毫秒数
+        :return:
+        """
+        self.stop()
+        self.pool.clear()
+        self.pool.waitForDone(timeout)
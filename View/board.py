@@ -0,0 +1,277 @@
+"""
+board.py
+==========
+
+BoardWidget类用一个控件绘制整个棋盘，替代每个格子一个Block（QWidget + QLabel）的做法，主要特点有：
+
+- 整个棋盘在一次paintEvent中绘制，每个格子只是一次drawPixmap，不再需要32个控件和按动态属性重新polish样式；
+- 每一种数字的方块（圆角背景和文字）按主题、方块边长和设备像素比预先绘制成QPixmap，缓存在模块级的TileGlyphs中，
+  同一个窗口中的多个棋盘共用同一份缓存，切换主题时只是换一份缓存；
+- 数字变化时只重绘发生变化的格子所在的矩形，Qt会把同一帧内的多次重绘合并；
+- 滑动动画的精灵也由棋盘自己绘制：start_slide记录每个移动的数字的起点和终点，set_slide_progress按进度重绘，
+  动画过程中起点显示为空格，动画的时间和帧统计由View/animation.py中的TileAnimator负责。
+
+直接运行本文件会在一个窗口中同时显示多局自我对局（python -m View.board --boards 36），并输出重绘的帧率。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+from PyQt5.QtCore import Qt, QRect, QRectF
+from PyQt5.QtGui import QPainter, QPixmap, QColor, QFont
+from PyQt5.QtWidgets import QWidget
+
+_glyph_cache = {}  # (主题, 方块边长, 设备像素比) -> TileGlyphs
+
+
+class TileGlyphs:
+    """
+    一个主题在某个方块边长下所有数字的方块图像，第一次用到某个数字时才绘制
+    """
+
+    def __init__(self, theme, block_size, device_pixel_ratio=1.0):
+        """
+        :param theme: Theme 主题
+        :param block_size: int 方块边长
+        :param device_pixel_ratio: float 设备像素比，高分屏上按实际像素绘制
+        """
+        self.theme = theme
+        self.block_size = block_size
+        self.device_pixel_ratio = device_pixel_ratio
+        self.radius = max(2, round(6 * block_size / 100))  # 圆角半径与样式表中的方块一致
+        self.pixmaps = {}  # 数字 -> QPixmap
+
+    def get(self, value):
+        """
+        :param value: int 方块上的数字，0表示空格
+        :return: QPixmap 方块图像
+        """
+        pixmap = self.pixmaps.get(value)
+        if pixmap is None:
+            pixmap = self.pixmaps[value] = self.render(value)
+        return pixmap
+
+    def render(self, value):
+        """
+        绘制一个方块：圆角背景和居中的数字，字号按方块边长等比缩放
+        :param value: int 方块上的数字
+        :return: QPixmap 方块图像
+        """
+        size = self.block_size
+        ratio = self.device_pixel_ratio
+        style = self.theme.get_style(value)
+        pixmap = QPixmap(round(size * ratio), round(size * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.TextAntialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(style.background))
+        painter.drawRoundedRect(QRectF(0, 0, size, size), self.radius, self.radius)
+        if value:
+            font = QFont()
+            font.setPixelSize(max(8, round(style.font_size * size / 100)))
+            painter.setFont(font)
+            painter.setPen(QColor(style.foreground))
+            painter.drawText(QRect(0, 0, size, size), Qt.AlignCenter, str(value))
+        painter.end()
+        return pixmap
+
+
+def get_glyphs(theme, block_size, device_pixel_ratio=1.0):
+    """
+    获取共用的方块图像缓存
+    :param theme: Theme 主题
+    :param block_size: int 方块边长
+    :param device_pixel_ratio: float 设备像素比
+    :return: TileGlyphs
+    """
+    key = (theme, block_size, device_pixel_ratio)
+    glyphs = _glyph_cache.get(key)
+    if glyphs is None:
+        glyphs = _glyph_cache[key] = TileGlyphs(theme, block_size, device_pixel_ratio)
+    return glyphs
+
+
+class BoardWidget(QWidget):
+    def __init__(self, grid_size, block_size, theme, spacing=None, parent=None):
+        """
+        :param grid_size: int 网格大小
+        :param block_size: int 方块边长（像素）
+        :param theme: Theme 主题
+        :param spacing: int 方块之间的间距，默认随方块大小缩放（边长100时为10）
+        :param parent: QWidget 父控件
+        """
+        super().__init__(parent)
+        self.grid_size = grid_size
+        self.block_size = block_size
+        self.spacing = max(4, block_size // 10) if spacing is None else spacing
+        self.theme = theme
+        self.values = [[0] * grid_size for _ in range(grid_size)]  # 当前显示的数字
+        self.sprites = []  # 正在滑动的数字(数字, 起点, 终点)
+        self.slide_progress = 0.0  # 滑动动画的进度，0~1
+        self.glyphs = None
+        self.paints = 0  # 调用paintEvent的次数
+        side = grid_size * block_size + (grid_size - 1) * self.spacing
+        self.setFixedSize(side, side)
+        self.setFocusPolicy(Qt.NoFocus)
+
+    def set_theme(self, theme):
+        """
+        切换主题，只需要换一份方块图像缓存并重绘
+        :param theme: Theme 主题
+        :return:
+        """
+        self.theme = theme
+        self.glyphs = None
+        self.update()
+
+    def cell_rect(self, i, j):
+        """
+        :param i: int 行
+        :param j: int 列
+        :return: QRect 格子在棋盘上的矩形
+        """
+        step = self.block_size + self.spacing
+        return QRect(j * step, i * step, self.block_size, self.block_size)
+
+    def set_value(self, i, j, value):
+        """
+        设置一个格子的数字，数字不变时不做任何操作
+        :param i: int 行
+        :param j: int 列
+        :param value: int 方块上的数字，0表示空格
+        :return: bool 数字是否发生了变化
+        """
+        if self.values[i][j] == value:
+            return False
+        self.values[i][j] = value
+        self.update(self.cell_rect(i, j))
+        return True
+
+    def set_grid(self, grid):
+        """
+        显示整个网格，只重绘发生变化的格子
+        :param grid: list 二维列表
+        :return: int 发生变化的格子数
+        """
+        changed = 0
+        for i, row in enumerate(grid):
+            for j, value in enumerate(row):
+                if self.set_value(i, j, value):
+                    changed += 1
+        return changed
+
+    def start_slide(self, movements):
+        """
+        开始绘制滑动的数字，起点在滑动过程中显示为空格
+        :param movements: list MoveResult.movements，(起点, 终点, 数字)的列表
+        :return:
+        """
+        self.sprites = [(value, source, target) for source, target, value in movements]
+        self.slide_progress = 0.0
+        for source, _, _ in movements:
+            self.values[source[0]][source[1]] = 0
+        self.update()
+
+    def set_slide_progress(self, progress):
+        """
+        :param progress: float 滑动动画的进度，0~1（已经过缓动曲线变换）
+        :return:
+        """
+        self.slide_progress = progress
+        self.update()
+
+    def end_slide(self):
+        """
+        停止绘制滑动的数字，格子由调用方刷新为最新的局面
+        :return:
+        """
+        if self.sprites:
+            self.sprites = []
+            self.update()
+
+    def paintEvent(self, event):
+        self.paints += 1
+        glyphs = self.glyphs
+        if glyphs is None:
+            glyphs = self.glyphs = get_glyphs(self.theme, self.block_size, self.devicePixelRatioF())
+        get = glyphs.get
+        step = self.block_size + self.spacing
+        painter = QPainter(self)
+        y = 0
+        for row in self.values:
+            x = 0
+            for value in row:
+                painter.drawPixmap(x, y, get(value))
+                x += step
+            y += step
+        progress = self.slide_progress
+        for value, (si, sj), (ti, tj) in self.sprites:
+            painter.drawPixmap(round((sj + (tj - sj) * progress) * step), round((si + (ti - si) * progress) * step),
+                               get(value))
+        painter.end()
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    import argparse
+    import random
+    import sys
+    import time
+
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication, QGridLayout
+
+    from Model.bitboard import BitboardModel
+    from Model.selfplay import greedy_policy
+    from View.theme import get_theme
+
+    parser = argparse.ArgumentParser(description="同时显示多局自我对局")
+    parser.add_argument("--boards", type=int, default=36, help="棋盘数量")
+    parser.add_argument("--block-size", type=int, default=24, help="方块边长")
+    parser.add_argument("--seconds", type=float, default=0, help="运行的秒数，0表示一直运行")
+    parser.add_argument("--theme", default=None, help="主题名")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    theme = get_theme(args.theme)
+    window = QWidget()
+    window.setAutoFillBackground(True)
+    window.setPalette(theme.palette())
+    layout = QGridLayout(window)
+    columns = max(1, round(args.boards ** 0.5))
+    games = []
+    for index in range(args.boards):
+        board = BoardWidget(4, args.block_size, theme)
+        layout.addWidget(board, index // columns, index % columns)
+        model = BitboardModel(index)
+        model.reset()
+        games.append((model, board, random.Random(index)))
+
+    frames = []
+
+    def tick():
+        frames.append(time.perf_counter())
+        for model, board, rng in games:
+            if model.check_lost():
+                model.reset()
+            else:
+                model.fast_move(greedy_policy(model, rng))
+            board.set_grid(model.grid)
+
+    timer = QTimer()
+    timer.timeout.connect(tick)
+    timer.start(16)
+
+    def report():
+        elapsed = frames[-1] - frames[0] if len(frames) > 1 else 0
+        print(f"{args.boards}个棋盘，{len(frames)}帧，{(len(frames) - 1) / elapsed if elapsed else 0:.1f} 帧/秒，"
+              f"共重绘{sum(board.paints for _, board, _ in games)}次")
+        app.quit()
+
+    if args.seconds:
+        QTimer.singleShot(int(args.seconds * 1000), report)
+    window.show()
+    sys.exit(app.exec_())
@@ -0,0 +1,162 @@
+"""
+input_queue.py
+==========
+
+InputQueue类是GameView的方向键输入管线，按键处理、移动和界面刷新分开进行：
+
+- keyPressEvent只把方向放进有界队列（满了之后新的按键被丢弃并计数），然后安排一次处理，立即返回；
+- 事件循环处理完当前积压的按键事件后，drain一次把队列中的移动全部应用到Model（同时写日志和撤销历史），
+  Model始终是最新的局面，不会因为界面刷新慢而积压；
+- 界面每一帧最多刷新一次：距离上一帧不足一帧的时间时，等到下一帧再刷新，只显示最新的局面；
+  一帧之内只有一步时播放滑动动画，多步时把这些步发生变化的格子合并后直接显示，合并掉的步数记录在coalesced中；
+- 按住方向键时系统的自动重复可能每秒产生几十个事件，repeat_rate限制自动重复每秒最多应用的步数，
+  超出的自动重复事件直接丢弃（不影响手动连续按键）。
+
+stats方法返回收到的事件数、应用的移动数、合并的步数、丢弃的事件数和刷新的帧数。
+启用统计（instrument_view设置instrumentation）时，每个方向键从放进队列到它的移动刷新到界面的时间记录在view.key_press阶段中，
+无效移动记录到drain处理完它为止，被丢弃的按键不记录。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, QTimer
+
+DEFAULT_REPEAT_RATE = 15  # 默认自动重复每秒最多应用的步数
+
+
+class InputQueue(QObject):
+    FRAME_INTERVAL = 1 / 60  # 两次刷新之间的最小间隔（秒）
+
+    def __init__(self, view, capacity=16, repeat_rate=DEFAULT_REPEAT_RATE):
+        """
+        :param view: GameView 游戏窗口，需要提供model、apply_move、dirty_cells和update_view
+        :param capacity: int 队列中最多等待的按键数
+        :param repeat_rate: int 自动重复每秒最多应用的步数，0表示不限制
+        """
+        super().__init__(view)
+        self.view = view
+        self.queue = deque()
+        self.capacity = capacity
+        self.repeat_rate = repeat_rate
+        self.last_repeat_time = 0.0  # 上一次接受自动重复事件的时间
+        self.drain_scheduled = False
+        self.pending_moves = 0  # 已经应用但还没有刷新到界面的步数
+        self.last_result = None  # 其中最后一步的MoveResult
+        self.last_frame_time = 0.0  # 上一次刷新界面的时间
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.render)
+        self.counters = {"events": 0, "moves": 0, "noop_moves": 0, "coalesced": 0, "dropped": 0,
+                         "repeat_throttled": 0, "frames": 0}
+        self.instrumentation = None  # 启用统计时为Instrumentation，由instrument_view设置
+        self.pressed_times = []  # 已经应用但还没有刷新到界面的按键进入队列的时间（纳秒），只在启用统计时记录
+
+    def push(self, direction, auto_repeat=False):
+        """
+        把一次方向键放进队列，在事件循环空闲时处理
+        :param direction: str 移动方向
+        :param auto_repeat: bool 是否为按住按键时系统产生的自动重复事件
+        :return: bool 是否放进了队列
+        """
+        counters = self.counters
+        counters["events"] += 1
+        if auto_repeat and self.repeat_rate:
+            now = time.perf_counter()
+            if now - self.last_repeat_time < 1 / self.repeat_rate:
+                counters["repeat_throttled"] += 1
+                return False
+            self.last_repeat_time = now
+        if len(self.queue) >= self.capacity:
+            counters["dropped"] += 1
+            return False
+        self.queue.append((direction, time.perf_counter_ns() if self.instrumentation is not None else 0))
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            QTimer.singleShot(0, self.drain)
+        return True
+
+    def drain(self):
+        """
+        把队列中的移动全部应用到Model，再安排刷新界面
+        :return: int 有效移动的步数
+        """
+        self.drain_scheduled = False
+        view = self.view
+        model = view.model
+        applied = 0
+        while self.queue:
+            if not view.block_movement_flag or model.check_lost():
+                self.queue.clear()  # 输掉之后剩下的按键没有意义
+                break
+            direction, pressed = self.queue.popleft()
+            result = view.apply_move(direction)
+            if result is None:
+                self.counters["noop_moves"] += 1
+                if pressed and self.instrumentation is not None:
+                    self.instrumentation.observe("view.key_press", time.perf_counter_ns() - pressed)
+                continue
+            applied += 1
+            if pressed:
+                self.pressed_times.append(pressed)
+            view.dirty_cells.update(model.changed_cells)
+            self.last_result = result
+        if applied:
+            self.counters["moves"] += applied
+            self.pending_moves += applied
+            self.schedule_render()
+        return applied
+
+    def schedule_render(self):
+        """
+        距离上一帧已经超过一帧的时间时立即刷新，否则等到下一帧
+        :return:
+        """
+        if self.frame_timer.isActive():
+            return
+        wait = self.last_frame_time + self.FRAME_INTERVAL - time.perf_counter()
+        if wait <= 0:
+            self.render()
+        else:
+            self.frame_timer.start(int(wait * 1000) + 1)
+
+    def render(self):
+        """
+        把最新的局面刷新到界面，一帧之内有多步时不播放动画
+        :return:
+        """
+        if not self.pending_moves:
+            return
+        self.last_frame_time = time.perf_counter()
+        self.counters["frames"] += 1
+        self.counters["coalesced"] += self.pending_moves - 1
+        result = self.last_result if self.pending_moves == 1 else None
+        self.pending_moves = 0
+        self.last_result = None
+        self.view.update_view(result)
+        if self.pressed_times:
+            if self.instrumentation is not None:
+                now = time.perf_counter_ns()
+                for pressed in self.pressed_times:
+                    self.instrumentation.observe("view.key_press", now - pressed)
+            self.pressed_times = []
+
+    def clear(self):
+        """
+        丢弃还没有处理的按键和还没有刷新的步数，撤销、重做或者重新开始时调用（之后由调用方完整刷新界面）
+        :return:
+        """
+        self.queue.clear()
+        self.frame_timer.stop()
+        self.pending_moves = 0
+        self.last_result = None
+        self.pressed_times = []
+
+    def stats(self):
+        """
+        :return: dict 输入管线的计数器
+        """
+        return dict(self.counters)
@@ -0,0 +1,212 @@
+"""
+theme.py
+==========
+
+游戏界面的主题（配色方案），主要作用有：
+
+- Theme在创建时为每一种数字预先生成一个不可变的TileStyle（背景色、文字颜色、字号），按数字的指数保存在元组中，
+  get_style和get_color只需要一次下标查找，不会在每次调用时创建字典；
+- 每个主题缓存窗口共用的样式表（分数标签的颜色），窗口背景使用缓存的QPalette；
+- View/board.py中的BoardWidget按get_style预先绘制每一种数字的方块图像，切换主题时只需要替换样式表、调色板和方块图像，
+  不需要重新创建控件。
+
+内置主题见THEMES，可以用register_theme注册新的主题。
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+MAX_EXPONENT = 17  # 4x4网格上理论上的最大数字为2**17
+
+DEFAULT_THEME = "classic"
+
+
+class TileStyle:
+    """
+    一种数字的方块样式，创建后不可修改
+
+    - background: 背景色
+    - foreground: 文字颜色
+    - font_size: 4x4网格（方块边长100）时的字号，其他大小的网格按边长等比缩放
+    """
+    __slots__ = ("background", "foreground", "font_size")
+
+    def __init__(self, background, foreground, font_size):
+        object.__setattr__(self, "background", background)
+        object.__setattr__(self, "foreground", foreground)
+        object.__setattr__(self, "font_size", font_size)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TileStyle不可修改")
+
+    def __repr__(self):
+        return f"TileStyle(background={self.background!r}, foreground={self.foreground!r}, font_size={self.font_size})"
+
+
+def get_font_size(value):
+    """
+    根据数字大小返回不同字体大小
+    :param value: int 方块上的数字
+    :return: int 字体大小
+    """
+    if value < 100:
+        return 36
+    elif value < 1000:
+        return 32
+    elif value < 10000:
+        return 24
+    else:
+        return 20
+
+
+class Theme:
+    def __init__(self, name, window, text, empty, tile_colors, light_text=(2, 4), super_tile=None):
+        """
+        :param name: str 主题名
+        :param window: str 窗口背景色
+        :param text: str 分数标签和深色文字的颜色
+        :param empty: str 空格的背景色
+        :param tile_colors: list 2、4、8……的背景色，依次对应指数1、2、3……
+        :param light_text: (int, int) 使用浅色文字的数字范围（包括两端），为None时都使用深色文字
+        :param super_tile: str 超出tile_colors的数字的背景色，为None时与空格相同
+        """
+        self.name = name
+        self.window = window
+        self.text = text
+        self.empty = empty
+        # 以指数为下标的样式，下标0为空格
+        styles = [TileStyle(empty, text, 36)]
+        for exponent in range(1, MAX_EXPONENT + 1):
+            value = 1 << exponent
+            if exponent <= len(tile_colors):
+                background = tile_colors[exponent - 1]
+            else:
+                background = super_tile or empty
+            if light_text is not None and light_text[0] <= value <= light_text[1]:
+                foreground = "#f9f6f2"
+            else:
+                foreground = text
+            styles.append(TileStyle(background, foreground, get_font_size(value)))
+        self.styles = tuple(styles)
+        self._style_sheet = None  # 窗口的样式表
+        self._palette = None
+
+    def get_style(self, value):
+        """
+        :param value: int 方块上的数字，0表示空格
+        :return: TileStyle 该数字的样式
+        """
+        exponent = value.bit_length() - 1 if value > 0 else 0
+        if exponent >= len(self.styles):
+            exponent = len(self.styles) - 1
+        return self.styles[exponent]
+
+    def get_color(self, value):
+        """
+        :param value: int 方块上的数字
+        :return: str 该数字的背景色
+        """
+        return self.get_style(value).background
+
+    def style_sheet(self):
+        """
+        窗口的样式表，目前只有分数标签的颜色（方块由BoardWidget按get_style绘制），第一次使用时生成
+        :return: str 样式表
+        """
+        if self._style_sheet is None:
+            self._style_sheet = f"""
+                QLabel#score {{
+                    color: {self.text};
+                }}
+            """
+        return self._style_sheet
+
+    def palette(self):
+        """
+        窗口背景的调色板，第一次使用时创建（需要先导入PyQt5）
+        :return: QPalette
+        """
+        if self._palette is None:
+            from PyQt5.QtGui import QPalette, QColor
+            self._palette = QPalette()
+            self._palette.setColor(QPalette.Background, QColor(self.window))
+        return self._palette
+
+
+THEMES = {}
+
+
+def register_theme(theme):
+    """
+    注册一个主题，同名的主题会被替换
+    :param theme: Theme 主题
+    :return:
+    """
+    THEMES[theme.name] = theme
+
+
+def get_theme(name=None):
+    """
+    :param name: str 主题名，为None时返回默认主题
+    :return: Theme 主题
+    """
+    if name is None:
+        name = DEFAULT_THEME
+    try:
+        return THEMES[name]
+    except KeyError:
+        raise ValueError(f"没有名为{name}的主题，可选：{', '.join(THEMES)}") from None
+
+
+def next_theme(name):
+    """
+    按注册顺序返回下一个主题，用于循环切换
+    :param name: str 当前主题名
+    :return: Theme 下一个主题
+    """
+    names = list(THEMES)
+    index = names.index(name) if name in names else -1
+    return THEMES[names[(index + 1) % len(names)]]
+
+
+# 经典配色，与最初版本的界面一致
+register_theme(Theme("classic", window="#faf8ef", text="#776e65", empty="#CDC1B4", tile_colors=[
+    "#FFDAB9",  # 浅杏仁色
+    "#FFA07A",  # 海洋红色
+    "#FF7F50",  # 珊瑚橙色
+    "#FF6347",  # 番茄红色
+    "#FF4500",  # 橙红色
+    "#FF8C00",  # 暗橙色
+    "#FFFF00",  # 鲜黄色
+    "#FFD700",  # 金色
+    "#FFA500",  # 橙色
+    "#FF8F00",  # 暗橙色
+    "#FF4500",  # 橙红色
+]))
+
+# 原版2048的配色，2和4背景较浅，使用深色文字
+register_theme(Theme("original", window="#faf8ef", text="#776e65", empty="#cdc1b4",
+                     light_text=(8, 1 << MAX_EXPONENT), super_tile="#3c3a32", tile_colors=[
+                         "#eee4da", "#ede0c8", "#f2b179", "#f59563", "#f67c5f", "#f65e3b",
+                         "#edcf72", "#edcc61", "#edc850", "#edc53f", "#edc22e",
+                     ]))
+
+# 深色主题，文字颜色本身就是浅色
+register_theme(Theme("dark", window="#1e1e24", text="#d8d8e0", empty="#3a3a46", light_text=None,
+                     super_tile="#8a2be2", tile_colors=[
+                         "#4a4a5e", "#585874", "#2e6f95", "#2a8fb8", "#25a9c9", "#3fbfa0",
+                         "#6cc46a", "#a3c94a", "#d4c23a", "#e39a2f", "#e8662c",
+                     ]))
+
+# 冷色主题，深色背景的数字使用浅色文字
+register_theme(Theme("ocean", window="#eef6fa", text="#24445c", empty="#bcd4e0",
+                     light_text=(64, 1 << MAX_EXPONENT), super_tile="#0b2233", tile_colors=[
+                         "#e0f2fb", "#c4e6f5", "#9dd3ec", "#74bfe2", "#4aa8d6", "#2b8fc4",
+                         "#1f76a8", "#1a5f8a", "#164b6e", "#123a56", "#0e2c42",
+                     ]))
+
+
+# 代码测试部分
+if __name__ == '__main__':
+    for theme in THEMES.values():
+        print(theme.name, [theme.get_color(1 << exponent) for exponent in range(1, 12)])
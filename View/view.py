@@ -6,41 +6,73 @@ view.py
 
 - 显示游戏区块、分数标签和按钮等元素；
 - 更新游戏区块的显示和分数标签，并在游戏胜利或失败时弹出消息框；
-- 设置游戏界面的样式，包括背景颜色、分数标签和游戏区块的样式；
-- 处理用户的按键事件，以控制游戏的运行。
+- 设置游戏界面的样式，包括背景颜色、分数标签和游戏区块的样式，区块的数量和大小由Model的网格大小决定；
+- 整个棋盘由View/board.py中的BoardWidget在一次paintEvent中绘制，每种数字的方块图像预先缓存，不再为每个格子创建控件；
+- Ctrl+Z撤销、Ctrl+Y重做，历史记录保存在Model/history.py的环形缓冲区中，输掉之后也可以撤销；
+- 样式来自View/theme.py中预先生成的主题，按T键可以在运行时切换主题，棋盘换一份方块图像缓存后重绘；
+- 处理用户的按键事件，以控制游戏的运行：方向键经过View/input_queue.py中的InputQueue排队，
+  移动立即应用到Model，界面每一帧最多刷新一次，按住方向键时自动重复的步数受repeat_rate限制。
+传入排行榜客户端时，对局结束和关闭窗口时会把成绩异步提交到排行榜服务。
+AI提示和自动游戏由View/autoplay.py中的AutoPlayer在后台线程中搜索，不会卡住界面；
+为了加快启动，AutoPlayer在第一次使用时才创建，最高分数在窗口显示之后由后台线程读取。
 除此之外，GameView类还持有一个Model对象，用于与游戏模型进行交互，实现游戏的逻辑。
 
 Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
 
 Date: 2023-4-5
 """
-from PyQt5.QtWidgets import QWidget, QGridLayout, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, \
-    QMessageBox
-from PyQt5.QtGui import QKeyEvent, QPalette, QColor, QFont
-from PyQt5.QtCore import Qt, QEvent, QPoint
-# 导入自定义的Model类、GameMessageBox类和Block类。
+import threading
+
+from PyQt5.QtWidgets import QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox
+from PyQt5.QtGui import QKeyEvent, QFont
+from PyQt5.QtCore import Qt, QEvent, pyqtSignal
+# 导入自定义的Model类、GameMessageBox类和BoardWidget类。
 from Model.model import Model
+from Model.journal import GameJournal
+from Model.history import GameHistory
 from View.message_box import GameMessageBox
-from View.block import Block
+from View.board import BoardWidget
+from View.animation import TileAnimator
+from View.input_queue import InputQueue, DEFAULT_REPEAT_RATE
+from View.theme import get_theme, next_theme
 
 
 class GameView(QWidget):
-    def __init__(self, model: Model):
+    highest_score_loaded = pyqtSignal(int)  # 后台线程读取到最高分数后发出，在界面线程中更新
+    KEY_DIRECTIONS = {Qt.Key_Up: "up", Qt.Key_Down: "down", Qt.Key_Left: "left", Qt.Key_Right: "right"}
+
+    def __init__(self, model: Model, leaderboard=None, theme=None, repeat_rate=DEFAULT_REPEAT_RATE):
+        """
+        :param model: Model 游戏模型
+        :param leaderboard: LeaderboardClient 排行榜客户端，为None时不提交成绩
+        :param theme: str 主题名，为None时使用默认主题
+        :param repeat_rate: int 按住方向键时每秒最多移动的步数，0表示不限制
+        """
         super().__init__()
         self.model = model
+        self.theme = get_theme(theme)
+        self.leaderboard = leaderboard
+        self.score_submitted = False  # 本局的成绩是否已经提交过
         self.block_movement_flag = True  # 新增一个标志位来控制方块的移动
+        self._autoplayer = None  # AI提示和自动游戏，第一次使用时才创建
+        self.highest_score_loaded.connect(self.on_highest_score_loaded)
+        self.journal = GameJournal()  # 对局进度日志，用于崩溃后恢复
+        self.history = GameHistory()  # 撤销/重做的历史记录
+        self.game_started = False  # 窗口第一次显示时才开始（或恢复）对局
+        self.win_announced = False  # 本局是否已经弹出过胜利消息框，每局只弹出一次
+        self.block_size = self.get_block_size(model.grid_size)  # 方块的边长，网格越大方块越小
         self.setWindowTitle("2048-GAME")
         # 创建两个QLabel对象来显示当前分数和最高分数。
         self.score_label = QLabel(f"当前分数: {self.model.score}")
+        self.score_label.setObjectName("score")
         self.score_label.setFont(QFont("Arial", 16))
         self.score_label.setAlignment(Qt.AlignCenter)
         self.highest_score_label = QLabel(f"最高分数: {self.model.highest_score}")
+        self.highest_score_label.setObjectName("score")
         self.highest_score_label.setFont(QFont("Arial", 16))
         self.highest_score_label.setAlignment(Qt.AlignCenter)
-        # 创建一个QGridLayout对象，用于管理16个Block对象，设置Block之间的垂直和水平间距为10。
-        self.grid_layout = QGridLayout()
-        self.grid_layout.setVerticalSpacing(10)
-        self.grid_layout.setHorizontalSpacing(10)
+        # 创建绘制整个棋盘的BoardWidget，方块之间的间距随方块大小缩放（4x4时为10）。
+        self.board = BoardWidget(model.grid_size, self.block_size, self.theme)
         # 创建两个QPushButton对象，分别用于重新开始和退出游戏，并为它们的点击事件绑定对应的槽函数。
         self.new_game_button = QPushButton("重新开始")
         self.new_game_button.setFixedSize(100, 40)
@@ -67,7 +99,7 @@ class GameView(QWidget):
         # 创建一个垂直的QVBoxLayout对象，用于存放当前分数和最高分数
         vbox_layout = QVBoxLayout()
         vbox_layout.addLayout(score_layout)
-        vbox_layout.addLayout(self.grid_layout)
+        vbox_layout.addWidget(self.board, alignment=Qt.AlignCenter)
         vbox_layout.addLayout(hbox_layout)
         vbox_layout.setContentsMargins(10, 10, 10, 10)
         vbox_layout.addStretch()
@@ -76,78 +108,93 @@ class GameView(QWidget):
         self.setLayout(vbox_layout)
         # 设置样式
         self.set_style()
+        self.dirty_cells = set()  # 等待刷新的格子
+        self.animator = TileAnimator(self)  # 方块滑动动画
+        self.input_queue = InputQueue(self, repeat_rate=repeat_rate)  # 方向键的输入队列
 
     def set_style(self):
         """
         初始化设置游戏界面的样式，包括背景颜色、分数标签和游戏区块的样式
         :return:
         """
-        # 设置背景颜色
-        palette = QPalette()
-        palette.setColor(QPalette.Background, QColor("#faf8ef"))  # 设置颜色为浅黄色
         self.setAutoFillBackground(True)  # 设置自动填充背景
-        self.setPalette(palette)  # 设置背景调色板
-        # # 设置分数标签的样式
-        self.score_label.setStyleSheet("""
-            color: #776e65;
-        """)
-        self.highest_score_label.setStyleSheet("""
-            color: #776e65;
-        """)
-        # 设置游戏区块的样式
-        for i in range(4):
-            for j in range(4):
-                block = Block.create_block(" ", QPoint(i, j))
-                block.setFixedSize(100, 100)
-                block.set_style_sheet("""
-                    background-color: #cdc1b4;
-                    border-radius: 6px;
-                    color: #776e65;
-                """)
-                self.grid_layout.addWidget(block, i, j)
-
-    def update_view(self):
+        self.apply_theme()
+
+    def apply_theme(self):
+        """
+        应用当前主题：背景使用主题缓存的调色板，分数标签使用主题缓存的样式表，棋盘使用主题的方块图像
+        :return:
+        """
+        # 设置样式表会重新计算调色板，所以调色板在样式表之后设置
+        self.setStyleSheet(self.theme.style_sheet())
+        self.setPalette(self.theme.palette())
+        self.board.set_theme(self.theme)
+
+    def set_theme(self, name):
+        """
+        在运行时切换主题，棋盘（包括动画中的方块）按新主题的方块图像重绘，不需要重新创建控件
+        :param name: str 主题名
+        :return:
+        """
+        self.theme = get_theme(name)
+        self.apply_theme()
+
+    def update_view(self, result=None):
         """
         更新游戏区块的显示和分数标签，并在游戏胜利或失败时弹出消息框
+        只刷新Model在上一次移动中记录的发生变化的格子
+        :param result: MoveResult 上一次移动的结果，为None时（如新游戏）按完整刷新处理
         :return:
         """
-        for i in range(4):
-            for j in range(4):
-                value = self.model.grid[i][j]
-                block = self.grid_layout.itemAtPosition(i, j).widget()
-                if isinstance(block, Block):
-                    if self.model.last_move_direction == "left":
-                        pass
-                    elif self.model.last_move_direction == "right":
-                        pass
-                    elif self.model.last_move_direction == "up":
-                        pass
-                    elif self.model.last_move_direction == "down":
-                        pass
-                    else:
-                        pass
-                    block.set_label(str(value) if value != 0 else " ")
-                    block.set_style_sheet(f"""
-                        background-color: {self.get_color(value)};
-                        border-radius: 6px;
-                        color: {'#f9f6f2' if value in [2, 4] else '#776e65'};
-                        font-size: {self.get_font_size(value)}px;
-                    """)
-
-        if self.model.check_win():
-            win = GameMessageBox("你赢了！", "本场对局你已胜利，点击确定后重新开始！",
-                                 self.new_game_button_clicked, self.block_not_movement)
-            win.show()
+        self.dirty_cells.update(self.model.changed_cells)
+        if result is None:
+            self.animator.stop()
+            self.flush_cells()
+        elif not self.animator.animate(result):
+            # 没有需要滑动的数字，或者上一次动画还没结束时，直接显示最新局面
+            self.flush_cells()
+
+        # check_win和check_lost都是O(1)的，胜利消息框每局只弹出一次，点击取消可以继续游戏
+        if not self.win_announced and self.model.check_win():
+            self.win_announced = True
+            self.show_message_box("你赢了！", "本场对局你已胜利，点击确定后重新开始，点击取消继续游戏！",
+                                  self.new_game_button_clicked, self.setFocus)
 
         if self.model.check_lost():
-            lost = GameMessageBox("你输啦！", "本局游戏已失败，点击确定后重新开始！",
+            self.stop_autoplay()
+            self.journal.finish()  # 对局结束，不再需要恢复
+            self.submit_score()
+            self.show_message_box("你输啦！", "本局游戏已失败，点击确定后重新开始！",
                                   self.new_game_button_clicked, self.block_not_movement)
-            lost.show()
 
         # 更新分数标签
         self.score_label.setText(f"当前分数: {self.model.score}")
         self.highest_score_label.setText(f"最高分数: {self.model.highest_score}")
 
+    def show_message_box(self, title, text, on_ok_clicked, on_cancel_clicked):
+        """
+        创建并显示胜利或失败的消息框
+        :param title: str 标题
+        :param text: str 内容
+        :param on_ok_clicked: 点击确定时的回调
+        :param on_cancel_clicked: 点击取消或关闭时的回调
+        :return: GameMessageBox 消息框
+        """
+        box = GameMessageBox(title, text, on_ok_clicked, on_cancel_clicked)
+        box.show()
+        return box
+
+    def flush_cells(self):
+        """
+        把等待刷新的格子更新为Model中的最新数字，动画结束时由TileAnimator调用
+        :return:
+        """
+        grid = self.model.grid
+        set_value = self.board.set_value
+        for i, j in self.dirty_cells:
+            set_value(i, j, grid[i][j])
+        self.dirty_cells.clear()
+
     def block_not_movement(self):
         """
         设置标志位以禁止游戏区块的移动
@@ -157,16 +204,52 @@ class GameView(QWidget):
 
     def load_highest_score(self):
         """
-        View层加载最高分数并在界面上显示
+        View层加载最高分数并在界面上显示，文件在后台线程中读取，不阻塞界面
+        :return:
+        """
+        def read():
+            try:
+                score = self.model.read_highest_score()
+            except (OSError, ValueError, KeyError):
+                score = 0  # 文件损坏时保持当前的最高分数
+            self.highest_score_loaded.emit(score)
+
+        threading.Thread(target=read, name="HighestScoreLoader", daemon=True).start()
+
+    def on_highest_score_loaded(self, score):
+        """
+        在界面线程中合并后台读取到的最高分数
+        :param score: int 文件中的最高分数
         :return:
         """
-        self.model.load_highest_score()
+        self.model.merge_highest_score(score)
         self.highest_score_label.setText(f"最高分数: {self.model.highest_score}")
 
+    @property
+    def autoplayer(self):
+        """
+        AI提示和自动游戏，第一次使用时才创建
+        :return: AutoPlayer
+        """
+        if self._autoplayer is None:
+            from View.autoplay import AutoPlayer
+            self._autoplayer = AutoPlayer(self)
+            self._autoplayer.hint_ready.connect(self.on_hint_ready)
+            self._autoplayer.running_changed.connect(self.on_autoplay_changed)
+        return self._autoplayer
+
+    def stop_autoplay(self):
+        """
+        玩家接管时停止自动游戏，取消后台搜索
+        :return:
+        """
+        if self._autoplayer is not None:
+            self._autoplayer.stop()
+
     def showEvent(self, event) -> None:
         """
         窗口显示事件，当窗口被打开时执行
-        获取自适应后的长宽，设置为窗口的固定大小，并初始化游戏
+        获取自适应后的长宽，设置为窗口的固定大小，并初始化游戏，有未完成的对局时恢复该对局
         :param event:
         :return:
         """
@@ -177,7 +260,18 @@ class GameView(QWidget):
         # 设置固定大小
         self.setFixedSize(width, height)
 
-        self.new_game_button_clicked()
+        if self.game_started:
+            return
+        self.game_started = True
+        self.load_highest_score()
+        if self.journal.resume(self.model):
+            self.block_movement_flag = True
+            self.win_announced = self.model.check_win()  # 恢复的对局已经胜利过时不再弹出
+            self.history.push(self.model)  # 恢复的对局从当前局面开始记录历史
+            self.update_view()
+            self.setFocus()
+        else:
+            self.new_game_button_clicked()
 
     def event(self, event: QEvent):
         """
@@ -191,41 +285,192 @@ class GameView(QWidget):
 
     def keyPressEvent(self, event: QKeyEvent):
         """
-        键盘按下事件处理方法，根据按下的键调用相应的移动方法，并调用update_view方法更新界面
+        键盘按下事件处理方法，方向键放进输入队列，由InputQueue应用移动并按帧刷新界面
+        H键显示AI提示的方向，A键开始/停止AI自动游戏，+/-键调节自动游戏的速度，T键切换到下一个主题，
+        Ctrl+Z撤销，Ctrl+Y（或Ctrl+Shift+Z）重做；玩家按方向键、撤销或重做时自动游戏停止
         :param event:
         :return:
         """
-        if self.block_movement_flag:
-            if event.key() == Qt.Key_Up:
-                self.model.move_up()
-            elif event.key() == Qt.Key_Down:
-                self.model.move_down()
-            elif event.key() == Qt.Key_Left:
-                self.model.move_left()
-            elif event.key() == Qt.Key_Right:
-                self.model.move_right()
+        if event.modifiers() & Qt.ControlModifier:
+            self.stop_autoplay()
+            self.input_queue.drain()  # 先应用已经排队的移动，撤销的是最后一步
+            if event.key() == Qt.Key_Z and not event.modifiers() & Qt.ShiftModifier:
+                self.undo()
+            elif event.key() in (Qt.Key_Y, Qt.Key_Z):
+                self.redo()
+            return
+        if not self.block_movement_flag:
+            return
+        direction = self.KEY_DIRECTIONS.get(event.key())
+        if direction is not None:
+            self.stop_autoplay()
+            self.setWindowTitle("2048-GAME")  # 清除上一次的提示
+            self.input_queue.push(direction, event.isAutoRepeat())
+        elif event.key() == Qt.Key_H:
+            self.show_hint()
+        elif event.key() == Qt.Key_A:
+            self.toggle_autoplay()
+        elif event.key() in (Qt.Key_Plus, Qt.Key_Equal, Qt.Key_Minus) and self._autoplayer is not None:
+            if event.key() == Qt.Key_Minus:
+                self.autoplayer.slower()
+            else:
+                self.autoplayer.faster()
+            self.on_autoplay_changed(self.autoplayer.running)
+        elif event.key() == Qt.Key_T:
+            self.set_theme(next_theme(self.theme.name).name)
+            self.setWindowTitle(f"2048-GAME  主题: {self.theme.name}")
+
+    def apply_move(self, direction):
+        """
+        按方向移动一步并记录日志和撤销历史，不刷新界面
+        :param direction: str 移动方向
+        :return: MoveResult 移动的结果，无效移动时返回None
+        """
+        result = self.model.move(direction)
+        if not result.changed:
+            return None
+        self.journal.record(result, self.model)
+        self.history.push(self.model)
+        return result
+
+    def play_move(self, direction):
+        """
+        按方向移动一步并立即刷新界面，AI自动游戏使用
+        :param direction: str 移动方向
+        :return: bool 是否为有效移动
+        """
+        result = self.apply_move(direction)
+        # 无效移动不需要刷新界面
+        if result is None:
+            return False
+        self.update_view(result)
+        return True
+
+    def undo(self):
+        """
+        撤销一步，输掉之后撤销可以继续游戏
+        :return: bool 是否撤销成功
+        """
+        return self.travel(self.history.undo)
+
+    def redo(self):
+        """
+        重做一步
+        :return: bool 是否重做成功
+        """
+        return self.travel(self.history.redo)
+
+    def travel(self, step):
+        """
+        在历史记录中移动并刷新界面
+        :param step: GameHistory.undo或GameHistory.redo
+        :return: bool 是否移动成功
+        """
+        was_lost = self.model.check_lost()
+        if not step(self.model):
+            return False
+        self.input_queue.clear()
+        if was_lost:
+            # 输掉时日志已经删除，从当前局面重新开始记录；继续游戏后的成绩需要重新提交
+            self.journal.start(self.model)
+            self.score_submitted = False
+            self.block_movement_flag = True
+        else:
+            self.journal.snapshot(self.model)  # 恢复时从这个局面开始重放之后的移动
         self.update_view()
+        return True
+
+    def show_hint(self):
+        """
+        在后台搜索当前局面的最佳方向，结果到达后显示在窗口标题上，AI只支持4x4的网格
+        :return:
+        """
+        if self.model.grid_size != 4:
+            self.setWindowTitle("2048-GAME  提示只支持4x4")
+            return
+        self.setWindowTitle("2048-GAME  提示: 思考中……")
+        self.autoplayer.hint()
+
+    def on_hint_ready(self, direction):
+        """
+        显示AI提示的方向
+        :param direction: str 方向，没有可移动的方向时为None
+        :return:
+        """
+        names = {"left": "左", "right": "右", "up": "上", "down": "下"}
+        hint = names.get(direction, "无路可走")
+        self.setWindowTitle(f"2048-GAME  提示: {hint}")
+
+    def toggle_autoplay(self):
+        """
+        开始或停止AI自动游戏，AI只支持4x4的网格
+        :return:
+        """
+        if self.model.grid_size != 4:
+            self.setWindowTitle("2048-GAME  AI只支持4x4")
+            return
+        self.autoplayer.toggle()
+
+    def on_autoplay_changed(self, running):
+        """
+        在窗口标题上显示自动游戏的状态和速度
+        :param running: bool 是否正在自动游戏
+        :return:
+        """
+        if running:
+            interval = self.autoplayer.interval
+            speed = f"每步至少{interval}ms" if interval else "最快速度"
+            self.setWindowTitle(f"2048-GAME  AI自动游戏中（{speed}，A停止，+/-调速）")
+        else:
+            self.setWindowTitle("2048-GAME")
 
     def closeEvent(self, event):
         """
-        窗口关闭事件处理方法，如果当前分数不是最高分数，则保存最高分数
+        窗口关闭事件处理方法，如果当前分数不是最高分数，则保存最高分数，并保存未完成对局的进度
         :param event:
         :return:
         """
+        if self._autoplayer is not None:
+            self._autoplayer.shutdown()
         if self.model.highest_score >= self.model.score:
             self.model.save_highest_score()
+        # 保存未完成对局的快照，并等待后台线程写完
+        if not self.model.check_lost():
+            self.journal.snapshot(self.model)
+        self.journal.close()
+        # 提交本局成绩，最多等待1秒把排行榜客户端中剩余的成绩发送完
+        self.submit_score()
+        if self.leaderboard is not None:
+            self.leaderboard.close(timeout=1.0)
         event.accept()
 
+    def submit_score(self):
+        """
+        把本局成绩放进排行榜客户端的发送队列，不等待网络，每局只提交一次
+        :return:
+        """
+        if self.leaderboard is None or self.score_submitted or not self.model.score:
+            return
+        from Leaderboard.client import game_record
+        self.leaderboard.submit(game_record(self.model))
+        self.score_submitted = True
+
     def new_game_button_clicked(self):
         """
-        点击新游戏按钮事件处理方法，重置游戏数据，更新视图，将焦点设置在窗口上，并设置游戏焦点为第一个方块
+        点击新游戏按钮事件处理方法，重置游戏数据，更新视图，将焦点设置在窗口上
         :return:
         """
+        self.stop_autoplay()
+        self.input_queue.clear()
         self.block_movement_flag = True
+        self.win_announced = False
+        self.score_submitted = False
         self.model.reset()
+        self.journal.start(self.model)
+        self.history.clear()
+        self.history.push(self.model)
         self.update_view()
         self.setFocus()
-        self.setTabOrder(self, self.grid_layout.itemAt(0).widget())
 
     def quit_button_clicked(self):
         """
@@ -238,40 +483,15 @@ class GameView(QWidget):
             self.close()
 
     @staticmethod
-    def get_color(value):
+    def get_block_size(grid_size):
         """
-        定义一个字典，存储数字和对应颜色
-        :param value: int 方块上的数字
-        :return:
+        根据网格大小计算方块的边长，4x4及以下为100，更大的网格缩小方块使窗口不超过屏幕，最小为40
+        :param grid_size: int 网格大小
+        :return: int 方块边长（像素）
         """
-        colors = {
-            2: "#FFDAB9",  # 浅杏仁色
-            4: "#FFA07A",  # 海洋红色
-            8: "#FF7F50",  # 珊瑚橙色
-            16: "#FF6347",  # 番茄红色
-            32: "#FF4500",  # 橙红色
-            64: "#FF8C00",  # 暗橙色
-            128: "#FFFF00",  # 鲜黄色
-            256: "#FFD700",  # 金色
-            512: "#FFA500",  # 橙色
-            1024: "#FF8F00",  # 暗橙色
-            2048: "#FF4500"  # 橙红色
-        }
-        return colors.get(value, "#CDC1B4")  # 如果字典中存在该数字，则返回对应颜色，否则返回默认颜色
-
-    @staticmethod
-    def get_font_size(value):
-        """
-        根据数字大小返回不同字体大小
-        :param value: int 方块上的数字
-        :return: int 字体大小
-        """
-        if value < 100:
-            return 36
-        elif value < 1000:
-            return 32
-        else:
-            return 24
+        if grid_size <= 4:
+            return 100
+        return max(40, 440 // grid_size)
 
 
 # 代码测试
@@ -0,0 +1,345 @@
+"""
+bench_model.py
+==========
+
+Model热点路径的基准测试，不依赖第三方库，主要测量：
+
+- 四个方向的移动、add_random_number（添加后清空）、check_win、check_lost的每秒次数；
+- 随机走法下连续对局（包括添加数字和重新开始）的每秒移动数；
+- 每个Model实例占用的内存；
+- 命令行版本（Other/main_console.py）与Model.move_left的对比：console.4.move_left与model.4.move_left_vs_console
+  都是"载入局面、向左移动、有变化时添加随机数字"，可以直接比较；console.4.merge_single和console.4.zero_to_end
+  只是对四行调用核心函数，不包括添加数字，仅作为参考；
+- 对称规范化（Model/symmetry.py）每秒处理的局面数：位棋盘的canonical、canonical_board和二维列表的canonical_key。
+
+Model在多种网格大小下测试，BitboardModel只支持4x4。每一项测量重复多次取最好成绩，结果可以保存为基线，
+之后与基线比较，任何一项比基线慢超过阈值（默认20%）时以非0状态码退出，便于在CI中检查性能回退。
+
+用法：
+    python -m benchmarks.bench_model                    # 运行并与benchmarks/baseline.json比较
+    python -m benchmarks.bench_model --save-baseline    # 运行并保存为新的基线
+    python -m benchmarks.bench_model --quick --sizes 4  # 快速运行
+
+Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
+
+Date: 2023-4-5
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from Model.model import Model, DIRECTIONS
+from Model.bitboard import BitboardModel, encode_grid
+from Model import symmetry
+from Other import main_console
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def best_time(func, repeat):
+    """
+    重复测量取最短耗时
+    :param func: 被测函数
+    :param repeat: int 重复次数
+    :return: float 最短耗时（秒）
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def best_rate(func, count, repeat):
+    """
+    重复测量取最好成绩
+    :param func: 被测函数，每次调用完成count次操作
+    :param count: int 每次调用完成的操作数
+    :param repeat: int 重复次数
+    :return: float 每秒操作数
+    """
+    elapsed = best_time(func, repeat)
+    return count / elapsed if elapsed > 0 else float("inf")
+
+
+def sample_grids(model_cls, grid_size, count, seed):
+    """
+    用随机走法生成一批对局中途的局面，作为测量的输入
+    :return: list 网格列表
+    """
+    rng = random.Random(seed)
+    model = model_cls(seed, grid_size=grid_size, load_score=False)
+    grids = []
+    model.reset()
+    while len(grids) < count:
+        if model.check_lost():
+            model.reset()
+        model.move(rng.choice(DIRECTIONS))
+        grids.append([row[:] for row in model.grid])
+    return grids
+
+
+def make_model(model_cls, grid_size):
+    return model_cls(0, grid_size=grid_size, load_score=False)  # 基准测试不读取最高得分文件
+
+
+def bench_engine(name, model_cls, grid_size, count, repeat):
+    """
+    测量一种Model在某个网格大小下的各项指标
+    :return: dict 指标名 -> 每秒次数（内存为字节数）
+    """
+    results = {}
+    grids = sample_grids(model_cls, grid_size, count, seed=grid_size)
+    model = make_model(model_cls, grid_size)
+    model.reset()
+
+    # 每次测量前准备好独立的网格副本；载入网格（model.grid = ...）的耗时单独测量后扣除
+    copies = []
+
+    def prepare():
+        copies[:] = [[[row[:] for row in grid] for grid in grids] for _ in range(repeat)]
+
+    def run_load():
+        for grid in copies.pop():
+            model.grid = grid
+
+    def measure(operation):
+        def run():
+            for grid in copies.pop():
+                model.grid = grid
+                operation()
+
+        prepare()
+        elapsed = best_time(run, repeat)
+        prepare()
+        elapsed -= best_time(run_load, repeat)
+        return count / elapsed if elapsed > 0 else float("inf")
+
+    for direction in DIRECTIONS:
+        results[f"{name}.{grid_size}.move_{direction}"] = measure(getattr(model, "move_" + direction))
+
+    # 不修改局面（或者可以O(1)撤销）的操作直接在一组预先载入局面的Model上轮流调用，不需要扣除载入时间
+    pool = []
+    for grid in grids[:256]:
+        instance = make_model(model_cls, grid_size)
+        instance.grid = [row[:] for row in grid]
+        pool.append(instance)
+
+    def spawn_and_clear(instance):
+        def run():
+            position = instance.add_random_number()
+            if position is not None:
+                instance.place_number(position[0], position[1], 0)
+        return run
+
+    calls = {
+        "add_random_number": [spawn_and_clear(instance) for instance in pool],  # 添加数字后再清空，包括撤销的开销
+        "check_win": [instance.check_win for instance in pool],
+        "check_lost": [instance.check_lost for instance in pool],
+    }
+    for key, functions in calls.items():
+        functions = (functions * (count // len(functions) + 1))[:count]
+
+        def run_calls(functions=functions):
+            for function in functions:
+                function()
+
+        results[f"{name}.{grid_size}.{key}"] = best_rate(run_calls, count, repeat)
+
+    # 随机走法连续对局（输了就重新开始），大网格上随机走法几乎不会输，所以按总移动数计
+    game_model = make_model(model_cls, grid_size)
+    game_rng = random.Random(1)
+
+    def run_games():
+        game_model.reset()
+        for _ in range(count):
+            if not game_model.fast_move(game_rng.choice(DIRECTIONS)) and game_model.check_lost():
+                game_model.reset()
+
+    results[f"{name}.{grid_size}.full_game_moves"] = best_rate(run_games, count, repeat)
+
+    # 每个实例的内存
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = [make_model(model_cls, grid_size) for _ in range(200)]
+    for instance in instances:
+        instance.reset()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    results[f"{name}.{grid_size}.bytes_per_instance"] = size / len(instances)
+    return results
+
+
+def bench_console(count, repeat):
+    """
+    对比命令行版本与Model.move_left（均为4x4，按整盘计）
+    console.4.move_left与model.4.move_left_vs_console是相同的操作（载入局面、向左移动、有变化时添加随机数字）；
+    console.4.merge_single、console.4.zero_to_end只对四行调用核心函数，不比较局面也不添加数字
+    :return: dict 指标名 -> 每秒处理的棋盘数
+    """
+    results = {}
+    grids = sample_grids(Model, 4, count, seed=4)
+    main_console.rng.seed(0)
+
+    def run_merge():
+        for grid in copies.pop():
+            for row in grid:
+                main_console.merge_single(row)
+
+    copies = [[[row[:] for row in grid] for grid in grids] for _ in range(repeat)]
+    results["console.4.merge_single"] = best_rate(run_merge, count, repeat)
+
+    def run_zero():
+        for grid in copies.pop():
+            for row in grid:
+                main_console.zero_to_end(row)
+
+    copies = [[[row[:] for row in grid] for grid in grids] for _ in range(repeat)]
+    results["console.4.zero_to_end"] = best_rate(run_zero, count, repeat)
+
+    def run_console_move():
+        for before, after in copies.pop():
+            # 与main_console.main中的一步相同：记录操作前的矩阵，移动后有变化时添加随机数字
+            main_console.before_source = before
+            main_console.after_source = after
+            main_console.left()
+            main_console.compare_matrix()
+
+    copies = [[([row[:] for row in grid], [row[:] for row in grid]) for grid in grids] for _ in range(repeat)]
+    results["console.4.move_left"] = best_rate(run_console_move, count, repeat)
+
+    model = Model(0, load_score=False)
+    model.reset()
+
+    def run_model():
+        for grid in copies.pop():
+            model.grid = grid
+            model.move_left()
+
+    def run_load():
+        for grid in copies.pop():
+            model.grid = grid
+
+    # 命令行版本载入局面只是替换全局变量，Model载入时还要重建空闲列表和统计，与bench_engine一样扣除载入的耗时
+    copies = [[[row[:] for row in grid] for grid in grids] for _ in range(repeat)]
+    elapsed = best_time(run_model, repeat)
+    copies = [[[row[:] for row in grid] for grid in grids] for _ in range(repeat)]
+    elapsed -= best_time(run_load, repeat)
+    results["model.4.move_left_vs_console"] = count / elapsed if elapsed > 0 else float("inf")
+    return results
+
+
+def bench_symmetry(sizes, count, repeat):
+    """
+    测量对称规范化的速度，位棋盘只有4x4，二维列表按每个网格大小测量
+    :return: dict 指标名 -> 每秒规范化的局面数
+    """
+    results = {}
+    if 4 in sizes:
+        boards = [encode_grid(grid) for grid in sample_grids(BitboardModel, 4, count, seed=4)]
+
+        def run_canonical():
+            canonical = symmetry.canonical
+            for board in boards:
+                canonical(board)
+
+        def run_canonical_board():
+            canonical_board = symmetry.canonical_board
+            for board in boards:
+                canonical_board(board)
+
+        results["symmetry.4.canonical"] = best_rate(run_canonical, count, repeat)
+        results["symmetry.4.canonical_board"] = best_rate(run_canonical_board, count, repeat)
+    for size in sizes:
+        grids = sample_grids(Model, size, count, seed=size)
+
+        def run_canonical_key(grids=grids):
+            canonical_key = symmetry.canonical_key
+            for grid in grids:
+                canonical_key(grid)
+
+        results[f"symmetry.{size}.canonical_key"] = best_rate(run_canonical_key, count, repeat)
+    return results
+
+
+def run(sizes, count, repeat):
+    """
+    运行全部基准测试
+    :return: dict 指标名 -> 数值
+    """
+    results = {}
+    for size in sizes:
+        results.update(bench_engine("model", Model, size, count, repeat))
+    if 4 in sizes:
+        results.update(bench_engine("bitboard", BitboardModel, 4, count, repeat))
+        results.update(bench_console(count, repeat))
+    results.update(bench_symmetry(sizes, count, repeat))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线比较
+    :param results: dict 本次结果
+    :param baseline: dict 基线结果
+    :param threshold: float 允许的性能下降比例
+    :return: list 性能回退的指标（名称, 基线, 本次, 变化比例）
+    """
+    regressions = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if key.endswith("bytes_per_instance"):
+            change = value / base - 1  # 内存越少越好
+        else:
+            change = 1 - value / base  # 速度越快越好
+        if change > threshold:
+            regressions.append((key, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model热点路径基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 4, 5, 6, 8], help="测试的网格大小")
+    parser.add_argument("--count", type=int, default=20000, help="每项测量的操作数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最好成绩")
+    parser.add_argument("--quick", action="store_true", help="快速运行（操作数和重复次数减少）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的性能下降比例")
+    args = parser.parse_args()
+
+    count, repeat = (2000, 2) if args.quick else (args.count, args.repeat)
+    results = run(args.sizes, count, repeat)
+    for key, value in results.items():
+        unit = "B" if key.endswith("bytes_per_instance") else "/s"
+        print(f"{key:45s} {value:14.0f} {unit}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("没有找到基线文件，跳过比较")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for key, base, value, change in regressions:
+        print(f"性能回退: {key} 基线 {base:.0f} 本次 {value:.0f} ({change:+.0%})")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -4,19 +4,124 @@ main.py
 
 2048游戏入口
 
+启动过程分为几个阶段：解析参数、导入PyQt5和界面模块、创建QApplication、创建Model、创建GameView、显示窗口、
+第一帧绘制完成、后台读取最高分数。PyQt5和界面模块在解析完参数之后才导入，AI模块在第一次使用时才导入，
+最高分数在窗口显示之后才读取，加上--profile-startup参数可以输出每个阶段的耗时。
+加上--stats参数时记录移动、添加数字、胜负检查、界面刷新等阶段的耗时和计数，退出时以JSON格式写入指定的文件，
+其中还包括动画的帧时间和输入队列的计数（合并、丢弃的按键数）。
+
+命令行用法：python main.py [--size N] [--theme 主题名] [--repeat-rate 步数] [--leaderboard 主机:端口] [--stats 文件]
+                          [--profile-startup]，N为网格大小（2~16），默认为4
+
 Author: 顾初见（Ronan Gu） <ronangu@foxmail.com>
 
 Date: 2023-4-5
 """
+import time
+
+START_TIME = time.perf_counter()  # 尽早记录，作为启动计时的起点
+
+import argparse
 import sys
-from PyQt5.QtWidgets import QApplication
-from Model.model import Model
-from View.view import GameView
+from Model.model import Model, MIN_GRID_SIZE, MAX_GRID_SIZE
+
+
+class StartupProfiler:
+    """
+    记录启动过程中每个阶段的耗时
+    """
+
+    def __init__(self, enabled, start=None):
+        """
+        :param enabled: bool 是否记录，不记录时mark和report什么也不做
+        :param start: float 计时起点（time.perf_counter的值），默认为现在
+        """
+        self.enabled = enabled
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.phases = []  # (阶段名, 耗时)列表
+
+    def mark(self, phase):
+        """
+        结束一个阶段
+        :param phase: str 阶段名
+        :return:
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self.last))
+            self.last = now
+
+    def report(self, file=None):
+        """
+        输出每个阶段的耗时和总耗时
+        :param file: 输出的文件，默认为标准错误
+        :return:
+        """
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        for phase, elapsed in self.phases:
+            print(f"{phase:<16s} {elapsed * 1000:8.1f} ms", file=file)
+        print(f"{'总计':<16s} {(self.last - self.start) * 1000:8.1f} ms", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2048游戏")
+    parser.add_argument("--size", type=int, default=4, choices=range(MIN_GRID_SIZE, MAX_GRID_SIZE + 1),
+                        metavar="N", help=f"网格大小（{MIN_GRID_SIZE}~{MAX_GRID_SIZE}），默认为4")
+    parser.add_argument("--theme", default=None, help="界面主题（classic、original、dark、ocean），游戏中按T键切换")
+    parser.add_argument("--repeat-rate", type=int, default=15, metavar="N",
+                        help="按住方向键时每秒最多移动的步数，0表示不限制，默认为15")
+    parser.add_argument("--leaderboard", metavar="HOST:PORT", help="把成绩提交到排行榜服务（python -m Leaderboard.server）")
+    parser.add_argument("--stats", metavar="FILE", help="统计各阶段的耗时和计数，退出时写入该JSON文件")
+    parser.add_argument("--profile-startup", action="store_true", help="输出启动过程中每个阶段的耗时")
+    args, qt_args = parser.parse_known_args()
+    profiler = StartupProfiler(args.profile_startup, START_TIME)
+    profiler.mark("解析参数")
+
+    # 参数不正确或者只是查看帮助时不需要加载Qt
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    from View.view import GameView
+    profiler.mark("导入界面模块")
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    profiler.mark("创建QApplication")
+    model = Model(grid_size=args.size, load_score=False)  # 最高分数由GameView在窗口显示后读取
+    profiler.mark("创建Model")
+    leaderboard = None
+    if args.leaderboard:
+        from Leaderboard.client import LeaderboardClient, parse_address
+        leaderboard = LeaderboardClient(*parse_address(args.leaderboard))
+    view = GameView(model, leaderboard, args.theme, args.repeat_rate)
+    profiler.mark("创建GameView")
+
+    if args.profile_startup:
+        # 事件循环处理完第一批事件（包括第一次绘制）之后再计时
+        pending = {"first_frame", "highest_score"}
+
+        def finish(phase, key):
+            profiler.mark(phase)
+            pending.discard(key)
+            if not pending:
+                profiler.report()
+
+        QTimer.singleShot(0, lambda: finish("第一帧", "first_frame"))
+        view.highest_score_loaded.connect(lambda _: finish("读取最高分数", "highest_score"))
+    instrumentation = None
+    if args.stats:
+        from Model.instrumentation import Instrumentation, instrument_view
+        instrumentation = Instrumentation()
+        instrument_view(view, instrumentation)
+    view.show()
+    profiler.mark("显示窗口")
+    code = app.exec_()
+    if instrumentation is not None:
+        instrumentation.save(args.stats, {"animation": view.animator.stats(), "input": view.input_queue.stats()})
+    return code
+
 
 # 游戏入口
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    model = Model()
-    view = GameView(model)
-    view.show()
-    sys.exit(app.exec_())
+    sys.exit(main())